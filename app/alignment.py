@@ -0,0 +1,105 @@
+import logging
+from typing import Dict, List, Any, Optional, Union
+import numpy as np
+import torch
+import whisper
+from whisper.audio import SAMPLE_RATE, HOP_LENGTH, N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+from whisper.timing import add_word_timestamps
+from whisper.tokenizer import get_tokenizer
+
+from .cancellation import CancellationToken, check_cancelled
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _group_segments(segments: List[Dict[str, Any]], tokenizer) -> List[List[Dict[str, Any]]]:
+    """
+    按解码窗口 (seek) 对段落分组
+
+    Whisper 原生段落带有 seek 和 tokens，可以按窗口整体对齐；
+    其他来源 (如 WhisperX) 的段落没有 tokens，则单独成组，以段落起点作为窗口起点。
+    """
+    groups: List[List[Dict[str, Any]]] = []
+    current_seek = None
+    for segment in segments:
+        if not segment.get("text", "").strip():
+            continue
+        if "tokens" not in segment or "seek" not in segment:
+            segment["tokens"] = tokenizer.encode(" " + segment["text"].strip())
+            segment["seek"] = int(segment["start"] * SAMPLE_RATE / HOP_LENGTH)
+            groups.append([segment])
+            current_seek = None
+            continue
+        if segment["seek"] != current_seek:
+            groups.append([])
+            current_seek = segment["seek"]
+        groups[-1].append(segment)
+    return groups
+
+
+def align_words(
+    model: "whisper.Whisper",
+    audio: Union[str, np.ndarray],
+    segments: List[Dict[str, Any]],
+    language: Optional[str] = None,
+    cancel_token: Optional[CancellationToken] = None,
+) -> List[Dict[str, Any]]:
+    """
+    利用已加载 Whisper 模型的交叉注意力 (DTW) 为段落添加词级时间戳
+
+    与 whisperx.align 不同，这里不需要加载额外的 wav2vec2 对齐模型，
+    也不受对齐模型支持的语言限制。段落会被原地修改，添加 words 字段，
+    并根据词时间戳收紧段落的起止时间。
+
+    Args:
+        model: 已加载的 Whisper 模型
+        audio: 音频文件路径或 16kHz 单声道波形
+        segments: 转录段落列表
+        language: 音频语言代码
+        cancel_token: 取消令牌，在每个窗口对齐前检查
+
+    Returns:
+        带有词级时间戳的段落列表
+    """
+    if isinstance(audio, str):
+        audio = whisper.load_audio(audio)
+
+    tokenizer = get_tokenizer(
+        model.is_multilingual,
+        num_languages=model.num_languages,
+        language=language,
+        task="transcribe",
+    )
+    total_frames = len(audio) // HOP_LENGTH
+    dtype = torch.float16 if model.device.type == "cuda" else torch.float32
+    last_speech_timestamp = 0.0
+
+    for group in _group_segments(segments, tokenizer):
+        check_cancelled(cancel_token)
+        seek = group[0]["seek"]
+        num_frames = min(N_FRAMES, total_frames - seek)
+        if num_frames <= 0:
+            continue
+
+        # 只为当前窗口计算梅尔频谱，避免整段音频的频谱常驻内存
+        start_sample = seek * HOP_LENGTH
+        window = np.asarray(audio[start_sample:start_sample + N_SAMPLES], dtype=np.float32)
+        mel = log_mel_spectrogram(window, model.dims.n_mels, device=model.device)
+        mel = pad_or_trim(mel, N_FRAMES).to(dtype)
+
+        add_word_timestamps(
+            segments=group,
+            model=model,
+            tokenizer=tokenizer,
+            mel=mel,
+            num_frames=num_frames,
+            last_speech_timestamp=last_speech_timestamp,
+        )
+
+        word_ends = [word["end"] for segment in group for word in segment.get("words", [])]
+        if word_ends:
+            last_speech_timestamp = word_ends[-1]
+
+    return segments
@@ -0,0 +1,256 @@
+import os
+import logging
+import tempfile
+import weakref
+from contextlib import contextmanager
+from typing import Any, Optional
+import ffmpeg
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# PCM 临时文件的默认目录 (相对于工作目录，与转录索引的 data/ 相同)
+DEFAULT_SCRATCH_DIR = os.path.join("data", "scratch")
+
+
+def probe_channels(file_path: str) -> int:
+    """返回音频文件第一条音轨的声道数"""
+    probe = ffmpeg.probe(file_path)
+    streams = [stream for stream in probe.get("streams", []) if stream.get("codec_type") == "audio"]
+    if not streams:
+        raise ValueError(f"文件中没有音轨: {file_path}")
+    return int(streams[0].get("channels", 1))
+
+
+def probe_duration(file_path: str) -> float:
+    """返回音频文件的时长 (秒)，无法获取时返回 0"""
+    try:
+        probe = ffmpeg.probe(file_path)
+        return float(probe.get("format", {}).get("duration", 0.0))
+    except (ffmpeg.Error, ValueError) as e:
+        logger.warning(f"无法获取音频时长: {file_path}: {e}")
+        return 0.0
+
+
+def load_channels(file_path: str, sample_rate: int = SAMPLE_RATE, channels: Optional[int] = None) -> np.ndarray:
+    """
+    分别解码音频文件的每个声道，不做下混
+
+    Args:
+        file_path: 音频文件路径
+        sample_rate: 目标采样率
+        channels: 声道数，未提供时通过 ffprobe 获取
+
+    Returns:
+        形状为 (channels, samples) 的 float32 波形
+    """
+    if channels is None:
+        channels = probe_channels(file_path)
+
+    try:
+        out, _ = (
+            ffmpeg.input(file_path, threads=0)
+            .output("-", format="f32le", acodec="pcm_f32le", ac=channels, ar=sample_rate)
+            .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"音频解码失败: {e.stderr.decode(errors='ignore')}") from e
+
+    # 交错的采样数据 -> (channels, samples)，每个声道单独复制为连续数组
+    interleaved = np.frombuffer(out, np.float32).reshape(-1, channels)
+    return np.stack([np.ascontiguousarray(interleaved[:, c]) for c in range(channels)])
+
+
+def load_audio_head(file_path: str, seconds: float, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    只解码音频文件开头的一段，下混为单声道
+
+    Args:
+        file_path: 音频文件路径
+        seconds: 解码的时长 (秒)
+        sample_rate: 目标采样率
+
+    Returns:
+        float32 波形，文件较短时为整个文件
+    """
+    try:
+        out, _ = (
+            ffmpeg.input(file_path, threads=0, t=seconds)
+            .output("-", format="s16le", acodec="pcm_s16le", ac=1, ar=sample_rate)
+            .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        raise RuntimeError(f"音频解码失败: {e.stderr.decode(errors='ignore')}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def _remove_scratch(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"无法删除临时音频文件 {path}: {e}")
+
+
+def scratch_dir() -> str:
+    """
+    PCM 临时文件目录: PCM_SCRATCH_DIR，默认为 data/scratch
+
+    不使用系统临时目录: /tmp 常为 tmpfs，写入其中的采样仍占用内存
+    """
+    directory = os.getenv("PCM_SCRATCH_DIR") or DEFAULT_SCRATCH_DIR
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+class PcmScratch:
+    """
+    解码到临时文件的 16kHz 单声道 float32 PCM，以只读 np.memmap 访问
+
+    多小时的录音 (每小时约 230 MB) 不整体载入进程内存：ffmpeg 直接把采样写入磁盘上的文件，
+    转录、对齐和说话者识别只读取需要的切片，被访问的页面属于可回收的页缓存。
+    用作上下文管理器时产出映射的波形，退出时删除临时文件。
+    """
+
+    def __init__(self, file_path: str, directory: Optional[str] = None, sample_rate: int = SAMPLE_RATE):
+        """
+        解码音频文件
+
+        Args:
+            file_path: 音频文件路径
+            directory: 临时文件目录，默认为 scratch_dir()
+            sample_rate: 目标采样率
+        """
+        fd, self.path = tempfile.mkstemp(suffix=".f32", dir=directory or scratch_dir())
+        os.close(fd)
+        # 未调用 close 的实例 (如未开始迭代的流式响应) 被回收时也删除临时文件
+        self._finalizer = weakref.finalize(self, _remove_scratch, self.path)
+        try:
+            (
+                ffmpeg.input(file_path, threads=0)
+                .output(self.path, format="f32le", acodec="pcm_f32le", ac=1, ar=sample_rate)
+                .overwrite_output()
+                .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
+            )
+        except ffmpeg.Error as e:
+            self._finalizer()
+            raise RuntimeError(f"音频解码失败: {e.stderr.decode(errors='ignore')}") from e
+
+        # 空文件无法映射
+        if os.path.getsize(self.path):
+            self.audio: Optional[np.ndarray] = np.memmap(self.path, dtype=np.float32, mode="r")
+        else:
+            self.audio = np.zeros(0, dtype=np.float32)
+        logger.info(f"长音频已解码到临时文件: {len(self.audio) / sample_rate:.0f}s")
+
+    def close(self) -> None:
+        """释放映射并删除临时文件 (仍被引用的切片在释放前保持有效)"""
+        self.audio = None
+        self._finalizer()
+
+    def __enter__(self) -> np.ndarray:
+        return self.audio
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def is_long_audio(audio: Any, min_seconds: Optional[float], sample_rate: int = SAMPLE_RATE) -> bool:
+    """已解码的波形是否不短于 min_seconds (此时应逐窗口处理)，min_seconds 为空或 0 时总是 False"""
+    return not isinstance(audio, str) and bool(min_seconds) and len(audio) >= min_seconds * sample_rate
+
+
+@contextmanager
+def map_long_audio(audio: Any, min_seconds: Optional[float], directory: Optional[str] = None):
+    """
+    时长不少于 min_seconds 的音频文件解码到 PcmScratch (临时文件位于 directory) 并产出其映射，
+    其他输入 (较短的文件、已解码的波形) 原样产出；min_seconds 为空或 0 时不映射
+    """
+    if isinstance(audio, str) and min_seconds and probe_duration(audio) >= min_seconds:
+        with PcmScratch(audio, directory) as mapped:
+            yield mapped
+    else:
+        yield audio
+
+
+# 原始 PCM 输入格式 (16kHz 单声道，小端)
+PCM_FORMATS = {
+    "pcm_s16le": np.dtype("<i2"),
+    "pcm_f32le": np.dtype("<f4"),
+}
+
+# 可声明原始 PCM 的 Content-Type
+PCM_CONTENT_TYPES = {
+    "audio/pcm": "pcm_s16le",
+    "audio/x-pcm-s16le": "pcm_s16le",
+    "audio/x-pcm-f32le": "pcm_f32le",
+}
+
+
+def resolve_pcm_format(content_type: Optional[str] = None, audio_format: Optional[str] = None) -> Optional[str]:
+    """
+    根据显式声明的格式或 Content-Type 判断输入是否为原始 PCM
+
+    Content-Type 可带参数，如 "audio/pcm; rate=16000; channels=1"，
+    采样率和声道数必须为 16kHz 单声道。
+
+    Returns:
+        PCM 格式名称，不是原始 PCM 时返回 None
+    """
+    if audio_format:
+        if audio_format not in PCM_FORMATS:
+            raise ValueError(f"不支持的 PCM 格式: {audio_format}，支持: {', '.join(PCM_FORMATS)}")
+        return audio_format
+    if not content_type:
+        return None
+
+    mime, *params = [part.strip() for part in content_type.split(";")]
+    pcm_format = PCM_CONTENT_TYPES.get(mime.lower())
+    if pcm_format is None:
+        return None
+
+    options = dict(param.split("=", 1) for param in params if "=" in param)
+    if int(options.get("rate", SAMPLE_RATE)) != SAMPLE_RATE or int(options.get("channels", 1)) != 1:
+        raise ValueError(f"原始 PCM 必须为 {SAMPLE_RATE}Hz 单声道: {content_type}")
+    return pcm_format
+
+
+def pcm_to_array(data: bytes, pcm_format: str) -> np.ndarray:
+    """
+    将原始 PCM 字节包装为 Whisper 可直接使用的 float32 波形
+
+    float32 输入通过 np.frombuffer 零拷贝包装；int16 输入只做一次到 float32 的转换。
+    """
+    dtype = PCM_FORMATS[pcm_format]
+    if len(data) % dtype.itemsize:
+        raise ValueError(f"PCM 数据长度 {len(data)} 不是 {dtype.itemsize} 字节的整数倍")
+
+    samples = np.frombuffer(data, dtype=dtype)
+    if dtype.kind == "f":
+        return samples
+    audio = samples.astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
+
+
+def load_pcm_file(file_path: str, pcm_format: str) -> np.ndarray:
+    """
+    读取保存到磁盘的原始 PCM 文件
+
+    float32 文件以只读 np.memmap 映射，不载入内存；int16 文件转换为 float32 波形。
+    """
+    dtype = PCM_FORMATS[pcm_format]
+    size = os.path.getsize(file_path)
+    if size % dtype.itemsize:
+        raise ValueError(f"PCM 数据长度 {size} 不是 {dtype.itemsize} 字节的整数倍")
+    if size == 0:
+        return np.zeros(0, dtype=np.float32)
+    samples = np.memmap(file_path, dtype=dtype, mode="r")
+    if dtype.kind == "f":
+        return samples
+    audio = samples.astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
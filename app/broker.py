@@ -0,0 +1,321 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from .segments import dumps
+from .scheduler import PRIORITIES
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 任务文件名中的字段分隔符 (模型名称可能包含 "-" 和 ".")
+SEPARATOR = "__"
+
+
+class FileBroker:
+    """
+    基于共享目录的任务队列
+
+    API 前端与推理节点只需挂载同一个目录 (本机目录或 NFS 等共享存储):
+
+    - queue/: 待处理任务，文件名以优先级和提交时间开头，按名称排序即为领取顺序
+    - running/: 已被领取的任务，推理节点定期更新其修改时间作为心跳
+    - audio/: 任务的音频 (上传的文件或 .npy 波形)
+    - events/: 推理节点逐行追加的事件 (progress, window, result, error)
+    - cancel/: 前端写入的取消标记
+    - workers/: 推理节点的心跳 (加载的模型、并发数)
+
+    领取任务通过 os.rename 从 queue/ 移到 running/，同一任务只会被一个节点领取。
+    """
+
+    def __init__(self, root: str):
+        """
+        初始化任务队列
+
+        Args:
+            root: 共享目录
+        """
+        self.root = root
+        for name in ("queue", "running", "audio", "events", "cancel", "workers"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def _write_atomic(self, path: str, content: str) -> None:
+        """先写临时文件再改名，读取方不会看到写了一半的文件"""
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _task_name(spec: Dict[str, Any]) -> str:
+        rank = PRIORITIES.get(spec.get("priority", "interactive"), 1)
+        submitted = int(spec["submitted_at"] * 1e9)
+        return SEPARATOR.join([str(rank), f"{submitted:020d}", spec["model"], spec["id"]]) + ".json"
+
+    @staticmethod
+    def _parse_name(name: str) -> Optional[Tuple[str, str]]:
+        """任务文件名 -> (模型, 任务 ID)"""
+        parts = name[:-len(".json")].split(SEPARATOR) if name.endswith(".json") else []
+        if len(parts) != 4:
+            return None
+        return parts[2], parts[3]
+
+    def submit(
+        self,
+        kind: str,
+        model: str,
+        audio: Any,
+        options: Optional[Dict[str, Any]] = None,
+        priority: str = "interactive",
+        client_id: str = "anonymous",
+        cost: float = 1.0,
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        提交任务
+
+        Args:
+            kind: 任务类型 (transcribe, windows, detect_language, diarize)
+            model: 使用的模型
+            audio: 音频文件路径或 16kHz 单声道波形，复制到共享目录
+            options: 任务选项
+            priority: 优先级类别
+            client_id: 公平排队使用的客户端标识
+            cost: 估计开销 (音频秒数)
+            deadline: 截止时间 (Unix 时间戳)
+
+        Returns:
+            任务 ID
+        """
+        task_id = uuid.uuid4().hex
+        if isinstance(audio, str):
+            audio_name = task_id + os.path.splitext(audio)[1].lower()
+            shutil.copyfile(audio, self._path("audio", audio_name))
+        else:
+            audio_name = task_id + ".npy"
+            np.save(self._path("audio", audio_name), np.asarray(audio, dtype=np.float32))
+
+        spec = {
+            "id": task_id,
+            "kind": kind,
+            "model": model,
+            "audio": audio_name,
+            "options": options or {},
+            "priority": priority,
+            "client_id": client_id,
+            "cost": cost,
+            "deadline": deadline,
+            "submitted_at": time.time()
+        }
+        # 先创建事件文件，前端可立即开始等待
+        open(self._path("events", task_id + ".ndjson"), "a").close()
+        self._write_atomic(self._path("queue", self._task_name(spec)), dumps(spec))
+        return task_id
+
+    def claim(self, models: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        按优先级和提交时间领取一个指定模型的任务
+
+        Args:
+            models: 本节点加载的模型
+
+        Returns:
+            任务描述，没有可领取的任务时返回 None
+        """
+        for name in sorted(os.listdir(self._path("queue"))):
+            parsed = self._parse_name(name)
+            if parsed is None or parsed[0] not in models:
+                continue
+            running_path = self._path("running", name)
+            try:
+                os.rename(self._path("queue", name), running_path)
+            except FileNotFoundError:
+                # 已被其他节点领取或被前端撤回
+                continue
+            with open(running_path, encoding="utf-8") as f:
+                spec = json.load(f)
+            spec["running_name"] = name
+            return spec
+        return None
+
+    def audio_path(self, spec: Dict[str, Any]) -> str:
+        return self._path("audio", spec["audio"])
+
+    def load_audio(self, spec: Dict[str, Any]) -> Any:
+        """任务的音频: .npy 波形以只读 mmap 载入 (长音频不整体读入内存)，其他格式返回文件路径"""
+        path = self.audio_path(spec)
+        return np.load(path, mmap_mode="r") if path.endswith(".npy") else path
+
+    def heartbeat(self, spec: Dict[str, Any]) -> None:
+        """更新正在处理的任务的心跳"""
+        try:
+            os.utime(self._path("running", spec["running_name"]))
+        except FileNotFoundError:
+            pass
+
+    def emit(self, task_id: str, event: Dict[str, Any]) -> bool:
+        """
+        追加一个任务事件
+
+        Returns:
+            前端已不再等待 (事件文件已被清理) 时返回 False
+        """
+        try:
+            fd = os.open(self._path("events", task_id + ".ndjson"), os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(dumps(event) + "\n")
+        return True
+
+    def finish(self, spec: Dict[str, Any]) -> None:
+        """推理节点处理完任务 (结果或错误事件已写入)，移除任务和取消标记"""
+        for path in (self._path("running", spec["running_name"]), self._path("cancel", spec["id"])):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def read_events(self, task_id: str, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        读取偏移之后的完整事件行
+
+        Returns:
+            (事件列表, 新的偏移)
+        """
+        try:
+            with open(self._path("events", task_id + ".ndjson"), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines if line], offset + end
+
+    def cancel(self, task_id: str, reason: str = "任务已取消") -> None:
+        """
+        取消任务: 尚未被领取时直接撤回，否则写入取消标记，
+        推理节点在下一个解码窗口前停止
+        """
+        for name in os.listdir(self._path("queue")):
+            parsed = self._parse_name(name)
+            if parsed is not None and parsed[1] == task_id:
+                try:
+                    os.remove(self._path("queue", name))
+                    return
+                except FileNotFoundError:
+                    break
+        self._write_atomic(self._path("cancel", task_id), reason)
+
+    def cancel_reason(self, task_id: str) -> Optional[str]:
+        """任务的取消原因，未取消时返回 None"""
+        try:
+            with open(self._path("cancel", task_id), encoding="utf-8") as f:
+                return f.read() or "任务已取消"
+        except FileNotFoundError:
+            return None
+
+    def discard(self, task_id: str) -> None:
+        """
+        前端不再等待任务时清理其音频和事件
+
+        取消标记保留给仍在处理的推理节点，由其完成时移除
+        """
+        paths = [self._path("events", task_id + ".ndjson")]
+        paths.extend(
+            self._path("audio", name) for name in os.listdir(self._path("audio"))
+            if name.startswith(task_id)
+        )
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def fail_stale(self, lease_timeout: float) -> int:
+        """
+        心跳超时的任务 (推理节点已退出) 标记为失败
+
+        流式任务可能已经发送了部分窗口，重新排队会让客户端收到重复的段落，
+        因此不自动重试，由客户端决定是否重新提交
+
+        Returns:
+            标记的任务数
+        """
+        failed = 0
+        now = time.time()
+        running = set()
+        for name in os.listdir(self._path("running")):
+            path = self._path("running", name)
+            parsed = self._parse_name(name)
+            try:
+                if parsed is None:
+                    continue
+                if now - os.path.getmtime(path) < lease_timeout:
+                    running.add(parsed[1])
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            logger.warning(f"任务 {parsed[1]} 的推理节点已失联")
+            self.emit(parsed[1], {"type": "error", "error": "推理节点已失联"})
+            failed += 1
+
+        # 任务已结束后才写入的取消标记
+        for name in os.listdir(self._path("cancel")):
+            path = self._path("cancel", name)
+            try:
+                if name not in running and now - os.path.getmtime(path) >= lease_timeout:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        return failed
+
+    def register_worker(self, worker_id: str, info: Dict[str, Any]) -> None:
+        """写入推理节点的心跳"""
+        self._write_atomic(self._path("workers", worker_id + ".json"), dumps({**info, "updated_at": time.time()}))
+
+    def unregister_worker(self, worker_id: str) -> None:
+        try:
+            os.remove(self._path("workers", worker_id + ".json"))
+        except FileNotFoundError:
+            pass
+
+    def snapshot(self, worker_timeout: float = 30.0) -> Dict[str, Any]:
+        """队列深度和在线的推理节点"""
+        queued = {priority: 0 for priority in PRIORITIES}
+        ranks = {str(rank): priority for priority, rank in PRIORITIES.items()}
+        for name in os.listdir(self._path("queue")):
+            priority = ranks.get(name.split(SEPARATOR, 1)[0])
+            if priority is not None and name.endswith(".json"):
+                queued[priority] += 1
+
+        workers = {}
+        now = time.time()
+        for name in os.listdir(self._path("workers")):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(self._path("workers", name), encoding="utf-8") as f:
+                    info = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if now - info.get("updated_at", 0) <= worker_timeout:
+                workers[name[:-len(".json")]] = info
+
+        return {
+            "queued": queued,
+            "running": len(os.listdir(self._path("running"))),
+            "workers": workers
+        }
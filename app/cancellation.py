@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Optional
+
+
+class TranscriptionCancelled(Exception):
+    """转录任务被取消 (客户端断开或超过截止时间)"""
+
+    def __init__(self, reason: str = "任务已取消", timed_out: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.timed_out = timed_out
+
+
+class CancellationToken:
+    """
+    协作式取消令牌
+
+    由事件循环一侧 (客户端断开、请求结束) 或截止时间触发，推理线程在解码窗口之间
+    和说话者识别各阶段之间调用 check()，被取消时抛出 TranscriptionCancelled，
+    尽快归还模型副本。子令牌在父令牌被取消时一同取消。
+    """
+
+    def __init__(self, timeout: Optional[float] = None, parent: Optional["CancellationToken"] = None):
+        """
+        初始化取消令牌
+
+        Args:
+            timeout: 从现在起的超时时间 (秒)，None 表示不限时
+            parent: 父令牌
+        """
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.parent = parent
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "任务已取消") -> None:
+        """取消任务，重复调用时保留第一次的原因"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def timed_out(self) -> bool:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return True
+        return self.parent is not None and self.parent.timed_out
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set() or self.timed_out:
+            return True
+        return self.parent is not None and self.parent.cancelled
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间的剩余秒数，不限时返回 None"""
+        deadlines = [token.deadline for token in self._chain() if token.deadline is not None]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def check(self) -> None:
+        """已取消或超时时抛出 TranscriptionCancelled"""
+        if not self.cancelled:
+            return
+        if self.timed_out:
+            raise TranscriptionCancelled("转录超过截止时间", timed_out=True)
+        for token in self._chain():
+            if token.reason:
+                raise TranscriptionCancelled(token.reason)
+        raise TranscriptionCancelled()
+
+    def _chain(self):
+        token = self
+        while token is not None:
+            yield token
+            token = token.parent
+
+
+def check_cancelled(token: Optional[CancellationToken]) -> None:
+    """令牌存在时检查是否已取消"""
+    if token is not None:
+        token.check()
+
+
+async def run_cancellable(future: Awaitable[Any], cancel_token: Optional[CancellationToken]) -> Any:
+    """
+    等待执行器中的推理任务
+
+    等待方被取消 (如批量任务的客户端断开) 时同时取消令牌，
+    让工作线程在下一个窗口前停止，而不是运行到结束后丢弃结果
+    """
+    try:
+        return await future
+    except asyncio.CancelledError:
+        if cancel_token is not None:
+            cancel_token.cancel("等待结果的任务已取消")
+        raise
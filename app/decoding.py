@@ -0,0 +1,192 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Tuple
+
+from .metrics import Metrics, metrics as default_metrics
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DecodingProfile:
+    """
+    一组命名的解码参数
+
+    Whisper 对每个窗口先以 temperatures[0] 解码，压缩率过高或平均对数概率过低时
+    依次以后面的温度重新解码 (温度回退)。temperatures 的长度限制了每个窗口的回退次数，
+    fallback_ratio 限制了一次转录中允许回退的窗口比例，超出时沿用第一次解码的结果。
+    """
+    name: str
+    temperatures: Tuple[float, ...]
+    beam_size: Optional[int] = None
+    best_of: Optional[int] = None
+    condition_on_previous_text: bool = True
+    compression_ratio_threshold: Optional[float] = 2.4
+    logprob_threshold: Optional[float] = -1.0
+    no_speech_threshold: Optional[float] = 0.6
+    fallback_ratio: float = 0.0
+
+    def transcribe_options(self, temperature: float = 0.0) -> Dict[str, Any]:
+        """
+        model.transcribe 的解码参数
+
+        Args:
+            temperature: 客户端指定的起始温度，高于配置的起始温度时替换回退序列的开头
+        """
+        temperatures = self.temperatures
+        if temperature > temperatures[0]:
+            temperatures = (temperature,) + tuple(t for t in temperatures if t > temperature)
+        options: Dict[str, Any] = {
+            "temperature": temperatures,
+            "condition_on_previous_text": self.condition_on_previous_text,
+            "compression_ratio_threshold": self.compression_ratio_threshold,
+            "logprob_threshold": self.logprob_threshold,
+            "no_speech_threshold": self.no_speech_threshold,
+        }
+        if self.beam_size:
+            options["beam_size"] = self.beam_size
+        if self.best_of:
+            options["best_of"] = self.best_of
+        return options
+
+
+PROFILES: Dict[str, DecodingProfile] = {
+    profile.name: profile for profile in (
+        # 贪心解码，不回退，以前文为条件 (与 Whisper 以单一温度 0 解码相同)，默认配置
+        DecodingProfile(
+            "greedy",
+            temperatures=(0.0,)
+        ),
+        # 贪心解码，不回退，不以前文为条件 (避免重复输出蔓延)，适合实时和高吞吐
+        DecodingProfile(
+            "fast-greedy",
+            temperatures=(0.0,),
+            condition_on_previous_text=False
+        ),
+        # 贪心解码，最多回退两次，回退的窗口不超过四分之一
+        DecodingProfile(
+            "balanced",
+            temperatures=(0.0, 0.4, 0.8),
+            best_of=2,
+            fallback_ratio=0.25
+        ),
+        # 束搜索，完整的回退序列 (与 Whisper 命令行默认值相同)，每个窗口都可回退
+        DecodingProfile(
+            "accurate",
+            temperatures=(0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            beam_size=5,
+            best_of=5,
+            fallback_ratio=1.0
+        ),
+    )
+}
+
+# 回退会增加解码开销，因此默认不回退，balanced 和 accurate 需由请求或 DECODING_PROFILE_<端点> 选择
+DEFAULT_PROFILE = "greedy"
+
+
+def get_profile(name: Optional[str] = None, default: str = DEFAULT_PROFILE) -> DecodingProfile:
+    """
+    按名称获取解码配置
+
+    Raises:
+        ValueError: 不支持的配置名称
+    """
+    profile = PROFILES.get(name or default)
+    if profile is None:
+        raise ValueError(f"不支持的解码配置: {name}，支持: {', '.join(PROFILES)}")
+    return profile
+
+
+class DecodeStats:
+    """
+    一次转录的解码统计
+
+    由模型池的 decode 检查点记录: 同一个窗口的 mel 再次被解码即为温度回退。
+    已回退的窗口数达到 fallback_ratio 时，后续窗口的回退直接返回其第一次解码的结果，
+    不再运行模型 (记为 capped_windows)，单个请求的解码开销因此有上限。
+    """
+
+    def __init__(self, profile: str = DEFAULT_PROFILE, fallback_ratio: float = 1.0):
+        self.profile = profile
+        self.fallback_ratio = fallback_ratio
+        self.windows = 0
+        self.fallback_windows = 0
+        self.fallback_decodes = 0
+        self.capped_windows = 0
+        self._mel: Any = None
+        self._result: Any = None
+        # 当前窗口的回退状态: None (未回退), "fallback" (已回退), "capped" (超出限制，不再解码)
+        self._state: Optional[str] = None
+
+    @classmethod
+    def for_profile(cls, profile: DecodingProfile) -> "DecodeStats":
+        return cls(profile.name, profile.fallback_ratio)
+
+    def before_decode(self, mel: Any) -> Any:
+        """
+        解码前调用
+
+        Returns:
+            超出回退限制时为应直接返回的上一次解码结果，否则为 None
+        """
+        if mel is not self._mel:
+            self._mel = mel
+            self._result = None
+            self._state = None
+            self.windows += 1
+            return None
+
+        if self._state is None:
+            if self.fallback_windows - self.capped_windows < self.fallback_ratio * self.windows:
+                self._state = "fallback"
+            else:
+                self._state = "capped"
+                self.capped_windows += 1
+            self.fallback_windows += 1
+        if self._state == "capped":
+            return self._result
+        self.fallback_decodes += 1
+        return None
+
+    def after_decode(self, result: Any) -> None:
+        self._result = result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "profile": self.profile,
+            "windows": self.windows,
+            "fallback_windows": self.fallback_windows,
+            "fallback_decodes": self.fallback_decodes,
+            "capped_windows": self.capped_windows
+        }
+
+    def record(self, model: str, metrics: Optional[Metrics] = None) -> None:
+        """把统计累加到服务指标"""
+        record_stats(self.to_dict(), model, metrics)
+
+
+def record_stats(stats: Optional[Dict[str, Any]], model: str, metrics: Optional[Metrics] = None) -> None:
+    """把解码统计 (DecodeStats.to_dict 的结果，如推理节点返回的) 累加到服务指标"""
+    if not stats:
+        return
+    metrics = metrics or default_metrics
+    labels = {"model": model, "profile": stats["profile"]}
+    metrics.inc("decode_windows_total", stats["windows"], **labels)
+    metrics.inc("decode_fallback_windows_total", stats["fallback_windows"], **labels)
+    metrics.inc("decode_fallback_decodes_total", stats["fallback_decodes"], **labels)
+    metrics.inc("decode_capped_windows_total", stats["capped_windows"], **labels)
+
+
+def merge_stats(stats: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """合并多次转录 (如多声道录音的各声道) 的解码统计"""
+    stats = [item for item in stats if item]
+    if not stats:
+        return None
+    merged = dict(stats[0])
+    for item in stats[1:]:
+        for key in ("windows", "fallback_windows", "fallback_decodes", "capped_windows"):
+            merged[key] += item[key]
+    return merged
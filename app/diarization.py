@@ -2,10 +2,21 @@ import os
 import tempfile
 import logging
 import asyncio
-from typing import Dict, List, Any, Optional, Tuple, BinaryIO
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple, BinaryIO, Union
+import numpy as np
 import torch
+import whisper
 import whisperx
 
+from .alignment import align_words
+from .audio import is_long_audio, map_long_audio
+from .cancellation import CancellationToken, TranscriptionCancelled, check_cancelled, run_cancellable
+from .decoding import DecodeStats, get_profile
+from .local_diarization import LocalDiarizer
+from .speaker_assignment import assign_word_speakers, assign_by_overlap, normalize_turns
+from .transcriber import ModelPool
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -13,13 +24,38 @@ logger = logging.getLogger(__name__)
 class SpeakerDiarization:
     """使用WhisperX进行说话者识别的类"""
     
-    def __init__(self, auth_token: Optional[str] = None):
+    def __init__(
+        self,
+        auth_token: Optional[str] = None,
+        align_method: str = "whisper",
+        whisper_model: Optional[Any] = None,
+        diarization_engine: str = "pyannote",
+        model_pool: Optional[Any] = None,
+        long_audio_seconds: Optional[float] = 600.0
+    ):
         """
         初始化说话者识别
         
         Args:
             auth_token: 不再需要，保留参数是为了兼容性
+            align_method: 词级对齐方式 (whisper: 交叉注意力 DTW, whisperx: wav2vec2 对齐模型)
+            whisper_model: 已加载的 Whisper 模型，未提供 model_pool 时包装为单副本模型池使用
+            diarization_engine: 说话者识别引擎 (pyannote: 失败时回退到本地引擎, local: 仅使用本地引擎)
+            model_pool: 转录器的模型副本池，提供时优先于 whisper_model 使用
+            long_audio_seconds: 不短于此时长 (秒) 的音频文件解码到 mmap 临时文件，
+                由模型池逐窗口转录，对齐和说话者识别读取其切片；None 或 0 表示不启用
         """
+        if align_method not in ("whisper", "whisperx"):
+            raise ValueError(f"不支持的对齐方式: {align_method}")
+        if diarization_engine not in ("pyannote", "local"):
+            raise ValueError(f"不支持的说话者识别引擎: {diarization_engine}")
+        self.align_method = align_method
+        self.whisper_model = whisper_model
+        self.model_pool = model_pool
+        self.long_audio_seconds = long_audio_seconds
+        self.diarization_engine = diarization_engine
+        self.local_diarizer: Optional[LocalDiarizer] = None
+
         # 强制使用 CPU 以避免 CUDA 问题
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"说话者识别使用设备: {self.device}")
@@ -33,14 +69,132 @@ class SpeakerDiarization:
         # WhisperX 不需要预先加载模型，它会在运行时按需加载
         logger.info("WhisperX 说话者识别初始化完成")
         self.pipeline = True  # 设置为 True 表示可用
+
+    def _get_model_pool(self) -> ModelPool:
+        """获取模型池，未提供时把 whisper_model (按需加载) 包装为单副本模型池"""
+        if self.model_pool is None:
+            if self.whisper_model is None:
+                logger.info("加载 Whisper 模型用于说话者识别: small")
+                self.whisper_model = whisper.load_model("small", device="cpu")
+            self.model_pool = ModelPool([self.whisper_model], name="diarization")
+        return self.model_pool
+
+    @contextmanager
+    def _whisper_model(self, cancel_token: Optional[CancellationToken] = None, stats: Optional[DecodeStats] = None):
+        """从模型池借出 Whisper 模型"""
+        with self._get_model_pool().acquire(cancel_token, stats) as model:
+            yield model
+
+    def _transcribe(
+        self,
+        audio: Union[str, np.ndarray],
+        cancel_token: Optional[CancellationToken] = None,
+        stats: Optional[DecodeStats] = None,
+        **options
+    ) -> Dict:
+        """转录音频，长波形由模型池逐窗口转录 (不为整段音频计算梅尔频谱)"""
+        if is_long_audio(audio, self.long_audio_seconds):
+            pool = self._get_model_pool()
+            options["fp16"] = pool.models[0].device.type == "cuda"
+            return pool.transcribe_windowed(audio, options, cancel_token, stats)
+        with self._whisper_model(cancel_token, stats) as model:
+            return model.transcribe(audio, fp16=model.device.type == "cuda", **options)
+
+    def _get_local_diarizer(self) -> LocalDiarizer:
+        """获取本地说话者识别引擎，首次使用时创建"""
+        if self.local_diarizer is None:
+            self.local_diarizer = LocalDiarizer(device="cpu")
+        return self.local_diarizer
+
+    def _assign_speakers(
+        self,
+        audio_path: Union[str, np.ndarray],
+        result: Dict,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict:
+        """运行说话者识别并将说话者标签分配给转录段落"""
+        check_cancelled(cancel_token)
+        if self.diarization_engine == "pyannote":
+            try:
+                diarize_device = "cpu"  # 强制使用 CPU 进行说话者识别
+                diarize_model = whisperx.DiarizationPipeline(use_auth_token=None, device=diarize_device)
+                diarize_segments = diarize_model(audio_path)
+                check_cancelled(cancel_token)
+                return assign_word_speakers(diarize_segments, result)
+            except TranscriptionCancelled:
+                raise
+            except Exception as e:
+                logger.warning(f"pyannote 说话者识别失败: {str(e)}，使用本地说话者识别...")
+
+        return self._assign_local_speakers(audio_path, result, cancel_token)
+
+    def _assign_local_speakers(
+        self,
+        audio_path: Union[str, np.ndarray],
+        result: Dict,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict:
+        """使用本地引擎进行说话者识别，仍失败时将说话者标记为 UNKNOWN"""
+        check_cancelled(cancel_token)
+        try:
+            with map_long_audio(audio_path, self.long_audio_seconds) as audio:
+                turns = self._get_local_diarizer()(audio)
+            check_cancelled(cancel_token)
+            result = assign_word_speakers(turns, result)
+        except TranscriptionCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"本地说话者识别失败: {str(e)}")
+
+        for segment in result.get("segments", []):
+            segment.setdefault("speaker", "UNKNOWN")
+        return result
+
+    def _align(
+        self,
+        result: Dict,
+        audio_path: Union[str, np.ndarray],
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict:
+        """为转录段落添加词级时间戳"""
+        check_cancelled(cancel_token)
+        if self.align_method == "whisper":
+            logger.info("正在通过交叉注意力计算词级时间戳...")
+            with self._whisper_model(cancel_token) as model:
+                align_words(
+                    model,
+                    audio_path,
+                    result["segments"],
+                    language=result.get("language"),
+                    cancel_token=cancel_token
+                )
+            return result
+
+        logger.info("正在进行音素对齐...")
+        align_device = "cpu"  # 强制使用 CPU 进行对齐
+        model_a, metadata = whisperx.load_align_model(language_code=result.get("language", "en"), device=align_device)
+        aligned = whisperx.align(result["segments"], model_a, metadata, audio_path, align_device)
+        aligned.setdefault("language", result.get("language", "en"))
+        return aligned
             
-    async def diarize(self, audio_path: str, transcription: Optional[Dict] = None) -> Dict:
+    async def diarize(
+        self,
+        audio_path: Union[str, np.ndarray],
+        transcription: Optional[Dict] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        language: Optional[str] = None,
+        profile: Optional[str] = None
+    ) -> Dict:
         """
         对音频文件进行说话者识别
         
         Args:
-            audio_path: 音频文件路径
+            audio_path: 音频文件路径或 16kHz 单声道波形
             transcription: 可选的 Whisper 转录结果
+            cancel_token: 取消令牌，在转录窗口之间和各处理阶段之间检查；
+                取消时抛出 TranscriptionCancelled，不回退到其他方式
+            language: 音频语言代码，未提供时由模型检测
+            profile: 转录使用的解码配置名称
             
         Returns:
             带有说话者标签的转录结果
@@ -56,47 +210,59 @@ class SpeakerDiarization:
             if transcription is None:
                 logger.info("使用 WhisperX 进行转录和说话者识别")
                 try:
-                    result = await loop.run_in_executor(
-                        None,
-                        lambda: self._run_whisperx(audio_path)
+                    result = await run_cancellable(
+                        loop.run_in_executor(None, lambda: self._run_whisperx(audio_path, cancel_token, language, profile)),
+                        cancel_token
                     )
                     return result
+                except TranscriptionCancelled:
+                    raise
                 except Exception as e:
                     logger.error(f"WhisperX 转录失败: {str(e)}")
                     # 如果 WhisperX 转录失败，使用普通 Whisper 转录
                     logger.info("回退到普通 Whisper 转录...")
-                    from .transcriber import WhisperTranscriber
-                    transcriber = WhisperTranscriber(model_name="small", device="cpu")
-                    transcription = await transcriber.transcribe_file(audio_path)
-                    
-                    # 为每个段落分配默认说话者
-                    for i, segment in enumerate(transcription.get("segments", [])):
-                        segment["speaker"] = f"SPEAKER_{i % 2 + 1}"
-                    
-                    return transcription
+                    # 复用共享的 Whisper 模型，再使用本地引擎分配说话者
+                    return await run_cancellable(
+                        loop.run_in_executor(
+                            None,
+                            lambda: self._transcribe_local(audio_path, cancel_token, language, profile)
+                        ),
+                        cancel_token
+                    )
             else:
                 # 如果提供了转录结果，只进行说话者识别
                 logger.info("使用现有转录结果进行说话者识别")
                 try:
-                    result = await loop.run_in_executor(
-                        None,
-                        lambda: self._run_diarization_only(audio_path, transcription)
+                    result = await run_cancellable(
+                        loop.run_in_executor(
+                            None,
+                            lambda: self._run_diarization_only(audio_path, transcription, cancel_token)
+                        ),
+                        cancel_token
                     )
                     return result
+                except TranscriptionCancelled:
+                    raise
                 except Exception as e:
                     logger.error(f"说话者识别失败: {str(e)}")
-                    # 如果说话者识别失败，为每个段落分配默认说话者
-                    for i, segment in enumerate(transcription.get("segments", [])):
-                        segment["speaker"] = f"SPEAKER_{i % 2 + 1}"
-                    
-                    return transcription
+                    # 如果说话者识别失败，使用本地引擎分配说话者
+                    return await run_cancellable(
+                        loop.run_in_executor(
+                            None,
+                            lambda: self._assign_local_speakers(audio_path, transcription, cancel_token)
+                        ),
+                        cancel_token
+                    )
+        except TranscriptionCancelled as e:
+            logger.info(f"说话者识别已取消: {e.reason}")
+            raise
         except Exception as e:
             logger.error(f"说话者识别过程中出错: {str(e)}")
             # 返回原始转录结果或创建一个简单的结果
             if transcription:
-                # 为每个段落分配默认说话者
-                for i, segment in enumerate(transcription.get("segments", [])):
-                    segment["speaker"] = f"SPEAKER_{i % 2 + 1}"
+                # 说话者未知
+                for segment in transcription.get("segments", []):
+                    segment.setdefault("speaker", "UNKNOWN")
                 
                 return transcription
             else:
@@ -107,108 +273,130 @@ class SpeakerDiarization:
                     "language": "en"
                 }
     
-    def _run_whisperx(self, audio_path: str) -> Dict:
-        """使用 WhisperX 进行转录和说话者识别"""
+    def _run_whisperx(
+        self,
+        audio_path: Union[str, np.ndarray],
+        cancel_token: Optional[CancellationToken] = None,
+        language: Optional[str] = None,
+        profile: Optional[str] = None
+    ) -> Dict:
+        """使用 WhisperX 进行转录和说话者识别，长音频文件先解码到 mmap 临时文件"""
+        with map_long_audio(audio_path, self.long_audio_seconds) as audio:
+            return self._transcribe_and_assign(audio, cancel_token, language, profile)
+
+    def _transcribe_local(
+        self,
+        audio_path: Union[str, np.ndarray],
+        cancel_token: Optional[CancellationToken] = None,
+        language: Optional[str] = None,
+        profile: Optional[str] = None
+    ) -> Dict:
+        """使用共享的 Whisper 模型转录，再由本地引擎分配说话者"""
+        with map_long_audio(audio_path, self.long_audio_seconds) as audio:
+            decoding = get_profile(profile)
+            stats = DecodeStats.for_profile(decoding)
+            result = self._transcribe(audio, cancel_token, stats, language=language, **decoding.transcribe_options())
+            stats.record(self._get_model_pool().name)
+            result["decoding"] = stats.to_dict()
+            return self._assign_local_speakers(audio, result, cancel_token)
+
+    def _transcribe_and_assign(
+        self,
+        audio_path: Union[str, np.ndarray],
+        cancel_token: Optional[CancellationToken] = None,
+        language: Optional[str] = None,
+        profile: Optional[str] = None
+    ) -> Dict:
+        """转录、对齐并分配说话者"""
         try:
-            # 1. 转录
-            logger.info("正在使用 WhisperX 进行转录...")
-            try:
-                # 尝试使用 silero VAD
-                model = whisperx.load_model("small", "cpu", vad_method="silero")
-            except Exception as e:
-                logger.warning(f"使用 silero VAD 失败: {str(e)}，尝试不使用 VAD...")
-                # 如果 silero VAD 失败，尝试不使用 VAD
-                import whisper
-                whisper_model = whisper.load_model("small", device="cpu")
-                # 直接使用 whisper 进行转录
-                result = whisper_model.transcribe(audio_path)
-                # 转换为 WhisperX 格式
-                return {
-                    "segments": result.get("segments", []),
-                    "language": result.get("language", "en")
-                }
-            
-            result = model.transcribe(audio_path)
-            
-            # 2. 对齐
-            logger.info("正在进行音素对齐...")
-            try:
-                align_device = "cpu"
-                model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=align_device)
-                result = whisperx.align(result["segments"], model_a, metadata, audio_path, align_device)
-            except Exception as e:
-                logger.warning(f"音素对齐失败: {str(e)}，跳过对齐步骤...")
-                # 如果对齐失败，跳过对齐步骤
-            
-            # 3. 说话者识别
-            logger.info("正在进行说话者识别...")
-            try:
-                diarize_device = "cpu"
-                diarize_model = whisperx.DiarizationPipeline(use_auth_token=None, device=diarize_device)
-                diarize_segments = diarize_model(audio_path)
+            if self.align_method == "whisper":
+                # 1+2. 转录时直接由交叉注意力得到词级时间戳，无需加载对齐模型
+                logger.info("正在使用 Whisper 进行转录 (词级时间戳)...")
+                decoding = get_profile(profile)
+                stats = DecodeStats.for_profile(decoding)
+                result = self._transcribe(
+                    audio_path,
+                    cancel_token,
+                    stats,
+                    language=language,
+                    word_timestamps=True,
+                    **decoding.transcribe_options()
+                )
+                stats.record(self._get_model_pool().name)
+                result["decoding"] = stats.to_dict()
+            else:
+                # 1. 转录
+                logger.info("正在使用 WhisperX 进行转录...")
+                try:
+                    # 尝试使用 silero VAD
+                    model = whisperx.load_model("small", "cpu", vad_method="silero")
+                except Exception as e:
+                    logger.warning(f"使用 silero VAD 失败: {str(e)}，尝试不使用 VAD...")
+                    # 如果 silero VAD 失败，尝试不使用 VAD
+                    # 直接使用 whisper 进行转录
+                    result = self._transcribe(audio_path, cancel_token)
+                    # 转换为 WhisperX 格式
+                    return self._assign_speakers(audio_path, {
+                        "segments": result.get("segments", []),
+                        "language": result.get("language", "en")
+                    }, cancel_token)
                 
-                # 4. 将说话者标签分配给转录段落
-                result = whisperx.assign_word_speakers(diarize_segments, result)
-            except Exception as e:
-                logger.warning(f"使用说话者识别失败: {str(e)}，使用备用方法...")
-                # 如果说话者识别失败，使用简单的段落分割作为备用
-                for i, segment in enumerate(result["segments"]):
-                    speaker_id = f"SPEAKER_{i % 2 + 1}"
-                    segment["speaker"] = speaker_id
-                    for word in segment.get("words", []):
-                        if word:  # 确保 word 不是 None
-                            word["speaker"] = speaker_id
+                result = model.transcribe(audio_path)
+                
+                # 2. 对齐
+                try:
+                    result = self._align(result, audio_path, cancel_token)
+                except TranscriptionCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"音素对齐失败: {str(e)}，跳过对齐步骤...")
+                    # 如果对齐失败，跳过对齐步骤
             
-            return result
+            # 3. 说话者识别，并将说话者标签分配给转录段落
+            logger.info("正在进行说话者识别...")
+            return self._assign_speakers(audio_path, result, cancel_token)
+        except TranscriptionCancelled:
+            raise
         except Exception as e:
             logger.error(f"WhisperX 处理过程中出错: {str(e)}")
             # 使用 whisper 作为备用
             logger.info("使用普通 Whisper 作为备用...")
-            import whisper
-            whisper_model = whisper.load_model("small", device="cpu")
-            result = whisper_model.transcribe(audio_path)
+            result = self._transcribe(audio_path, cancel_token)
             
-            # 为每个段落分配默认说话者
-            for i, segment in enumerate(result.get("segments", [])):
-                segment["speaker"] = f"SPEAKER_{i % 2 + 1}"
-            
-            return result
+            return self._assign_local_speakers(audio_path, result, cancel_token)
     
-    def _run_diarization_only(self, audio_path: str, transcription: Dict) -> Dict:
+    def _run_diarization_only(
+        self,
+        audio_path: Union[str, np.ndarray],
+        transcription: Dict,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict:
         """仅进行说话者识别，使用现有的转录结果"""
+        with map_long_audio(audio_path, self.long_audio_seconds) as audio:
+            return self._assign_existing(audio, transcription, cancel_token)
+
+    def _assign_existing(
+        self,
+        audio_path: Union[str, np.ndarray],
+        transcription: Dict,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Dict:
+        """对齐现有转录结果并分配说话者"""
         try:
             # 将 Whisper 转录结果转换为 WhisperX 格式
             whisperx_format = self._convert_to_whisperx_format(transcription)
             
-            # 加载对齐模型 - 使用 CPU
-            language = transcription.get("language", "en")
-            align_device = "cpu"  # 强制使用 CPU 进行对齐
-            model_a, metadata = whisperx.load_align_model(language_code=language, device=align_device)
-            
-            # 对齐
-            logger.info("正在进行音素对齐...")
-            aligned_result = whisperx.align(whisperx_format["segments"], model_a, metadata, audio_path, align_device)
+            # 对齐 (已带词级时间戳的段落无需再次对齐)
+            if all("words" in segment for segment in whisperx_format["segments"]):
+                aligned_result = whisperx_format
+            else:
+                aligned_result = self._align(whisperx_format, audio_path, cancel_token)
             
-            # 说话者识别 - 使用 CPU
+            # 说话者识别
             logger.info("正在进行说话者识别...")
-            try:
-                diarize_device = "cpu"  # 强制使用 CPU 进行说话者识别
-                diarize_model = whisperx.DiarizationPipeline(use_auth_token=None, device=diarize_device)
-                diarize_segments = diarize_model(audio_path)
-                
-                # 将说话者标签分配给转录段落
-                result = whisperx.assign_word_speakers(diarize_segments, aligned_result)
-            except Exception as e:
-                logger.warning(f"使用说话者识别失败: {str(e)}，尝试备用方法...")
-                # 如果说话者识别失败，使用简单的段落分割作为备用
-                for i, segment in enumerate(aligned_result["segments"]):
-                    speaker_id = f"SPEAKER_{i % 2 + 1}"  # 简单地交替分配说话者
-                    segment["speaker"] = speaker_id
-                    for word in segment.get("words", []):
-                        word["speaker"] = speaker_id
-                result = aligned_result
-            
-            return result
+            return self._assign_speakers(audio_path, aligned_result, cancel_token)
+        except TranscriptionCancelled:
+            raise
         except Exception as e:
             logger.error(f"说话者识别过程中出错: {str(e)}")
             raise
@@ -251,7 +439,8 @@ class SpeakerDiarization:
             except Exception as e:
                 logger.error(f"清理临时文件时出错: {str(e)}")
     
-    def merge_with_transcription(self, diarization_result: Dict, transcription: Dict) -> List[Dict]:
+    @staticmethod
+    def merge_with_transcription(diarization_result: Dict, transcription: Dict) -> List[Dict]:
         """
         将 WhisperX 的说话者识别结果与转录结果合并
         
@@ -262,20 +451,40 @@ class SpeakerDiarization:
         Returns:
             合并后的段落列表
         """
-        # WhisperX 已经合并了转录和说话者识别结果，直接返回其段落
-        segments = []
+        diarized_segments = diarization_result.get("segments", [])
+        segments = [
+            {
+                "start": segment.get("start", 0),
+                "end": segment.get("end", 0),
+                "text": segment.get("text", "")
+            }
+            for segment in transcription.get("segments", [])
+        ] if transcription else []
         
-        for segment in diarization_result.get("segments", []):
-            speaker = segment.get("speaker", "UNKNOWN")
-            start = segment.get("start", 0)
-            end = segment.get("end", 0)
-            text = segment.get("text", "")
-            
-            segments.append({
-                "speaker": speaker,
-                "start": start,
-                "end": end,
-                "text": text
-            })
-            
-        return segments
\ No newline at end of file
+        if segments:
+            # 以说话者识别结果的段落作为轮次，扫描线按最大重叠分配说话者
+            turns = normalize_turns(
+                segment for segment in diarized_segments if "speaker" in segment
+            )
+            assign_by_overlap(segments, turns)
+        else:
+            # WhisperX 已经合并了转录和说话者识别结果，直接返回其段落
+            segments = [
+                {
+                    "start": segment.get("start", 0),
+                    "end": segment.get("end", 0),
+                    "text": segment.get("text", ""),
+                    "speaker": segment.get("speaker", "UNKNOWN")
+                }
+                for segment in diarized_segments
+            ]
+        
+        return [
+            {
+                "speaker": segment.get("speaker", "UNKNOWN"),
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": segment["text"]
+            }
+            for segment in segments
+        ]
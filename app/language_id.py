@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import whisper
+
+from .audio import load_audio_head
+from .cancellation import CancellationToken
+from .local_diarization import detect_speech, SAMPLE_RATE
+from .metrics import Metrics, metrics as default_metrics
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 文件的缓存键只读取开头的字节数，哈希开销与文件长度无关
+HASH_PREFIX_BYTES = 1 << 20
+
+
+def audio_hash(audio: Any, max_samples: Optional[int] = None) -> str:
+    """
+    语言识别的缓存键 (SHA-256)
+
+    文件取文件大小和开头 HASH_PREFIX_BYTES 字节；波形只取前 max_samples 个采样，
+    即语言检测会看到的范围。不读取整个文件或整段波形。
+    """
+    digest = hashlib.sha256()
+    if isinstance(audio, str):
+        digest.update(str(os.path.getsize(audio)).encode())
+        with open(audio, "rb") as f:
+            digest.update(f.read(HASH_PREFIX_BYTES))
+    else:
+        digest.update(np.ascontiguousarray(audio[:max_samples], dtype=np.float32).data)
+    return digest.hexdigest()
+
+
+def first_speech_window(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    从 VAD 找到的第一段语音开始截取一个 30 秒窗口
+
+    开头的静音、铃声或音乐不计入窗口，避免语言检测看到的主要是非语音；
+    没有检测到语音时使用音频开头
+    """
+    regions = detect_speech(audio, sample_rate)
+    start = int(regions[0][0] * sample_rate) if regions else 0
+    window = audio[start:start + whisper.audio.N_SAMPLES]
+    if len(window) < whisper.audio.N_SAMPLES and start > 0:
+        # 语音在音频末尾附近开始时，向前补足 30 秒
+        window = audio[max(0, len(audio) - whisper.audio.N_SAMPLES):]
+    return window
+
+
+class LanguageIdentifier:
+    """
+    转录前的语言识别阶段
+
+    对第一段语音的 30 秒窗口运行一次语言检测 (一次编码器前向和一步解码)，
+    结果按音频的哈希缓存 (文件取大小和开头部分，波形取扫描范围内的采样)，重复提交的音频不再检测。
+    检测结果用于选择模型 (英语使用 .en 模型) 并作为转录的语言，模型不再自行检测。
+    文件输入只解码开头的 scan_seconds 秒用于 VAD 和检测。
+    """
+
+    def __init__(
+        self,
+        detector: Any,
+        scan_seconds: float = 120.0,
+        cache_size: int = 4096,
+        metrics: Optional[Metrics] = None
+    ):
+        """
+        初始化语言识别
+
+        Args:
+            detector: 提供 detect_language(audio, cancel_token) 的多语言转录器
+            scan_seconds: 查找第一段语音的范围 (秒)
+            cache_size: 缓存的检测结果数
+            metrics: 记录检测次数和缓存命中的指标实例
+        """
+        self.detector = detector
+        self.scan_seconds = scan_seconds
+        self.cache_size = cache_size
+        self.metrics = metrics or default_metrics
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _store(self, key: str, result: Tuple[str, float]) -> None:
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _prepare(self, audio: Any) -> Tuple[str, Optional[Tuple[str, float]], Optional[np.ndarray]]:
+        """在工作线程中计算哈希，未命中缓存时解码开头并截取检测窗口"""
+        scan_samples = int(self.scan_seconds * SAMPLE_RATE)
+        key = audio_hash(audio, scan_samples)
+        cached = self._lookup(key)
+        if cached is not None:
+            return key, cached, None
+        head = load_audio_head(audio, self.scan_seconds) if isinstance(audio, str) else audio[:scan_samples]
+        return key, None, first_speech_window(head)
+
+    async def identify(
+        self,
+        audio: Any,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[str, float]:
+        """
+        识别音频的语言
+
+        Args:
+            audio: 音频文件路径或 16kHz 单声道波形
+            cancel_token: 取消令牌，检测按其任务的优先级排队
+
+        Returns:
+            (语言代码, 概率)
+        """
+        loop = asyncio.get_event_loop()
+        key, cached, window = await loop.run_in_executor(None, lambda: self._prepare(audio))
+        if cached is not None:
+            self.metrics.inc("language_id_total", result="cached")
+            return cached
+
+        if cancel_token is not None:
+            cancel_token.check()
+        language, probability = await self.detector.detect_language(window, cancel_token=cancel_token)
+        self._store(key, (language, probability))
+        self.metrics.inc("language_id_total", result="detected")
+        self.metrics.inc("language_id_detected_total", language=language)
+        logger.info(f"语言识别: {language} (概率 {probability:.2f})")
+        return language, probability
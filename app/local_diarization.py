@@ -0,0 +1,426 @@
+import logging
+import os
+from typing import Dict, List, Any, Optional, Tuple, Union
+import numpy as np
+import torch
+import torchaudio
+import whisper
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# detect_speech 每次计算能量的帧数 (30ms 帧时约 8 分钟)
+ENERGY_BLOCK_FRAMES = 1 << 14
+# 单次层次聚类的窗口数上限 (距离矩阵约 16 MB)，更多的窗口分块聚类
+MAX_CLUSTER_WINDOWS = 2000
+
+# SpeechBrain 在 VoxCeleb 上训练的 ECAPA-TDNN 说话者嵌入模型 (192 维)
+ECAPA_SOURCE = "speechbrain/spkrec-ecapa-voxceleb"
+# 各嵌入模型在窗口归一化后的默认聚类阈值 (余弦距离)
+DEFAULT_THRESHOLDS = {"ecapa": 0.7, "onnx": 0.7, "mfcc": 0.5}
+
+
+def detect_speech(
+    audio: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    frame_ms: int = 30,
+    margin_db: float = 12.0,
+    min_speech: float = 0.3,
+    min_silence: float = 0.3
+) -> List[Tuple[float, float]]:
+    """
+    基于能量的语音活动检测 (VAD)
+
+    以低分位帧能量估计噪声底，高出噪声底 margin_db 的帧视为语音，
+    再合并短静音、丢弃过短的语音片段。帧能量按块向量化计算，内存占用与音频时长无关。
+
+    Args:
+        audio: 16kHz 单声道波形
+        sample_rate: 采样率
+        frame_ms: 帧长 (毫秒)
+        margin_db: 语音帧相对噪声底的能量阈值 (dB)
+        min_speech: 最短语音片段 (秒)
+        min_silence: 短于此长度的静音会被合并 (秒)
+
+    Returns:
+        语音区间列表 [(start, end), ...]，单位为秒
+    """
+    frame_len = sample_rate * frame_ms // 1000
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return []
+
+    # 分块计算帧能量，长音频 (包括 mmap 波形) 不复制整段采样
+    energy = np.empty(n_frames, dtype=np.float32)
+    for first in range(0, n_frames, ENERGY_BLOCK_FRAMES):
+        count = min(ENERGY_BLOCK_FRAMES, n_frames - first)
+        block = np.asarray(audio[first * frame_len:(first + count) * frame_len], dtype=np.float32)
+        energy[first:first + count] = np.mean(np.square(block.reshape(count, frame_len)), axis=1)
+    energy_db = 10 * np.log10(energy + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    # 连续讲话时低分位能量本身就是语音，阈值不能高于能量峰值以下 15dB
+    threshold = min(noise_floor + margin_db, np.percentile(energy_db, 95) - 15)
+    threshold = max(threshold, noise_floor + 3, -60)
+    is_speech = np.concatenate(([False], energy_db > threshold, [False]))
+
+    # 找出语音区间的起止帧
+    changes = np.flatnonzero(np.diff(is_speech.astype(np.int8)))
+    starts, ends = changes[0::2], changes[1::2]
+    frame_sec = frame_len / sample_rate
+
+    regions: List[Tuple[float, float]] = []
+    for start, end in zip((starts * frame_sec).tolist(), (ends * frame_sec).tolist()):
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+
+    return [(start, end) for start, end in regions if end - start >= min_speech]
+
+
+def speech_windows(
+    regions: List[Tuple[float, float]],
+    window: float = 1.5,
+    step: float = 0.75
+) -> List[Tuple[float, float]]:
+    """将语音区间切分为固定长度的滑动窗口，较短的区间作为单个窗口"""
+    windows: List[Tuple[float, float]] = []
+    for start, end in regions:
+        if end - start <= window:
+            windows.append((start, end))
+            continue
+        offsets = np.arange(start, end - window + 1e-6, step)
+        windows.extend((float(t), float(t) + window) for t in offsets)
+        if windows[-1][1] < end:
+            windows.append((end - window, end))
+    return windows
+
+
+def agglomerative_cluster(
+    embeddings: np.ndarray,
+    threshold: float = 0.5,
+    num_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None
+) -> np.ndarray:
+    """
+    基于余弦距离的平均连接层次聚类
+
+    为每一行缓存最近邻，每次合并只重新计算受影响的行，整体约为 O(n^2)。
+    未指定 num_speakers 时，合并到最近簇距离超过 threshold 为止，
+    从而自动估计说话者数量。
+
+    Args:
+        embeddings: 形状为 (n, d) 的说话者嵌入
+        threshold: 停止合并的余弦距离阈值
+        num_speakers: 已知的说话者数量
+        max_speakers: 说话者数量上限
+
+    Returns:
+        每个嵌入的簇标签 (从 0 开始，按首次出现排序)
+    """
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if n == 1:
+        return np.zeros(1, dtype=np.int64)
+
+    x = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10)
+    dist = (1.0 - x @ x.T).astype(np.float32)
+    np.fill_diagonal(dist, np.inf)
+
+    sizes = np.ones(n)
+    parent = np.arange(n)
+    nn_idx = dist.argmin(axis=1)
+    nn_dist = dist[np.arange(n), nn_idx]
+    clusters = n
+    min_clusters = num_speakers or 1
+
+    while clusters > min_clusters:
+        i = int(nn_dist.argmin())
+        if not np.isfinite(nn_dist[i]):
+            break
+        if num_speakers is None and nn_dist[i] > threshold and (max_speakers is None or clusters <= max_speakers):
+            break
+        j = int(nn_idx[i])
+
+        # Lance-Williams 平均连接更新
+        merged = (sizes[i] * dist[i] + sizes[j] * dist[j]) / (sizes[i] + sizes[j])
+        merged[[i, j]] = np.inf
+        dist[i, :] = merged
+        dist[:, i] = merged
+        dist[j, :] = np.inf
+        dist[:, j] = np.inf
+        sizes[i] += sizes[j]
+        parent[parent == j] = i
+        nn_dist[j] = np.inf
+        clusters -= 1
+
+        # 最近邻指向 i 或 j 的行需要重新计算，其余行只需与新簇比较
+        stale = np.flatnonzero((nn_idx == i) | (nn_idx == j))
+        stale = stale[np.isfinite(nn_dist[stale]) | (stale == i)]
+        closer = merged < nn_dist
+        nn_dist[closer] = merged[closer]
+        nn_idx[closer] = i
+        if len(stale):
+            nn_idx[stale] = dist[stale].argmin(axis=1)
+            nn_dist[stale] = dist[stale, nn_idx[stale]]
+        nn_idx[i] = dist[i].argmin()
+        nn_dist[i] = dist[i, nn_idx[i]]
+
+    _, labels = np.unique(parent, return_inverse=True)
+    return _renumber(labels)
+
+
+def _renumber(labels: np.ndarray) -> np.ndarray:
+    """按首次出现顺序重新编号簇标签"""
+    _, labels = np.unique(labels, return_inverse=True)
+    _, first = np.unique(labels, return_index=True)
+    order = np.argsort(np.argsort(first))
+    return order[labels]
+
+
+def cluster_windows(
+    embeddings: np.ndarray,
+    threshold: float = 0.5,
+    num_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+    chunk_size: int = MAX_CLUSTER_WINDOWS
+) -> np.ndarray:
+    """
+    对任意数量的窗口嵌入聚类，内存占用有上限
+
+    窗口数不超过 chunk_size 时直接调用 agglomerative_cluster；否则每 chunk_size 个窗口
+    按阈值单独聚类，再对各块的簇中心聚类 (应用 num_speakers 和 max_speakers)，
+    距离矩阵最大为 chunk_size^2，而非窗口数的平方。
+
+    Returns:
+        每个嵌入的簇标签 (从 0 开始，按首次出现排序)
+    """
+    n = len(embeddings)
+    if n <= chunk_size:
+        return agglomerative_cluster(embeddings, threshold, num_speakers, max_speakers)
+
+    x = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10)
+    local_labels = np.empty(n, dtype=np.int64)
+    centroids: List[np.ndarray] = []
+    for start in range(0, n, chunk_size):
+        block = x[start:start + chunk_size]
+        labels = agglomerative_cluster(block, threshold)
+        local_labels[start:start + len(block)] = labels + len(centroids)
+        centroids.extend(block[labels == k].mean(axis=0) for k in range(labels.max() + 1))
+
+    global_labels = agglomerative_cluster(np.stack(centroids), threshold, num_speakers, max_speakers)
+    return _renumber(global_labels[local_labels])
+
+
+class SpeakerEmbedder:
+    """
+    在本地提取说话者嵌入，无需授权令牌
+
+    默认使用 SpeechBrain 的 ECAPA-TDNN 说话者验证模型 (首次使用时从 Hugging Face 下载并缓存)；
+    也可指定 WeSpeaker 等导出的 ONNX 说话者模型 (输入 80 维 fbank)。
+    模型无法加载时 (如离线且没有缓存) 回退到 MFCC 统计量并记录警告，其区分能力明显较弱。
+    """
+
+    def __init__(self, model_name: Optional[str] = None, device: str = "cpu", batch_size: int = 64):
+        """
+        初始化嵌入提取器
+
+        Args:
+            model_name: 嵌入模型 (ecapa: SpeechBrain ECAPA-TDNN, *.onnx: ONNX 说话者模型文件,
+                mfcc: MFCC 统计量)，默认读取环境变量 SPEAKER_EMBEDDING_MODEL，未设置时为 ecapa
+            device: 运行设备
+            batch_size: 每批处理的窗口数
+        """
+        model_name = model_name or os.getenv("SPEAKER_EMBEDDING_MODEL", "ecapa")
+        self.device = device
+        self.batch_size = batch_size
+
+        try:
+            self._load(model_name)
+        except Exception as e:
+            if model_name == "mfcc":
+                raise
+            logger.warning(f"无法加载说话者嵌入模型 {model_name}: {str(e)}，回退到 MFCC 统计量")
+            self._load("mfcc")
+        logger.info(f"说话者嵌入模型: {self.model_name}")
+
+    def _load(self, model_name: str) -> None:
+        if model_name == "ecapa":
+            try:
+                from speechbrain.inference.speaker import EncoderClassifier
+            except ImportError:
+                from speechbrain.pretrained import EncoderClassifier
+            self.model = EncoderClassifier.from_hparams(
+                source=ECAPA_SOURCE,
+                savedir=os.path.join(os.path.expanduser("~"), ".cache", "speechbrain", "spkrec-ecapa-voxceleb"),
+                run_opts={"device": self.device}
+            )
+            self.kind = "ecapa"
+        elif model_name.endswith(".onnx"):
+            import onnxruntime
+            providers = ["CUDAExecutionProvider", "CPUExecutionProvider"] if self.device == "cuda" else ["CPUExecutionProvider"]
+            self.model = onnxruntime.InferenceSession(model_name, providers=providers)
+            self.kind = "onnx"
+        elif model_name == "mfcc":
+            self.model = torchaudio.transforms.MFCC(
+                sample_rate=SAMPLE_RATE,
+                n_mfcc=30,
+                melkwargs={"n_fft": 400, "hop_length": 160, "n_mels": 64}
+            ).to(self.device)
+            self.kind = "mfcc"
+        else:
+            raise ValueError(f"不支持的嵌入模型: {model_name}")
+        self.model_name = model_name
+
+    @property
+    def default_threshold(self) -> float:
+        """该模型的默认聚类阈值"""
+        return DEFAULT_THRESHOLDS[self.kind]
+
+    @torch.no_grad()
+    def embed_batch(self, batch: torch.Tensor) -> np.ndarray:
+        """为一批等长波形提取嵌入"""
+        if self.kind == "ecapa":
+            stats = self.model.encode_batch(batch.to(self.device)).squeeze(1)
+        elif self.kind == "onnx":
+            # Kaldi 风格的 80 维 fbank，按句减均值 (与 WeSpeaker 训练时的特征一致)
+            feats = torch.stack([
+                torchaudio.compliance.kaldi.fbank(
+                    wave.unsqueeze(0) * (1 << 15),
+                    num_mel_bins=80,
+                    frame_length=25,
+                    frame_shift=10,
+                    dither=0.0,
+                    sample_frequency=SAMPLE_RATE
+                )
+                for wave in batch
+            ])
+            feats = feats - feats.mean(dim=1, keepdim=True)
+            session_input = self.model.get_inputs()[0].name
+            return self.model.run(None, {session_input: feats.numpy()})[0]
+        else:
+            features = self.model(batch.to(self.device))  # (batch, n_mfcc, frames)
+            stats = torch.cat([features.mean(dim=-1), features.std(dim=-1)], dim=-1)
+        return stats.cpu().numpy()
+
+    def embed(self, audio: np.ndarray, windows: List[Tuple[float, float]], normalize: bool = True) -> np.ndarray:
+        """
+        为每个时间窗口提取嵌入
+
+        Args:
+            audio: 16kHz 单声道波形
+            windows: 时间窗口列表 (秒)
+            normalize: 是否在全部窗口上做均值方差归一化
+
+        Returns:
+            形状为 (len(windows), d) 的嵌入矩阵
+        """
+        if not windows:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        length = int(max(end - start for start, end in windows) * SAMPLE_RATE)
+        embeddings = []
+        for offset in range(0, len(windows), self.batch_size):
+            batch = np.zeros((min(self.batch_size, len(windows) - offset), length), dtype=np.float32)
+            for row, (start, end) in enumerate(windows[offset:offset + self.batch_size]):
+                chunk = np.asarray(audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)], dtype=np.float32)
+                if len(chunk):
+                    # 较短的窗口循环填充，避免补零的静音帧影响统计量
+                    batch[row] = np.resize(chunk, length)
+            embeddings.append(self.embed_batch(torch.from_numpy(batch)))
+
+        embeddings = np.concatenate(embeddings, axis=0)
+        if not normalize:
+            return embeddings.astype(np.float32)
+        # 按全部窗口做均值方差归一化，突出说话者之间的差异
+        embeddings = (embeddings - embeddings.mean(axis=0)) / (embeddings.std(axis=0) + 1e-6)
+        return embeddings.astype(np.float32)
+
+
+class LocalDiarizer:
+    """离线说话者识别：能量 VAD + 本地说话者嵌入模型 + 层次聚类"""
+
+    def __init__(
+        self,
+        embedding_model: Optional[str] = None,
+        device: str = "cpu",
+        threshold: Optional[float] = None,
+        window: float = 1.5,
+        step: float = 0.75
+    ):
+        """
+        初始化本地说话者识别
+
+        Args:
+            embedding_model: 嵌入模型名称，参见 SpeakerEmbedder
+            device: 运行设备
+            threshold: 聚类的余弦距离阈值，默认使用嵌入模型的默认值
+            window: 嵌入窗口长度 (秒)
+            step: 嵌入窗口步长 (秒)
+        """
+        self.embedder = SpeakerEmbedder(embedding_model, device=device)
+        self.threshold = threshold if threshold is not None else self.embedder.default_threshold
+        self.window = window
+        self.step = step
+
+    def __call__(
+        self,
+        audio: Union[str, np.ndarray],
+        num_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        对音频进行说话者识别
+
+        Args:
+            audio: 音频文件路径或 16kHz 单声道波形
+            num_speakers: 已知的说话者数量
+            max_speakers: 说话者数量上限
+
+        Returns:
+            说话者轮次列表 [{"start", "end", "speaker"}, ...]
+        """
+        if isinstance(audio, str):
+            audio = whisper.load_audio(audio)
+
+        regions = detect_speech(audio)
+        windows = speech_windows(regions, self.window, self.step)
+        if not windows:
+            return []
+
+        embeddings = self.embedder.embed(audio, windows)
+        labels = cluster_windows(
+            embeddings,
+            threshold=self.threshold,
+            num_speakers=num_speakers,
+            max_speakers=max_speakers
+        )
+        logger.info(f"本地说话者识别完成: {len(windows)} 个窗口, {labels.max() + 1} 位说话者")
+        return self._to_turns(regions, windows, labels)
+
+    def _to_turns(
+        self,
+        regions: List[Tuple[float, float]],
+        windows: List[Tuple[float, float]],
+        labels: np.ndarray
+    ) -> List[Dict[str, Any]]:
+        """将窗口标签转换为连续的说话者轮次，重叠窗口以窗口中心划分边界"""
+        centers = np.array([(start + end) / 2 for start, end in windows])
+        turns: List[Dict[str, Any]] = []
+        for region_start, region_end in regions:
+            lo, hi = np.searchsorted(centers, [region_start, region_end])
+            if lo == hi:
+                continue
+            region_labels = labels[lo:hi]
+            # 相邻窗口中心的中点作为切换边界
+            bounds = np.concatenate(([region_start], (centers[lo:hi - 1] + centers[lo + 1:hi]) / 2, [region_end]))
+            for k, label in enumerate(region_labels):
+                speaker = f"SPEAKER_{int(label):02d}"
+                if turns and turns[-1]["speaker"] == speaker and turns[-1]["end"] >= bounds[k] - 1e-6:
+                    turns[-1]["end"] = float(bounds[k + 1])
+                else:
+                    turns.append({"start": float(bounds[k]), "end": float(bounds[k + 1]), "speaker": speaker})
+        return turns
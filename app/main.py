@@ -1,28 +1,49 @@
 import os
 import json
+import heapq
+import hashlib
 import logging
 import asyncio
-from typing import Dict, List, Any, Optional
+import time
+from typing import Dict, List, Any, NamedTuple, Optional, Tuple, BinaryIO
 from pathlib import Path
+import shutil
 import tempfile
 import uuid
+import zipfile
 
-from fastapi import FastAPI, File, UploadFile, Form, WebSocket, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, File, UploadFile, Form, WebSocket, HTTPException, BackgroundTasks, Depends, Request
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 import torch
+import whisper
 
-from .transcriber import WhisperTranscriber
+from .transcriber import WhisperTranscriber, SUPPORTED_FORMATS
+from .audio import load_channels, load_pcm_file, probe_duration, resolve_pcm_format, pcm_to_array, PcmScratch, PCM_FORMATS
 from .diarization import SpeakerDiarization
-from .youtube import YouTubeDownloader
+from .local_diarization import SpeakerEmbedder, SAMPLE_RATE
+from .online_diarization import OnlineSpeakerTracker
+from .session import TranscriptionSession
+from .broker import FileBroker
+from .remote import RemoteTranscriber, RemoteDiarization
+from .metrics import metrics
+from .routing import ModelRouter, RoutingDecision
+from .language_id import LanguageIdentifier
+from .decoding import get_profile, merge_stats
+from .cancellation import CancellationToken, TranscriptionCancelled, run_cancellable
+from .scheduler import Job
+from .segments import SegmentTable, dumps
+from .results import ResultStore, render_result, RESULT_FORMATS
+from .transcript_index import TranscriptIndex
+from .subtitles import render_subtitles
+from .youtube import YouTubeDownloader, FixtureDownloader
 from .models import (
     TranscriptionResponse, 
     DiarizedTranscriptionResponse, 
-    DiarizationSegment,
     WebSocketMessage,
     ErrorResponse
 )
@@ -53,17 +74,117 @@ app.mount("/static", StaticFiles(directory=Path(__file__).parent / "static"), na
 # 设置模板
 templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
 
-# 创建转录器和说话者识别实例
-transcriber = WhisperTranscriber(model_name="small")
+# 创建转录器和说话者识别实例，模型副本数决定可并行执行的转录任务数
+# WHISPER_MODELS 可加载多个模型 (如 "small,base")，按负载和截止时间为每个请求选择
+model_names = [name.strip() for name in os.getenv("WHISPER_MODELS", "small").split(",") if name.strip()]
+model_replicas = int(os.getenv("WHISPER_MODEL_REPLICAS", "1"))
+# 不短于此时长 (秒) 的音频解码到 mmap 临时文件并逐窗口转录，0 表示不启用
+long_audio_seconds = float(os.getenv("LONG_AUDIO_SECONDS", "600"))
 
-# 创建说话者识别实例 (WhisperX 不需要令牌)
-diarization = SpeakerDiarization()
+# 分布式模式：设置 WHISPER_STT_BROKER_DIR 时本进程不加载模型，
+# 转录任务经共享目录交给 `python run.py worker` 启动的推理节点，
+# 此时 WHISPER_MODEL_REPLICAS 为全部推理节点上每个模型的副本总数
+broker_dir = os.getenv("WHISPER_STT_BROKER_DIR")
+broker: Optional[FileBroker] = FileBroker(broker_dir) if broker_dir else None
+
+if broker is not None:
+    logger.info(f"分布式模式: 任务队列 {broker_dir}")
+    transcribers: Dict[str, Any] = {
+        name: RemoteTranscriber(broker, name, replicas=model_replicas)
+        for name in model_names
+    }
+    diarizations: Dict[str, Any] = {
+        name: RemoteDiarization(broker, name)
+        for name in model_names
+    }
+else:
+    transcribers = {
+        name: WhisperTranscriber(model_name=name, replicas=model_replicas, long_audio_seconds=long_audio_seconds)
+        for name in model_names
+    }
+    
+    # 创建说话者识别实例 (WhisperX 不需要令牌)，共享已加载的 Whisper 模型进行词级对齐
+    diarizations = {
+        name: SpeakerDiarization(
+            align_method="whisper", model_pool=model.pool, long_audio_seconds=long_audio_seconds
+        )
+        for name, model in transcribers.items()
+    }
+
+# 模型路由：延迟预算内选择最准确的模型，高峰时降级到较小的模型
+model_router = ModelRouter(
+    {name: model.replicas for name, model in transcribers.items()},
+    latency_target=float(os.getenv("WHISPER_LATENCY_TARGET", "30"))
+)
+
+# 默认 (最准确) 的模型，用于格式检查
+transcriber = transcribers[model_router.default_model]
+
+# 语言识别阶段：未指定语言的请求先在第一段语音上检测一次语言 (按音频哈希缓存)，
+# 英语音频路由到已加载的 .en 模型 (如 WHISPER_MODELS="small,small.en")，其他语言使用多语言模型。
+# 检测只解码一个窗口的语言标记，小模型已足够准确，因此 LANGUAGE_ID_MODEL 默认为最小的多语言模型；
+# 只加载了 .en 模型时不检测
+multilingual_models = model_router.candidates(None)
+language_id_model = os.getenv("LANGUAGE_ID_MODEL") or multilingual_models[-1]
+language_identifier = (
+    LanguageIdentifier(transcribers[language_id_model], cache_size=int(os.getenv("LANGUAGE_ID_CACHE_SIZE", "4096")))
+    if not language_id_model.endswith(".en") else None
+)
+# 检测概率达到该值才采用检测结果 (并可使用只支持英语的模型)，否则由多语言模型在转录时自行检测
+language_id_threshold = float(os.getenv("LANGUAGE_ID_THRESHOLD", "0.8"))
+
+# 解码配置 (greedy, fast-greedy, balanced, accurate)：请求可用 decoding_profile 指定，
+# 各端点默认为不回退的 greedy，可用 DECODING_PROFILE_<端点> 覆盖 (如 DECODING_PROFILE_BATCH=accurate)
+endpoint_profiles = {
+    endpoint: get_profile(os.getenv(f"DECODING_PROFILE_{endpoint.upper()}")).name
+    for endpoint in ("transcriptions", "transcribe", "batch", "youtube", "websocket")
+}
+
+# 批量转录的上限：文件数 (含 zip 内的文件)、单个文件大小、全部文件的总大小 (解压后)
+batch_max_files = int(os.getenv("BATCH_MAX_FILES", "100"))
+batch_max_file_bytes = int(os.getenv("BATCH_MAX_FILE_MB", "512")) * 1024 * 1024
+batch_max_total_bytes = int(os.getenv("BATCH_MAX_TOTAL_MB", "2048")) * 1024 * 1024
+
+# 推理并发上限：与模型副本总数一致，批量任务在事件循环中排队，不占用执行器线程
+inference_slots = asyncio.Semaphore(sum(model.replicas for model in transcribers.values()))
+
+# 创建说话者嵌入提取器，供 WebSocket 会话的增量说话者识别共享
+speaker_embedder = SpeakerEmbedder()
+
+# 已完成的转录结果，按结果 ID 保存，供 /api/results 按需渲染为不同格式
+# 设置 TRANSCRIPT_INDEX_PATH 时结果同时写入 SQLite 转录索引，可全文搜索，重启后仍可取得；
+# 转录内容会落盘，因此默认不启用，TRANSCRIPT_RETENTION_DAYS 为保留天数 (0 为永久保存)
+transcript_index_path = os.getenv("TRANSCRIPT_INDEX_PATH", "")
+transcript_retention_days = float(os.getenv("TRANSCRIPT_RETENTION_DAYS", "30"))
+transcript_index = TranscriptIndex(
+    transcript_index_path,
+    retention=transcript_retention_days * 86400 if transcript_retention_days > 0 else None
+) if transcript_index_path else None
+result_store = ResultStore(max_results=int(os.getenv("RESULT_STORE_SIZE", "256")), index=transcript_index)
 
 # 创建YouTube下载器实例
-youtube_downloader = YouTubeDownloader()
+# 设置 WHISPER_STT_YOUTUBE_FIXTURE 时不访问网络，以本地音频代替下载 (负载测试)
+youtube_fixture = os.getenv("WHISPER_STT_YOUTUBE_FIXTURE")
+youtube_downloader = (
+    FixtureDownloader(youtube_fixture, delay=float(os.getenv("WHISPER_STT_YOUTUBE_DELAY", "0")))
+    if youtube_fixture else YouTubeDownloader()
+)
 
-# 存储WebSocket连接
-websocket_connections = {}
+# 存储WebSocket会话
+websocket_connections: Dict[str, TranscriptionSession] = {}
+# 每个 WebSocket 会话最多排队等待转录的音频块数，超出的音频块被拒绝
+websocket_max_pending_chunks = int(os.getenv("WEBSOCKET_MAX_PENDING_CHUNKS", "4"))
+
+class CompactJSONResponse(JSONResponse):
+    """
+    直接序列化普通字典的 JSON 响应
+    
+    端点返回 Response 时 FastAPI 不再按 response_model 逐项校验和转换，
+    长转录的数千个段落只需一次 json.dumps
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content).encode("utf-8")
 
 # 依赖项：获取临时目录
 def get_temp_dir():
@@ -79,6 +200,441 @@ def get_temp_dir():
         except Exception as e:
             logger.error(f"清理临时目录时出错: {str(e)}")
 
+async def read_upload(file: UploadFile, audio_format: Optional[str], temp_dir: str):
+    """
+    读取上传的音频
+    
+    原始 PCM 直接包装为 NumPy 波形，不写临时文件、不启动 ffmpeg；
+    其他格式保存到临时目录 (由 get_temp_dir 清理) 并返回文件路径。
+    格式不受支持时返回 400 错误响应。
+    """
+    try:
+        pcm_format = resolve_pcm_format(file.content_type, audio_format)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "不支持的音频格式", "detail": str(e)}
+        )
+    
+    if pcm_format:
+        return pcm_to_array(await file.read(), pcm_format)
+    
+    # 检查文件格式
+    if not transcriber.is_format_supported(file.filename):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "不支持的文件格式", "detail": f"支持的格式: {', '.join(SUPPORTED_FORMATS)}"}
+        )
+    
+    # 分块复制上传的文件，不整体读入内存
+    temp_path = os.path.join(temp_dir, os.path.basename(file.filename))
+    
+    def save():
+        with open(temp_path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+    
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, save)
+    return temp_path
+
+async def watch_disconnect(request: Request, cancel_token: CancellationToken, interval: float = 0.5):
+    """轮询 HTTP 客户端的连接状态，断开时取消令牌，正在进行的推理在下一个窗口前停止"""
+    while not cancel_token.cancelled:
+        if await request.is_disconnected():
+            logger.info("客户端已断开连接，取消转录")
+            cancel_token.cancel("客户端已断开连接")
+            return
+        await asyncio.sleep(interval)
+
+def client_key(request: Request) -> str:
+    """
+    公平排队使用的客户端标识
+    
+    依次使用 X-Client-ID 请求头、API 密钥 (X-API-Key 或 Bearer 令牌，只保留摘要) 和客户端地址
+    """
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id
+    api_key = request.headers.get("x-api-key")
+    authorization = request.headers.get("authorization", "")
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return request.client.host if request.client else "anonymous"
+
+def resolve_profile(requested: Optional[str], endpoint: str) -> str:
+    """请求指定的解码配置，未指定时使用端点的默认配置，不支持时抛出 ValueError"""
+    return get_profile(requested, endpoint_profiles[endpoint]).name
+
+def profile_error(e: ValueError) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"error": "不支持的解码配置", "detail": str(e)})
+
+def cancelled_response(e: TranscriptionCancelled) -> JSONResponse:
+    """被取消的转录对应的错误响应: 超时返回 504，客户端断开返回 499"""
+    if e.timed_out:
+        return JSONResponse(status_code=504, content={"error": "转录超时", "detail": e.reason})
+    return JSONResponse(status_code=499, content={"error": "转录已取消", "detail": e.reason})
+
+async def route_request(
+    audio_input: Any,
+    max_latency: Optional[float] = None,
+    requested: Optional[str] = None,
+    job: Optional[Job] = None,
+    language: Optional[str] = None
+) -> RoutingDecision:
+    """
+    根据音频语言、时长和当前负载为请求选择模型
+    
+    客户端未指定语言时先经过语言识别阶段，检测概率达到 LANGUAGE_ID_THRESHOLD 时
+    检测结果作为转录语言 (decision.language)，英语路由到 .en 模型；
+    低于阈值时 decision.language 为 None，由多语言模型自行检测
+    
+    Args:
+        audio_input: 音频文件路径或 16kHz 单声道波形
+        max_latency: 客户端可接受的最大延迟 (秒)
+        requested: 客户端指定的模型名称
+        job: 调度任务，以音频时长作为其公平排队的开销
+        language: 客户端指定的语言
+    """
+    if isinstance(audio_input, str):
+        loop = asyncio.get_event_loop()
+        duration = await loop.run_in_executor(None, lambda: probe_duration(audio_input))
+    else:
+        duration = len(audio_input) / SAMPLE_RATE
+    
+    probability = None
+    if language is None and language_identifier is not None:
+        detected, probability = await language_identifier.identify(audio_input, job)
+        language = detected if probability >= language_id_threshold else None
+    
+    if job is not None:
+        job.cost = max(duration, 1.0)
+    decision = model_router.choose(duration, max_latency=max_latency, requested=requested, language=language)
+    decision.language = language
+    decision.language_probability = probability
+    return decision
+
+def build_result(
+    text: str,
+    segments: List[Dict[str, Any]],
+    language: Optional[str] = None,
+    include_srt: bool = True,
+    speaker_labels: bool = True,
+    model: Optional[str] = None,
+    language_probability: Optional[float] = None,
+    decoding: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    保存转录结果并生成 DiarizedTranscriptionResponse 格式的响应
+    
+    Args:
+        text: 完整文本
+        segments: 段落 (speaker, start, end, text)
+        language: 语言代码
+        include_srt: 是否在响应中附带 SRT 字幕，否则可通过 /api/results/{result_id}.srt 获取
+        speaker_labels: SRT 字幕是否标注说话者
+        model: 实际使用的模型
+        language_probability: 语言识别的置信度
+        decoding: 解码统计 (解码配置、窗口数、温度回退的窗口数)
+    """
+    table = SegmentTable.from_segments(segments)
+    result_id = result_store.save(text, table, language=language, model=model or model_router.default_model)
+    return {
+        "text": text,
+        "segments": table.to_list(),
+        "srt": render_subtitles(table, "srt", speaker_labels=speaker_labels) if include_srt else None,
+        "result_id": result_id,
+        "model": model or model_router.default_model,
+        "language": language,
+        "language_probability": language_probability,
+        "decoding": decoding
+    }
+
+def plain_segments(transcription: Dict[str, Any]) -> SegmentTable:
+    """将 Whisper 段落转换为不带说话者的段落表，丢弃 tokens 等解码细节"""
+    return SegmentTable.from_segments(
+        {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+        for segment in transcription.get("segments", [])
+    )
+
+async def transcribe_channels(
+    audio_path: str,
+    language: Optional[str] = None,
+    channel_labels: Optional[str] = None,
+    include_srt: bool = True,
+    cancel_token: Optional[CancellationToken] = None,
+    model_name: Optional[str] = None,
+    profile: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    分别转录多声道录音的每个声道，以声道作为说话者并按时间交错合并
+    
+    Args:
+        audio_path: 音频文件路径
+        language: 音频语言代码
+        channel_labels: 以逗号分隔的声道名称 (如 "agent,customer")
+        include_srt: 是否在响应中附带 SRT 字幕
+        cancel_token: 取消令牌
+        model_name: 使用的模型，默认为最准确的模型
+        profile: 解码配置名称
+        
+    Returns:
+        DiarizedTranscriptionResponse 格式的结果，单声道音频返回 None
+    """
+    loop = asyncio.get_event_loop()
+    channels = await loop.run_in_executor(None, lambda: load_channels(audio_path))
+    if channels.shape[0] < 2:
+        logger.warning("音频只有一个声道，无法按声道区分说话者")
+        return None
+    
+    labels = [label.strip() for label in channel_labels.split(",") if label.strip()] if channel_labels else []
+    labels += [f"CHANNEL_{i + 1}" for i in range(len(labels), channels.shape[0])]
+    
+    model_name = model_name or model_router.default_model
+    duration = channels.shape[1] / SAMPLE_RATE
+    
+    async def transcribe_channel(channel):
+        # 每个声道单独计入模型负载和实时率，N 个声道的开销为 N 倍音频时长
+        with model_router.track(model_name, duration):
+            return await transcribers[model_name].transcribe_audio(
+                channel, language=language, cancel_token=cancel_token, profile=profile
+            )
+    
+    # 并行转录各声道 (并行度受模型副本数限制)
+    logger.info(f"按声道分别转录: {channels.shape[0]} 个声道")
+    results = await asyncio.gather(*(transcribe_channel(channel) for channel in channels))
+    
+    # 每个声道内的段落已按时间排序，归并即可交错
+    channel_segments = [
+        [
+            {"speaker": labels[i], "start": segment["start"], "end": segment["end"], "text": segment["text"]}
+            for segment in result.get("segments", [])
+        ]
+        for i, result in enumerate(results)
+    ]
+    merged = list(heapq.merge(*channel_segments, key=lambda segment: segment["start"]))
+    
+    text = " ".join(segment["text"].strip() for segment in merged)
+    return build_result(
+        text,
+        merged,
+        language=results[0].get("language"),
+        include_srt=include_srt,
+        model=model_name,
+        decoding=merge_stats([result.get("decoding") for result in results])
+    )
+
+async def transcribe_diarized(
+    audio_input: Any,
+    enable_diarization: bool = True,
+    language: Optional[str] = None,
+    include_srt: bool = True,
+    cancel_token: Optional[CancellationToken] = None,
+    model_name: Optional[str] = None,
+    profile: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    转录音频并 (可选) 识别说话者
+    
+    Args:
+        audio_input: 音频文件路径或 16kHz 单声道波形
+        enable_diarization: 是否启用说话者识别，失败时回退到普通转录
+        language: 音频语言代码
+        include_srt: 是否在响应中附带 SRT 字幕
+        cancel_token: 取消令牌，被取消时抛出 TranscriptionCancelled，不回退到普通转录
+        model_name: 使用的模型，默认为最准确的模型
+        profile: 解码配置名称
+        
+    Returns:
+        DiarizedTranscriptionResponse 格式的结果
+    """
+    model_name = model_name or model_router.default_model
+    
+    # 如果启用说话者识别，直接使用 WhisperX
+    if enable_diarization:
+        try:
+            # 使用 WhisperX 进行转录和说话者识别
+            logger.info("使用 WhisperX 进行转录和说话者识别...")
+            diarization_result = await diarizations[model_name].diarize(
+                audio_input, cancel_token=cancel_token, language=language, profile=profile
+            )
+            
+            # 提取文本和段落
+            segments = [
+                {
+                    "speaker": segment.get("speaker", "UNKNOWN"),
+                    "start": segment.get("start", 0),
+                    "end": segment.get("end", 0),
+                    "text": segment.get("text", "")
+                }
+                for segment in diarization_result.get("segments", [])
+            ]
+            full_text = " ".join(segment["text"] for segment in segments)
+            
+            return build_result(
+                full_text,
+                segments,
+                language=diarization_result.get("language", language),
+                include_srt=include_srt,
+                model=model_name,
+                decoding=diarization_result.get("decoding")
+            )
+            
+        except TranscriptionCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"WhisperX 处理过程中出错: {str(e)}")
+            logger.info("回退到普通 Whisper 转录...")
+    
+    # 如果不使用说话者识别或 WhisperX 失败，使用普通 Whisper
+    logger.info("使用普通 Whisper 进行转录...")
+    transcription = await transcribers[model_name].transcribe_audio(
+        audio_input,
+        language=language,
+        cancel_token=cancel_token,
+        profile=profile
+    )
+    
+    return build_result(
+        transcription["text"],
+        plain_segments(transcription),
+        language=transcription.get("language"),
+        include_srt=include_srt,
+        speaker_labels=False,
+        model=model_name,
+        decoding=transcription.get("decoding")
+    )
+
+# 流式响应格式
+STREAM_MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+def encode_stream_event(event: str, data: Dict[str, Any], stream_format: str) -> str:
+    """将事件编码为 SSE 或 NDJSON 行"""
+    payload = dumps({"type": event, **data})
+    if stream_format == "ndjson":
+        return payload + "\n"
+    return f"event: {event}\ndata: {payload}\n\n"
+
+async def stream_transcription(
+    audio_input: Any,
+    language: Optional[str] = None,
+    prompt: Optional[str] = None,
+    temperature: float = 0.0,
+    enable_diarization: bool = False,
+    stream_format: str = "sse",
+    cancel_token: Optional[CancellationToken] = None,
+    max_latency: Optional[float] = None,
+    requested_model: Optional[str] = None,
+    profile: Optional[str] = None
+) -> Any:
+    """
+    以 SSE 或 NDJSON 流式返回转录结果
+    
+    每个 30 秒窗口解码完成后立即发送其段落 (segment 事件)，
+    全部完成后发送包含完整文本、段落、SRT、结果 ID 和所用模型的 done 事件；
+    启用说话者识别时，说话者在 done 事件中给出。
+    客户端断开时响应流被取消，工作线程在下一个窗口前停止。
+    """
+    if stream_format not in STREAM_MEDIA_TYPES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "不支持的流格式", "detail": f"支持的格式: {', '.join(STREAM_MEDIA_TYPES)}"}
+        )
+    
+    # 在返回响应前解码音频，流式响应期间不再依赖临时文件；
+    # 长音频解码到 mmap 临时文件 (不在请求的临时目录中)，流结束时删除
+    scratch: Optional[PcmScratch] = None
+    if isinstance(audio_input, str):
+        path = audio_input
+        loop = asyncio.get_event_loop()
+        duration = await loop.run_in_executor(None, lambda: probe_duration(path))
+        if long_audio_seconds and duration >= long_audio_seconds:
+            scratch = await loop.run_in_executor(None, lambda: PcmScratch(path))
+            audio_input = scratch.audio
+        else:
+            audio_input = await loop.run_in_executor(None, lambda: whisper.load_audio(path))
+    audio = audio_input
+    try:
+        decision = await route_request(audio, max_latency, requested_model, job=cancel_token, language=language)
+    except BaseException:
+        if scratch is not None:
+            scratch.close()
+        raise
+    language = decision.language
+    if isinstance(cancel_token, Job):
+        # 流式转录逐窗口占用模型，每次占用的开销为一个窗口
+        cancel_token.cost = min(cancel_token.cost, float(whisper.audio.CHUNK_LENGTH))
+    model_name = decision.model
+    
+    async def events():
+        all_segments: List[Dict[str, Any]] = []
+        detected_language = language
+        decoding = None
+        try:
+            with model_router.track(model_name, decision.duration):
+                async for window in transcribers[model_name].transcribe_windows(
+                    audio, language, prompt, temperature, cancel_token, profile=profile
+                ):
+                    detected_language = window["language"]
+                    decoding = window.get("decoding")
+                    for segment in window["segments"]:
+                        all_segments.append(segment)
+                        yield encode_stream_event("segment", {
+                            "id": segment["id"],
+                            "start": segment["start"],
+                            "end": segment["end"],
+                            "text": segment["text"],
+                            "speaker": "UNKNOWN"
+                        }, stream_format)
+                
+                transcription = {
+                    "text": "".join(segment["text"] for segment in all_segments).strip(),
+                    "segments": all_segments,
+                    "language": detected_language
+                }
+                
+                if enable_diarization and all_segments:
+                    model_diarization = diarizations[model_name]
+                    diarized = await model_diarization.diarize(
+                        audio, transcription=transcription, cancel_token=cancel_token, profile=profile
+                    )
+                    segments = model_diarization.merge_with_transcription(diarized, None)
+                    result = build_result(
+                        transcription["text"],
+                        segments,
+                        language=detected_language,
+                        model=model_name,
+                        language_probability=decision.language_probability,
+                        decoding=decoding
+                    )
+                else:
+                    result = build_result(
+                        transcription["text"],
+                        plain_segments(transcription),
+                        language=detected_language,
+                        speaker_labels=False,
+                        model=model_name,
+                        language_probability=decision.language_probability,
+                        decoding=decoding
+                    )
+            
+            yield encode_stream_event("done", result, stream_format)
+        except TranscriptionCancelled as e:
+            logger.info(f"流式转录已取消: {e.reason}")
+            yield encode_stream_event("error", {"error": e.reason, "timed_out": e.timed_out}, stream_format)
+        except Exception as e:
+            logger.error(f"流式转录过程中出错: {str(e)}")
+            yield encode_stream_event("error", {"error": str(e)}, stream_format)
+        finally:
+            if scratch is not None:
+                scratch.close()
+    
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[stream_format])
+
 @app.get("/", response_class=HTMLResponse)
 async def get_index():
     """返回Web UI首页"""
@@ -86,160 +642,399 @@ async def get_index():
 
 @app.post("/v1/audio/transcriptions", response_model=TranscriptionResponse)
 async def transcribe_audio(
+    request: Request,
     file: UploadFile = File(...),
-    model: str = Form("whisper-small"),
+    model: str = Form("auto"),
     prompt: Optional[str] = Form(None),
     response_format: str = Form("json"),
     temperature: float = Form(0.0),
     language: Optional[str] = Form(None),
+    audio_format: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    stream_format: str = Form("sse"),
+    timeout: Optional[float] = Form(None),
+    max_latency: Optional[float] = Form(None),
+    decoding_profile: Optional[str] = Form(None),
     temp_dir: str = Depends(get_temp_dir)
 ):
     """
     兼容OpenAI API的音频转录端点
+    
+    16kHz 单声道原始 PCM 可通过 Content-Type (audio/pcm, audio/x-pcm-f32le)
+    或 audio_format (pcm_s16le, pcm_f32le) 声明，直接送入模型；
+    stream 为 true 时以 SSE 或 NDJSON (stream_format) 逐段返回；
+    timeout (秒) 内未完成或客户端断开时停止转录并释放模型；
+    model 为已加载的模型 (如 whisper-base) 时固定使用该模型，否则按负载和 max_latency (秒) 选择；
+    decoding_profile (greedy, fast-greedy, balanced, accurate) 决定束搜索和温度回退的上限；
+    请求按 interactive 优先级，以 X-Client-ID 或 API 密钥区分客户端公平排队
     """
     try:
-        # 检查文件格式
-        if not transcriber.is_format_supported(file.filename):
-            return JSONResponse(
-                status_code=400,
-                content={"error": "不支持的文件格式", "detail": f"支持的格式: {', '.join(transcriber.SUPPORTED_FORMATS)}"}
-            )
-        
-        # 保存上传的文件
-        temp_path = os.path.join(temp_dir, file.filename)
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+        profile = resolve_profile(decoding_profile, "transcriptions")
+    except ValueError as e:
+        return profile_error(e)
+    cancel_token = Job("interactive", client_key(request), timeout=timeout)
+    watcher = None
+    try:
+        audio_input = await read_upload(file, audio_format, temp_dir)
+        if isinstance(audio_input, JSONResponse):
+            return audio_input
         
-        # 重置文件指针
-        await file.seek(0)
+        if stream:
+            return await stream_transcription(
+                audio_input,
+                language=language,
+                prompt=prompt,
+                temperature=temperature,
+                stream_format=stream_format,
+                cancel_token=cancel_token,
+                max_latency=max_latency,
+                requested_model=model,
+                profile=profile
+            )
         
         # 转录音频
-        result = await transcriber.transcribe_file(
-            temp_path,
-            language=language,
-            prompt=prompt,
-            temperature=temperature
+        watcher = asyncio.ensure_future(watch_disconnect(request, cancel_token))
+        decision = await route_request(audio_input, max_latency, model, job=cancel_token, language=language)
+        with model_router.track(decision.model, decision.duration):
+            result = await transcribers[decision.model].transcribe_audio(
+                audio_input,
+                language=decision.language,
+                prompt=prompt,
+                temperature=temperature,
+                cancel_token=cancel_token,
+                profile=profile
+            )
+        
+        # 保存结果，之后可通过 /api/results/{result_id}.{format} 获取其他格式
+        result_id = result_store.save(
+            result["text"], plain_segments(result), language=result.get("language"), model=decision.model
         )
         
         # 格式化结果
         formatted_result = transcriber.format_result(result, format_type=response_format)
         
+        response = {
+            "result_id": result_id,
+            "model": decision.model,
+            "language": result.get("language"),
+            "language_probability": decision.language_probability,
+            "decoding": result.get("decoding")
+        }
         # 如果是json格式，返回完整结果
         if response_format == "json":
-            return {"text": formatted_result["text"]}
+            return {"text": formatted_result["text"], **response}
         # 否则返回纯文本
         else:
-            return {"text": formatted_result}
+            return {"text": formatted_result, **response}
             
+    except TranscriptionCancelled as e:
+        return cancelled_response(e)
     except Exception as e:
         logger.error(f"转录过程中出错: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if watcher is not None:
+            watcher.cancel()
 
 @app.post("/api/transcribe", response_model=DiarizedTranscriptionResponse)
 async def transcribe_with_diarization(
+    request: Request,
     file: UploadFile = File(...),
     enable_diarization: bool = Form(True),
     language: Optional[str] = Form(None),
+    channel_split: bool = Form(False),
+    channel_labels: Optional[str] = Form(None),
+    audio_format: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    stream_format: str = Form("sse"),
+    include_srt: bool = Form(True),
+    timeout: Optional[float] = Form(None),
+    model: Optional[str] = Form(None),
+    max_latency: Optional[float] = Form(None),
+    decoding_profile: Optional[str] = Form(None),
     temp_dir: str = Depends(get_temp_dir)
 ):
     """
     带有说话者识别的音频转录端点
+    
+    channel_split 为 true 时，多声道录音 (如客服通话) 按声道区分说话者，不运行说话者识别；
+    原始 PCM 输入和 stream 的用法与 /v1/audio/transcriptions 相同；
+    include_srt 为 false 时不生成 SRT，可之后通过 /api/results/{result_id}.srt 获取；
+    timeout、model、max_latency、decoding_profile 和客户端公平排队与 /v1/audio/transcriptions 相同
     """
     try:
-        # 检查文件格式
-        if not transcriber.is_format_supported(file.filename):
-            return JSONResponse(
-                status_code=400,
-                content={"error": "不支持的文件格式", "detail": f"支持的格式: {', '.join(transcriber.SUPPORTED_FORMATS)}"}
-            )
+        profile = resolve_profile(decoding_profile, "transcribe")
+    except ValueError as e:
+        return profile_error(e)
+    cancel_token = Job("interactive", client_key(request), timeout=timeout)
+    watcher = None
+    try:
+        audio_input = await read_upload(file, audio_format, temp_dir)
+        if isinstance(audio_input, JSONResponse):
+            return audio_input
         
-        # 保存上传的文件
-        temp_path = os.path.join(temp_dir, file.filename)
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+        if stream:
+            return await stream_transcription(
+                audio_input,
+                language=language,
+                enable_diarization=enable_diarization,
+                stream_format=stream_format,
+                cancel_token=cancel_token,
+                max_latency=max_latency,
+                requested_model=model,
+                profile=profile
+            )
         
-        segments = []
+        watcher = asyncio.ensure_future(watch_disconnect(request, cancel_token))
+        decision = await route_request(audio_input, max_latency, model, job=cancel_token, language=language)
         
-        # 如果启用说话者识别，直接使用 WhisperX
-        if enable_diarization:
-            try:
-                # 使用 WhisperX 进行转录和说话者识别
-                logger.info("使用 WhisperX 进行转录和说话者识别...")
-                diarization_result = await diarization.diarize(temp_path)
-                
-                # 提取文本和段落
-                full_text = " ".join([segment.get("text", "") for segment in diarization_result.get("segments", [])])
-                
-                # 转换为API响应格式
-                for segment in diarization_result.get("segments", []):
-                    segments.append(DiarizationSegment(
-                        speaker=segment.get("speaker", "UNKNOWN"),
-                        start=segment.get("start", 0),
-                        end=segment.get("end", 0),
-                        text=segment.get("text", "")
-                    ))
-                
-                # 生成 SRT 格式内容
-                srt_content = transcriber.format_segments_to_srt(diarization_result.get("segments", []))
-                
-                return {
-                    "text": full_text,
-                    "segments": segments,
-                    "srt": srt_content
-                }
-                
-            except Exception as e:
-                logger.error(f"WhisperX 处理过程中出错: {str(e)}")
-                logger.info("回退到普通 Whisper 转录...")
-                enable_diarization = False
+        # 按声道区分说话者 (原始 PCM 只有单声道)，各声道分别计入模型负载
+        if channel_split and isinstance(audio_input, str):
+            channel_result = await transcribe_channels(
+                audio_input,
+                decision.language,
+                channel_labels,
+                include_srt,
+                cancel_token,
+                decision.model,
+                profile
+            )
+            if channel_result is not None:
+                channel_result["language_probability"] = decision.language_probability
+                return CompactJSONResponse(channel_result)
         
-        # 如果不使用说话者识别或 WhisperX 失败，使用普通 Whisper
-        if not enable_diarization:
-            # 转录音频
-            logger.info("使用普通 Whisper 进行转录...")
-            transcription = await transcriber.transcribe_file(
-                temp_path,
-                language=language
+        with model_router.track(decision.model, decision.duration):
+            result = await transcribe_diarized(
+                audio_input, enable_diarization, decision.language, include_srt, cancel_token, decision.model, profile
             )
-            
-            # 不使用说话者识别，使用原始转录段落
-            for segment in transcription.get("segments", []):
-                segments.append(DiarizationSegment(
-                    speaker="UNKNOWN",
-                    start=segment["start"],
-                    end=segment["end"],
-                    text=segment["text"]
-                ))
-            
-            # 生成 SRT 格式内容
-            srt_content = transcriber.format_result(transcription, format_type="srt")
-            
-            return {
-                "text": transcription["text"],
-                "segments": segments,
-                "srt": srt_content
-            }
+            result["language_probability"] = decision.language_probability
+            return CompactJSONResponse(result)
                 
+    except TranscriptionCancelled as e:
+        return cancelled_response(e)
     except Exception as e:
         logger.error(f"转录过程中出错: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        # 清理临时文件
+        if watcher is not None:
+            watcher.cancel()
+
+@app.post("/api/transcribe/batch")
+async def transcribe_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    enable_diarization: bool = Form(False),
+    language: Optional[str] = Form(None),
+    include_srt: bool = Form(False),
+    timeout: Optional[float] = Form(None),
+    max_latency: Optional[float] = Form(None),
+    decoding_profile: Optional[str] = Form(None)
+):
+    """
+    批量转录多个音频文件 (或一个 zip 压缩包中的全部音频)
+    
+    文件在推理并发上限内同时处理，每完成一个即以 NDJSON 返回一行:
+    {"index": 0, "filename": "a.mp3", "status": "ok", "result": {...}}
+    单个文件失败时该行为 {"status": "error", "error": "..."}，不影响其他文件；
+    字幕默认不随结果返回，可通过 /api/results/{result_id}.{srt,vtt} 获取；
+    timeout 为每个文件的超时秒数，超时的文件该行为 {"status": "timeout"}；
+    每个文件在取得推理名额时按当时的负载和 max_latency 选择模型。
+    批量文件以 batch 优先级排队，在解码窗口之间可被实时和交互请求抢占。
+    decoding_profile 对全部文件生效。
+    客户端断开时取消全部未完成的文件
+    """
+    try:
+        profile = resolve_profile(decoding_profile, "batch")
+    except ValueError as e:
+        return profile_error(e)
+
+    # 流式响应期间仍需访问文件，因此自行管理临时目录，在流结束时清理
+    temp_dir = tempfile.mkdtemp()
+    try:
+        loop = asyncio.get_event_loop()
+        items = await loop.run_in_executor(None, lambda: collect_batch_items(files, temp_dir))
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    
+    batch_token = CancellationToken()
+    client = client_key(request)
+    
+    async def process(index: int, filename: str, audio_input: Any) -> Dict[str, Any]:
+        line = {"index": index, "filename": filename}
         try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            if isinstance(audio_input, Exception):
+                raise audio_input
+            async with inference_slots:
+                if isinstance(audio_input, PcmUpload):
+                    # 原始 PCM 在取得推理名额后才读取，同时载入内存的只有正在处理的文件
+                    pcm = audio_input
+                    audio_input = await asyncio.get_event_loop().run_in_executor(
+                        None, lambda: load_pcm_file(pcm.path, pcm.pcm_format)
+                    )
+                # 超时从取得推理名额时开始计算
+                cancel_token = Job("batch", client, timeout=timeout, parent=batch_token)
+                decision = await route_request(audio_input, max_latency, job=cancel_token, language=language)
+                with model_router.track(decision.model, decision.duration):
+                    result = await transcribe_diarized(
+                        audio_input,
+                        enable_diarization,
+                        decision.language,
+                        include_srt,
+                        cancel_token,
+                        decision.model,
+                        profile
+                    )
+                result["language_probability"] = decision.language_probability
+            line.update(status="ok", result=result)
+        except TranscriptionCancelled as e:
+            line.update(status="timeout" if e.timed_out else "cancelled", error=e.reason)
         except Exception as e:
-            logger.error(f"清理临时文件时出错: {str(e)}")
+            logger.error(f"批量转录 {filename} 时出错: {str(e)}")
+            line.update(status="error", error=str(e))
+        return line
+    
+    async def stream_results():
+        tasks = [asyncio.ensure_future(process(i, name, audio)) for i, (name, audio) in enumerate(items)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                line = await task
+                yield dumps(line) + "\n"
+        finally:
+            batch_token.cancel("客户端已断开连接")
+            for task in tasks:
+                task.cancel()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+class PcmUpload(NamedTuple):
+    """批量上传中保存到磁盘的原始 PCM 文件，处理时才读取"""
+    path: str
+    pcm_format: str
+
+
+def copy_limited(source: BinaryIO, target: BinaryIO, limit: int) -> int:
+    """
+    复制文件内容，超过 limit 字节时抛出 ValueError (不信任 zip 中声明的大小)
+
+    Returns:
+        复制的字节数
+    """
+    copied = 0
+    for block in iter(lambda: source.read(1 << 20), b""):
+        copied += len(block)
+        if copied > limit:
+            raise ValueError(f"文件超过大小上限 {limit // (1024 * 1024)} MB")
+        target.write(block)
+    return copied
+
+
+def collect_batch_items(files: List[UploadFile], temp_dir: str) -> List[Tuple[str, Any]]:
+    """
+    保存批量上传的文件并展开 zip 压缩包 (同步，在工作线程中调用)
+    
+    上传的文件从其临时文件分块写入 temp_dir，不整体读入内存；
+    文件数、单个文件大小和解压后的总大小受 BATCH_MAX_* 限制，
+    超过单个文件大小的文件记为错误，超过文件数或总大小时停止展开其余文件。
+    
+    Returns:
+        [(文件名, 音频路径 / PcmUpload / 错误), ...]
+    """
+    items: List[Tuple[str, Any]] = []
+    total = 0
+    truncated = False
+    
+    def full() -> bool:
+        return len(items) >= batch_max_files or total >= batch_max_total_bytes
+    
+    def save(name: str, source: BinaryIO, declared_size: Optional[int] = None) -> Optional[str]:
+        """保存一个文件，超过限制时记录错误；总大小用尽时返回 None"""
+        nonlocal total
+        limit = min(batch_max_file_bytes, batch_max_total_bytes - total)
+        if declared_size is not None and declared_size > limit:
+            items.append((name, ValueError(f"文件超过大小上限 ({declared_size} 字节)")))
+            return None
+        path = os.path.join(temp_dir, f"{len(items)}_{os.path.basename(name)}")
+        try:
+            with open(path, "wb") as target:
+                total += copy_limited(source, target, limit)
+        except ValueError as e:
+            os.remove(path)
+            items.append((name, e))
+            return None
+        return path
+    
+    for file in files:
+        if full():
+            truncated = True
+            break
+        filename = os.path.basename(file.filename or "audio")
+        
+        if filename.lower().endswith(".zip"):
+            try:
+                # 直接从上传的临时文件读取压缩包，不整体载入内存
+                with zipfile.ZipFile(file.file) as archive:
+                    for member in archive.infolist():
+                        name = os.path.basename(member.filename)
+                        if member.is_dir() or member.filename.startswith("__MACOSX") or not name:
+                            continue
+                        if full():
+                            truncated = True
+                            break
+                        if not transcriber.is_format_supported(name):
+                            items.append((member.filename, ValueError(f"不支持的文件格式: {name}")))
+                            continue
+                        with archive.open(member) as source:
+                            path = save(member.filename, source, member.file_size)
+                        if path is not None:
+                            items.append((member.filename, path))
+            except zipfile.BadZipFile as e:
+                items.append((filename, e))
+            continue
+        
+        try:
+            pcm_format = resolve_pcm_format(file.content_type)
+        except ValueError as e:
+            items.append((filename, e))
+            continue
+        
+        if not pcm_format and not transcriber.is_format_supported(filename):
+            items.append((filename, ValueError(f"不支持的文件格式: {filename}")))
+            continue
+        file.file.seek(0)
+        path = save(filename, file.file)
+        if path is not None:
+            items.append((filename, PcmUpload(path, pcm_format) if pcm_format else path))
+    
+    if truncated:
+        logger.warning(f"批量上传达到上限: {len(items)} 个文件, {total} 字节")
+        items.append(("", ValueError(
+            f"批量上传达到上限 (最多 {batch_max_files} 个文件，共 {batch_max_total_bytes // (1024 * 1024)} MB)，其余文件未处理"
+        )))
+    return items
 
 @app.post("/api/transcribe/youtube", response_model=DiarizedTranscriptionResponse)
 async def transcribe_youtube(
+    request: Request,
     url: str = Form(...),
     enable_diarization: bool = Form(True),
-    language: Optional[str] = Form(None)
+    language: Optional[str] = Form(None),
+    timeout: Optional[float] = Form(None),
+    max_latency: Optional[float] = Form(None),
+    decoding_profile: Optional[str] = Form(None)
 ):
     """
     從YouTube視頻URL轉錄音頻
+    
+    長影片以 batch 優先級排隊，解碼窗口之間可被即時和互動請求搶佔
     """
+    try:
+        profile = resolve_profile(decoding_profile, "youtube")
+    except ValueError as e:
+        return profile_error(e)
+    cancel_token = Job("batch", client_key(request), timeout=timeout)
+    watcher = asyncio.ensure_future(watch_disconnect(request, cancel_token))
     try:
         # 验证YouTube URL
         if not youtube_downloader.is_valid_youtube_url(url):
@@ -258,31 +1053,25 @@ async def transcribe_youtube(
         
         try:
             # 转录音频
-            transcription = await transcriber.transcribe_file(
-                temp_audio_path,
-                language=language
-            )
-            
-            segments = []
-            
-            # 不使用說話者識別，使用原始轉錄段落
-            for segment in transcription.get("segments", []):
-                segments.append(DiarizationSegment(
-                    speaker="UNKNOWN",
-                    start=segment["start"],
-                    end=segment["end"],
-                    text=segment["text"]
-                ))
-            
-            # 生成 SRT 格式內容
-            srt_content = transcriber.format_result(transcription, format_type="srt")
+            decision = await route_request(temp_audio_path, max_latency, job=cancel_token, language=language)
+            with model_router.track(decision.model, decision.duration):
+                transcription = await transcribers[decision.model].transcribe_file(
+                    temp_audio_path,
+                    language=decision.language,
+                    cancel_token=cancel_token,
+                    profile=profile
+                )
             
-            # 返回結果
-            return {
-                "text": transcription["text"],
-                "segments": segments,
-                "srt": srt_content
-            }
+            # 不使用說話者識別，使用原始轉錄段落，返回結果
+            return CompactJSONResponse(build_result(
+                transcription["text"],
+                plain_segments(transcription),
+                language=transcription.get("language"),
+                speaker_labels=False,
+                model=decision.model,
+                language_probability=decision.language_probability,
+                decoding=transcription.get("decoding")
+            ))
                 
         finally:
             # 清理臨時文件
@@ -293,90 +1082,312 @@ async def transcribe_youtube(
             except Exception as e:
                 logger.error(f"清理臨時文件時出錯: {str(e)}")
                 
+    except TranscriptionCancelled as e:
+        return cancelled_response(e)
     except Exception as e:
         logger.error(f"YouTube轉錄過程中出錯: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        watcher.cancel()
 
 @app.websocket("/api/transcribe/ws/{client_id}")
 async def transcribe_websocket(websocket: WebSocket, client_id: str):
     """
     WebSocket端点，用于实时转录
+    
+    二进制消息为音频块 (编码后的音频文件，或按 audio_format 声明的 16kHz 单声道原始 PCM)；
+    文本消息为 JSON 控制消息:
+    {"type": "config", "data": {"language": ..., "prompt": ..., "language_threshold": ..., "context_chars": ..., "audio_format": ..., "timeout": ..., "decoding_profile": ...}}
+    {"type": "reset"}
+    
+    音频块按接收顺序在后台依次转录，接收循环不被阻塞，因此转录期间也能发现连接关闭，
+    此时取消正在进行的转录并释放模型；等待转录的音频块超过 WEBSOCKET_MAX_PENDING_CHUNKS 时，
+    新的音频块被丢弃并返回错误消息，客户端发送过快时服务器内存不会无限增长
     """
     await websocket.accept()
     
-    # 存储WebSocket连接
-    websocket_connections[client_id] = websocket
+    # 存储WebSocket会话 (语言、上下文和说话者状态)
+    session = TranscriptionSession(client_id, websocket, OnlineSpeakerTracker(speaker_embedder))
+    websocket_connections[client_id] = session
+    
+    # 待转录的音频块 (数据, 接收时的音频格式)
+    chunks: "asyncio.Queue[Tuple[bytes, str]]" = asyncio.Queue(maxsize=websocket_max_pending_chunks)
+    
+    async def process_chunks():
+        while True:
+            data, audio_format = await chunks.get()
+            await transcribe_session_chunk(session, data, audio_format)
+    
+    worker = asyncio.ensure_future(process_chunks())
     
     try:
-        # 等待客户端发送音频文件
+        # 等待客户端发送音频文件或控制消息
         while True:
-            # 接收上传的文件
-            data = await websocket.receive_bytes()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
             
-            # 创建临时文件
-            temp_dir = tempfile.mkdtemp()
-            temp_path = os.path.join(temp_dir, f"audio_{uuid.uuid4()}.wav")
+            if message.get("text") is not None:
+                await handle_session_message(session, message["text"])
+                continue
             
-            try:
-                # 保存文件
-                with open(temp_path, "wb") as f:
-                    f.write(data)
-                
-                # 定义进度回调
-                async def progress_callback(progress: float):
-                    await websocket.send_json({
-                        "type": "progress",
-                        "data": {"progress": progress}
-                    })
-                
-                # 定义段落回调
-                async def segment_callback(segment: Dict[str, Any]):
+            data = message.get("bytes")
+            if data:
+                try:
+                    chunks.put_nowait((data, session.audio_format))
+                except asyncio.QueueFull:
+                    metrics.inc("websocket_chunks_dropped_total")
                     await websocket.send_json({
-                        "type": "segment",
+                        "type": "error",
                         "data": {
-                            "text": segment["text"],
-                            "start": segment["start"],
-                            "end": segment["end"]
+                            "error": f"待转录的音频块已达上限 ({chunks.maxsize})，此音频块已丢弃",
+                            "dropped": True
                         }
                     })
-                
-                # 转录音频
-                result = await transcriber.transcribe_file(
-                    temp_path,
-                    progress_callback=progress_callback
-                )
-                
-                # 发送完整结果
-                await websocket.send_json({
-                    "type": "complete",
-                    "data": {
-                        "text": result["text"],
-                        "segments": result.get("segments", [])
-                    }
-                })
-                
-            except Exception as e:
-                logger.error(f"WebSocket转录过程中出错: {str(e)}")
-                await websocket.send_json({
-                    "type": "error",
-                    "data": {"error": str(e)}
-                })
-            finally:
-                # 清理临时文件
-                try:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    os.rmdir(temp_dir)
-                except Exception as e:
-                    logger.error(f"清理临时文件时出错: {str(e)}")
     
     except Exception as e:
         logger.error(f"WebSocket连接出错: {str(e)}")
     finally:
-        # 移除WebSocket连接
+        # 取消正在进行的转录，移除WebSocket会话
+        session.close()
+        worker.cancel()
         if client_id in websocket_connections:
             del websocket_connections[client_id]
 
+async def transcribe_session_chunk(session: TranscriptionSession, data: bytes, audio_format: str):
+    """转录 WebSocket 会话的一个音频块，并发送段落和完整结果"""
+    websocket = session.websocket
+    cancel_token = session.chunk_token()
+    temp_dir = None
+    
+    try:
+        # 定义进度回调
+        async def progress_callback(progress: float):
+            await websocket.send_json({
+                "type": "progress",
+                "data": {"progress": progress}
+            })
+        
+        # 定义段落回调
+        async def segment_callback(segment: Dict[str, Any]):
+            await websocket.send_json({
+                "type": "segment",
+                "data": {
+                    "text": segment["text"],
+                    "start": segment["start"],
+                    "end": segment["end"],
+                    "speaker": segment.get("speaker", "UNKNOWN")
+                }
+            })
+        
+        # 解码音频，供转录和说话者识别共用
+        loop = asyncio.get_event_loop()
+        if audio_format in PCM_FORMATS:
+            # 原始 PCM 直接包装为波形，不写临时文件、不启动 ffmpeg
+            audio = pcm_to_array(data, audio_format)
+        else:
+            # 编码后的音频需要保存为临时文件交给 ffmpeg 解码
+            temp_dir = tempfile.mkdtemp()
+            temp_path = os.path.join(temp_dir, f"audio_{uuid.uuid4()}.wav")
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            audio = await loop.run_in_executor(None, lambda: whisper.load_audio(temp_path))
+        
+        # 语言未锁定时由语言识别阶段检测，可信后锁定，之后的音频块不再检测
+        cancel_token.check()
+        decision = await route_request(audio, job=cancel_token, language=session.language)
+        language = decision.language
+        probability = decision.language_probability
+        if (
+            not session.language_locked and language is not None
+            and probability is not None and probability >= session.language_threshold
+        ):
+            session.lock_language(language, probability)
+        
+        # 转录音频，携带会话上下文
+        with model_router.track(decision.model, decision.duration):
+            result = await transcribers[decision.model].transcribe_audio(
+                audio,
+                language=language,
+                prompt=session.initial_prompt(),
+                progress_callback=progress_callback,
+                cancel_token=cancel_token,
+                profile=session.decoding_profile or endpoint_profiles["websocket"]
+            )
+        session.append_text(result.get("text", ""))
+        
+        # 增量说话者识别：每个片段只与会话内已有的说话者质心比较
+        def label_speakers():
+            speaker = "UNKNOWN"
+            for segment in result.get("segments", []):
+                cancel_token.check()
+                clip = audio[int(segment["start"] * SAMPLE_RATE):int(segment["end"] * SAMPLE_RATE)]
+                # 过短的片段沿用上一个说话者
+                speaker = session.speaker_tracker.identify(clip) or speaker
+                segment["speaker"] = speaker
+        
+        await run_cancellable(loop.run_in_executor(None, label_speakers), cancel_token)
+        
+        for segment in result.get("segments", []):
+            await segment_callback(segment)
+        
+        # 保存并发送完整结果，段落只包含客户端使用的字段
+        segments = SegmentTable.from_segments(result.get("segments", []))
+        result_id = result_store.save(result["text"], segments, language=language, model=decision.model)
+        await websocket.send_text(dumps({
+            "type": "complete",
+            "data": {
+                "text": result["text"],
+                "segments": segments.to_list(),
+                "language": language,
+                "language_probability": probability,
+                "result_id": result_id,
+                "model": decision.model,
+                "decoding": result.get("decoding")
+            }
+        }))
+    
+    except TranscriptionCancelled as e:
+        logger.info(f"会话 {session.client_id} 的转录已取消: {e.reason}")
+        if e.timed_out:
+            await websocket.send_json({
+                "type": "error",
+                "data": {"error": e.reason, "timed_out": True}
+            })
+    except Exception as e:
+        logger.error(f"WebSocket转录过程中出错: {str(e)}")
+        await websocket.send_json({
+            "type": "error",
+            "data": {"error": str(e)}
+        })
+    finally:
+        # 清理临时文件
+        if temp_dir:
+            try:
+                for name in os.listdir(temp_dir):
+                    os.remove(os.path.join(temp_dir, name))
+                os.rmdir(temp_dir)
+            except Exception as e:
+                logger.error(f"清理临时文件时出错: {str(e)}")
+
+async def handle_session_message(session: TranscriptionSession, text: str):
+    """处理 WebSocket 会话的 JSON 控制消息"""
+    try:
+        message = json.loads(text)
+        if message.get("type") == "config":
+            session.apply_config(message.get("data", {}))
+        elif message.get("type") == "reset":
+            session.reset()
+        else:
+            raise ValueError(f"未知的消息类型: {message.get('type')}")
+        
+        await session.websocket.send_json({
+            "type": "config",
+            "data": session.describe()
+        })
+    except Exception as e:
+        logger.error(f"处理会话消息时出错: {str(e)}")
+        await session.websocket.send_json({
+            "type": "error",
+            "data": {"error": str(e)}
+        })
+
+@app.get("/api/results/{result_id}.{format_type}")
+async def get_result(result_id: str, format_type: str, download: bool = False):
+    """
+    以指定格式返回已保存的转录结果 (json, txt, srt, vtt, verbose_json)
+    
+    格式由保存的段落按需生成，改变输出格式不需要重新转录
+    """
+    result = await result_store.aget(result_id)
+    if result is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "结果不存在", "detail": f"未找到结果 {result_id}，可能已过期"}
+        )
+    if format_type not in RESULT_FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "不支持的格式", "detail": f"支持的格式: {', '.join(RESULT_FORMATS)}"}
+        )
+    
+    content, media_type = render_result(result, format_type)
+    headers = {}
+    if download:
+        extension = "json" if format_type == "verbose_json" else format_type
+        headers["Content-Disposition"] = f'attachment; filename="{result_id}.{extension}"'
+    return StreamingResponse(content, media_type=media_type, headers=headers)
+
+@app.get("/api/results/{result_id}")
+async def get_result_json(result_id: str):
+    """返回已保存的转录结果 (verbose_json)"""
+    return await get_result(result_id, "verbose_json")
+
+@app.on_event("shutdown")
+async def close_transcript_index():
+    """写完尚未写入索引的结果"""
+    if transcript_index is not None:
+        transcript_index.close()
+
+@app.get("/api/search")
+async def search_transcripts(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    speaker: Optional[str] = None,
+    language: Optional[str] = None,
+    result_id: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    order: str = "recent"
+):
+    """
+    全文搜索已保存的转录段落
+    
+    返回匹配的段落及其结果 ID、时间码和高亮片段 (匹配文字以 <mark> 标记)；
+    可按说话者、语言、结果 ID 和时间范围 (秒) 过滤。
+    order 为 recent (默认，最新的转录优先) 或 relevance (按相关度)
+    """
+    if transcript_index is None:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "转录索引未启用", "detail": "请设置 TRANSCRIPT_INDEX_PATH"}
+        )
+    
+    limit = max(1, min(limit, 200))
+    started = time.perf_counter()
+    loop = asyncio.get_event_loop()
+    try:
+        found = await loop.run_in_executor(None, lambda: transcript_index.search(
+            q,
+            limit=limit,
+            offset=max(0, offset),
+            speaker=speaker,
+            language=language,
+            transcript_id=result_id,
+            start=start,
+            end=end,
+            order=order
+        ))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": "无效的搜索参数", "detail": str(e)})
+    took = time.perf_counter() - started
+    metrics.observe("search_latency_seconds", took)
+    return CompactJSONResponse({"query": q, "took_ms": round(took * 1000, 2), **found})
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """返回服务指标: 路由决策、各模型的负载与实时率、调度队列、转录耗时"""
+    snapshot = {"models": model_router.snapshot()}
+    if transcript_index is not None:
+        snapshot["transcript_index"] = transcript_index.stats()
+    if broker is not None:
+        # 调度在推理节点上进行，这里给出队列深度和在线节点
+        snapshot["broker"] = broker.snapshot()
+    else:
+        snapshot["scheduler"] = {name: model.pool.scheduler.snapshot() for name, model in transcribers.items()}
+    return {**snapshot, **metrics.snapshot()}
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """全局异常处理器"""
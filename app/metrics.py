@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+# 指标键: (名称, ((标签名, 标签值), ...))
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def _format_key(key: MetricKey) -> str:
+    """格式化为 name{label="value",...}"""
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
+
+
+class Metrics:
+    """
+    进程内的服务指标
+
+    计数器、仪表和耗时摘要 (保留最近的观测值计算分位数)，通过 /api/metrics 以 JSON 输出。
+    """
+
+    def __init__(self, window: int = 1024):
+        """
+        初始化指标
+
+        Args:
+            window: 每个摘要保留的最近观测值数量
+        """
+        self.window = window
+        self.started_at = time.time()
+        self._counters: Dict[MetricKey, float] = {}
+        self._gauges: Dict[MetricKey, float] = {}
+        self._summaries: Dict[MetricKey, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """累加计数器"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """设置仪表的当前值"""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """记录一次观测值 (如耗时)"""
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {"count": 0, "sum": 0.0, "recent": deque(maxlen=self.window)}
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["recent"].append(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回全部指标的当前值"""
+        with self._lock:
+            counters = {_format_key(key): value for key, value in self._counters.items()}
+            gauges = {_format_key(key): value for key, value in self._gauges.items()}
+            summaries = {}
+            for key, summary in self._summaries.items():
+                recent = np.fromiter(summary["recent"], dtype=np.float64)
+                p50, p95, p99 = np.percentile(recent, [50, 95, 99]) if len(recent) else (0.0, 0.0, 0.0)
+                summaries[_format_key(key)] = {
+                    "count": summary["count"],
+                    "mean": summary["sum"] / summary["count"],
+                    "p50": float(p50),
+                    "p95": float(p95),
+                    "p99": float(p99)
+                }
+        return {
+            "uptime": time.time() - self.started_at,
+            "counters": counters,
+            "gauges": gauges,
+            "summaries": summaries
+        }
+
+
+# 全局指标实例
+metrics = Metrics()
@@ -15,6 +15,11 @@ class TranscriptionRequest(BaseModel):
 class TranscriptionResponse(BaseModel):
     """兼容OpenAI API的转录响应模型"""
     text: str
+    result_id: Optional[str] = None  # 已保存结果的 ID，可通过 /api/results 获取其他格式
+    model: Optional[str] = None  # 实际使用的模型
+    language: Optional[str] = None  # 转录语言 (指定或检测的)
+    language_probability: Optional[float] = None  # 语言识别的置信度，指定语言时为空
+    decoding: Optional[Dict[str, Any]] = None  # 解码统计 (解码配置、窗口数、温度回退的窗口数)
 
 
 class DiarizationSegment(BaseModel):
@@ -30,6 +35,11 @@ class DiarizedTranscriptionResponse(BaseModel):
     text: str
     segments: List[DiarizationSegment]
     srt: Optional[str] = None  # 添加 SRT 字幕内容字段
+    result_id: Optional[str] = None  # 已保存结果的 ID，可通过 /api/results 获取其他格式
+    model: Optional[str] = None  # 实际使用的模型
+    language: Optional[str] = None  # 转录语言 (指定或检测的)
+    language_probability: Optional[float] = None  # 语言识别的置信度，指定语言时为空
+    decoding: Optional[Dict[str, Any]] = None  # 解码统计 (解码配置、窗口数、温度回退的窗口数)
 
 
 class WebSocketMessage(BaseModel):
@@ -0,0 +1,124 @@
+import logging
+import threading
+from typing import List, Optional
+import numpy as np
+
+from .local_diarization import SpeakerEmbedder, speech_windows, SAMPLE_RATE
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class OnlineSpeakerTracker:
+    """
+    增量说话者识别，每个 WebSocket 会话一个实例
+
+    会话内保存每位说话者的嵌入质心，新的语音片段只需与现有质心比较：
+    距离足够近时归入该说话者并更新质心，否则创建新说话者。
+    每个片段的开销与会话时长无关，无需对整段录音重新聚类。
+    会话累计的窗口数达到 min_samples 前，各维标准差的估计不可靠
+    (两个样本时标准化距离恒为 √2)，此时改用余弦距离比较。
+    """
+
+    def __init__(
+        self,
+        embedder: SpeakerEmbedder,
+        threshold: float = 1.0,
+        max_speakers: int = 8,
+        min_duration: float = 0.5,
+        min_samples: int = 32,
+        cosine_threshold: float = 0.5
+    ):
+        """
+        初始化说话者跟踪器
+
+        Args:
+            embedder: 共享的说话者嵌入提取器
+            threshold: 判定为同一说话者的最大标准化距离
+            max_speakers: 会话内说话者数量上限
+            min_duration: 短于此长度 (秒) 的片段不做识别
+            min_samples: 使用标准化距离所需的最少窗口数
+            cosine_threshold: 窗口数不足时判定为同一说话者的最大余弦距离
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self.min_duration = min_duration
+        self.min_samples = min_samples
+        self.cosine_threshold = cosine_threshold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """清除会话内的说话者，开始新的录音"""
+        with self._lock:
+            # 每位说话者的嵌入和与窗口数
+            self.sums: List[np.ndarray] = []
+            self.counts: List[int] = []
+
+            # 会话内全部窗口嵌入的均值与方差 (Welford)，用于标准化距离
+            self._n = 0
+            self._mean: Optional[np.ndarray] = None
+            self._m2: Optional[np.ndarray] = None
+
+    @property
+    def num_speakers(self) -> int:
+        return len(self.sums)
+
+    def _update_stats(self, embeddings: np.ndarray) -> None:
+        """合并一批窗口嵌入到会话统计量"""
+        count = len(embeddings)
+        batch_mean = embeddings.mean(axis=0)
+        batch_m2 = ((embeddings - batch_mean) ** 2).sum(axis=0)
+        if self._n == 0:
+            self._n, self._mean, self._m2 = count, batch_mean, batch_m2
+            return
+        total = self._n + count
+        delta = batch_mean - self._mean
+        self._mean = self._mean + delta * count / total
+        self._m2 = self._m2 + batch_m2 + delta ** 2 * self._n * count / total
+        self._n = total
+
+    def identify(self, audio: np.ndarray) -> Optional[str]:
+        """
+        识别一段语音的说话者
+
+        Args:
+            audio: 16kHz 单声道波形片段
+
+        Returns:
+            说话者标签 (SPEAKER_00, SPEAKER_01, ...)，片段过短时返回 None
+        """
+        duration = len(audio) / SAMPLE_RATE
+        if duration < self.min_duration:
+            return None
+
+        windows = speech_windows([(0.0, duration)])
+        embeddings = self.embedder.embed(audio, windows, normalize=False)
+
+        with self._lock:
+            self._update_stats(embeddings)
+            embedding = embeddings.mean(axis=0)
+            count = len(embeddings)
+
+            if self.sums:
+                centroids = np.stack(self.sums) / np.array(self.counts)[:, None]
+                if self._n >= self.min_samples:
+                    std = np.sqrt(self._m2 / (self._n - 1)) + 1e-6
+                    distances = np.sqrt((((centroids - embedding) / std) ** 2).mean(axis=1))
+                    threshold = self.threshold
+                else:
+                    norms = np.linalg.norm(centroids, axis=1) * np.linalg.norm(embedding) + 1e-10
+                    distances = 1.0 - centroids @ embedding / norms
+                    threshold = self.cosine_threshold
+                best = int(distances.argmin())
+                if distances[best] <= threshold or self.num_speakers >= self.max_speakers:
+                    self.sums[best] = self.sums[best] + embedding * count
+                    self.counts[best] += count
+                    return f"SPEAKER_{best:02d}"
+
+            self.sums.append(embedding * count)
+            self.counts.append(count)
+            logger.info(f"会话中出现新的说话者: SPEAKER_{self.num_speakers - 1:02d}")
+            return f"SPEAKER_{self.num_speakers - 1:02d}"
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union, Callable, AsyncIterator
+
+import numpy as np
+import whisper
+
+from .broker import FileBroker
+from .cancellation import CancellationToken, TranscriptionCancelled
+from .decoding import record_stats
+from .diarization import SpeakerDiarization
+from .scheduler import find_job
+from .transcriber import WhisperTranscriber, SUPPORTED_FORMATS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(Exception):
+    """推理节点处理任务失败"""
+
+
+async def run_remote(
+    broker: FileBroker,
+    kind: str,
+    model: str,
+    audio: Any,
+    options: Optional[Dict[str, Any]] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    poll_interval: float = 0.05
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    提交任务并逐个产出推理节点发回的事件，直到 result 事件
+
+    令牌被取消、超时或调用方停止迭代时撤回任务或通知推理节点停止；
+    任务的优先级、客户端和截止时间取自令牌，推理节点按相同规则调度。
+    任务队列的文件读写 (可能位于 NFS) 均在工作线程中执行，不阻塞事件循环。
+
+    Raises:
+        TranscriptionCancelled: 任务被取消或超时
+        WorkerError: 推理节点处理失败
+    """
+    job = find_job(cancel_token)
+    remaining = cancel_token.remaining() if cancel_token is not None else None
+    loop = asyncio.get_event_loop()
+    task_id = await loop.run_in_executor(None, lambda: broker.submit(
+        kind,
+        model,
+        audio,
+        options,
+        priority=job.priority if job else "interactive",
+        client_id=job.client_id if job else "anonymous",
+        cost=job.cost if job else 1.0,
+        deadline=time.time() + remaining if remaining is not None else None
+    ))
+
+    offset = 0
+    finished = False
+    try:
+        while True:
+            if cancel_token is not None and cancel_token.cancelled:
+                reason = cancel_token.reason or "任务已取消"
+                await loop.run_in_executor(None, lambda: broker.cancel(task_id, reason))
+                cancel_token.check()
+
+            events, offset = await loop.run_in_executor(None, lambda: broker.read_events(task_id, offset))
+            for event in events:
+                if event["type"] == "error":
+                    finished = True
+                    if event.get("cancelled"):
+                        raise TranscriptionCancelled(event["error"], timed_out=event.get("timed_out", False))
+                    raise WorkerError(event["error"])
+                if event["type"] == "result":
+                    finished = True
+                yield event
+                if finished:
+                    return
+
+            await asyncio.sleep(poll_interval)
+    finally:
+        try:
+            if not finished:
+                # 调用方提前结束 (如客户端断开)
+                await loop.run_in_executor(None, lambda: broker.cancel(task_id, "调用方已停止接收结果"))
+        finally:
+            await loop.run_in_executor(None, lambda: broker.discard(task_id))
+
+
+async def call_remote(
+    broker: FileBroker,
+    kind: str,
+    model: str,
+    audio: Any,
+    options: Optional[Dict[str, Any]] = None,
+    cancel_token: Optional[CancellationToken] = None,
+    progress_callback: Optional[Callable[[float], Any]] = None
+) -> Any:
+    """提交任务并等待结果"""
+    events = run_remote(broker, kind, model, audio, options, cancel_token)
+    try:
+        async for event in events:
+            if event["type"] == "progress" and progress_callback:
+                await progress_callback(event["progress"])
+            elif event["type"] == "result":
+                return event["data"]
+    finally:
+        await events.aclose()
+
+
+class RemoteTranscriber:
+    """
+    通过任务队列交给推理节点执行的转录器
+
+    接口与 WhisperTranscriber 相同，API 前端在分布式模式下用它替换本地模型，
+    端点代码无需区分两种模式
+    """
+
+    format_result = staticmethod(WhisperTranscriber.format_result)
+
+    def __init__(self, broker: FileBroker, model_name: str, replicas: int = 1):
+        """
+        初始化远程转录器
+
+        Args:
+            broker: 任务队列
+            model_name: 推理节点上的模型名称
+            replicas: 推理节点上该模型的副本总数，用于路由和批量并发
+        """
+        self.broker = broker
+        self.model_name = model_name
+        self.replicas = replicas
+
+    def is_format_supported(self, filename: str) -> bool:
+        """检查文件格式是否支持"""
+        ext = Path(filename).suffix.lower().lstrip(".")
+        return ext in SUPPORTED_FORMATS
+
+    async def transcribe_file(
+        self,
+        file_path: str,
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        temperature: float = 0.0,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        profile: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """转录音频文件"""
+        if not self.is_format_supported(file_path):
+            raise ValueError(f"不支持的文件格式: {file_path}")
+
+        return await self.transcribe_audio(
+            file_path,
+            language=language,
+            prompt=prompt,
+            temperature=temperature,
+            progress_callback=progress_callback,
+            cancel_token=cancel_token,
+            profile=profile
+        )
+
+    async def transcribe_audio(
+        self,
+        audio: Union[str, np.ndarray],
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        temperature: float = 0.0,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        profile: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """转录音频文件或已解码的 16kHz 单声道波形"""
+        options = {"language": language, "prompt": prompt, "temperature": temperature, "profile": profile}
+        result = await call_remote(
+            self.broker, "transcribe", self.model_name, audio, options, cancel_token, progress_callback
+        )
+        # 推理节点的指标在其进程内，前端另行累加解码统计
+        record_stats(result.get("decoding"), self.model_name)
+        return result
+
+    async def detect_language(
+        self,
+        audio: np.ndarray,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[str, float]:
+        """检测音频前 30 秒的语言，只发送这 30 秒"""
+        language, probability = await call_remote(
+            self.broker,
+            "detect_language",
+            self.model_name,
+            audio[:whisper.audio.N_SAMPLES],
+            cancel_token=cancel_token
+        )
+        return language, probability
+
+    async def transcribe_windows(
+        self,
+        audio: Union[str, np.ndarray],
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        temperature: float = 0.0,
+        cancel_token: Optional[CancellationToken] = None,
+        profile: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """按 30 秒窗口逐段转录，推理节点每解码完一个窗口即发回其段落"""
+        options = {"language": language, "prompt": prompt, "temperature": temperature, "profile": profile}
+        events = run_remote(self.broker, "windows", self.model_name, audio, options, cancel_token)
+        decoding = None
+        try:
+            async for event in events:
+                if event["type"] == "window":
+                    decoding = event["data"].get("decoding")
+                    yield event["data"]
+        finally:
+            await events.aclose()
+            record_stats(decoding, self.model_name)
+
+
+class RemoteDiarization:
+    """通过任务队列交给推理节点执行的说话者识别，接口与 SpeakerDiarization 相同"""
+
+    merge_with_transcription = staticmethod(SpeakerDiarization.merge_with_transcription)
+
+    def __init__(self, broker: FileBroker, model_name: str):
+        """
+        初始化远程说话者识别
+
+        Args:
+            broker: 任务队列
+            model_name: 推理节点上用于转录和对齐的模型名称
+        """
+        self.broker = broker
+        self.model_name = model_name
+
+    async def diarize(
+        self,
+        audio_path: Union[str, np.ndarray],
+        transcription: Optional[Dict] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        language: Optional[str] = None,
+        profile: Optional[str] = None
+    ) -> Dict:
+        """对音频进行说话者识别，可附带已有的转录结果"""
+        result = await call_remote(
+            self.broker,
+            "diarize",
+            self.model_name,
+            audio_path,
+            {"transcription": transcription, "language": language, "profile": profile},
+            cancel_token
+        )
+        record_stats(result.get("decoding"), self.model_name)
+        return result
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterator, Tuple, Union
+
+from .segments import SegmentTable, dumps
+from .subtitles import iter_subtitles
+from .transcript_index import TranscriptIndex
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 可按需渲染的结果格式及其 MIME 类型
+RESULT_FORMATS = {
+    "json": "application/json",
+    "verbose_json": "application/json",
+    "txt": "text/plain; charset=utf-8",
+    "srt": "application/x-subrip; charset=utf-8",
+    "vtt": "text/vtt; charset=utf-8",
+}
+
+
+class ResultStore:
+    """
+    已完成转录结果的存储
+
+    结果按 ID 保存段落，之后可按需渲染为任意格式，改变输出格式不需要重新转录。
+    内存中超出容量时淘汰最久未访问的结果；提供转录索引时结果同时写入索引，
+    被淘汰的结果从索引读回。
+    """
+
+    def __init__(self, max_results: int = 256, index: Optional[TranscriptIndex] = None):
+        """
+        初始化结果存储
+
+        Args:
+            max_results: 内存中最多保存的结果数
+            index: 持久化的转录索引
+        """
+        self.max_results = max_results
+        self.index = index
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(
+        self,
+        text: str,
+        segments: Union[SegmentTable, List[Dict[str, Any]]],
+        language: Optional[str] = None,
+        duration: Optional[float] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """
+        保存转录结果
+
+        Args:
+            text: 完整文本
+            segments: 段落表或段落字典 (start, end, text, speaker)
+            language: 语言代码
+            duration: 音频时长 (秒)
+            model: 使用的模型，记录在转录索引中
+
+        Returns:
+            结果 ID
+        """
+        result_id = uuid.uuid4().hex
+        segments = SegmentTable.from_segments(segments)
+        result = {
+            "id": result_id,
+            "created_at": time.time(),
+            "text": text,
+            "language": language,
+            "duration": duration if duration is not None else segments.duration,
+            "segments": segments
+        }
+
+        with self._lock:
+            self._results[result_id] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        if self.index is not None:
+            self.index.add(result, model=model)
+        return result_id
+
+    def _get_cached(self, result_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._results.get(result_id)
+            if result is not None:
+                self._results.move_to_end(result_id)
+            return result
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """获取结果，不存在时返回 None；内存中没有时同步读取转录索引，异步代码中请使用 aget"""
+        result = self._get_cached(result_id)
+        if result is None and self.index is not None:
+            return self.index.get(result_id)
+        return result
+
+    async def aget(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """获取结果，内存中没有时在线程池中读取转录索引，不阻塞事件循环"""
+        result = self._get_cached(result_id)
+        if result is None and self.index is not None:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, lambda: self.index.get(result_id))
+        return result
+
+
+def render_result(result: Dict[str, Any], format_type: str) -> Tuple[Iterator[str], str]:
+    """
+    将存储的结果渲染为指定格式
+
+    Args:
+        result: ResultStore 中保存的结果
+        format_type: 输出格式 (json, verbose_json, txt, srt, vtt)
+
+    Returns:
+        (内容片段迭代器, MIME 类型)
+    """
+    if format_type not in RESULT_FORMATS:
+        raise ValueError(f"不支持的格式: {format_type}，支持: {', '.join(RESULT_FORMATS)}")
+
+    segments = result["segments"]
+    if format_type in ("srt", "vtt"):
+        content = iter_subtitles(segments, format_type, speaker_labels=segments.has_speakers)
+    elif format_type == "txt":
+        content = iter([result["text"]])
+    elif format_type == "json":
+        content = iter([dumps({"text": result["text"]})])
+    else:
+        content = iter([dumps({
+            "task": "transcribe",
+            "language": result["language"],
+            "duration": result["duration"],
+            "text": result["text"],
+            "segments": segments.to_list(with_id=True)
+        })])
+    return content, RESULT_FORMATS[format_type]
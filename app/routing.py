@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional
+
+from .metrics import Metrics, metrics as default_metrics
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 模型从小到大的顺序，越大越准确
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large", "turbo"]
+
+# 尚未测量时各模型实时率 (处理时间 / 音频时长) 的先验估计 (CPU)
+PRIOR_RTF = {
+    "tiny": 0.05,
+    "base": 0.1,
+    "small": 0.3,
+    "medium": 0.8,
+    "large": 1.6,
+    "turbo": 0.6,
+}
+
+
+def model_size(name: str) -> str:
+    """模型名称对应的尺寸 (如 base.en -> base, large-v3 -> large)"""
+    base = name.split(".")[0].split("-")[0]
+    return base if base in MODEL_SIZES else "small"
+
+
+def size_rank(name: str) -> int:
+    return MODEL_SIZES.index(model_size(name))
+
+
+def is_english_only(name: str) -> bool:
+    """只支持英语的模型 (如 base.en)"""
+    return name.endswith(".en")
+
+
+@dataclass
+class RoutingDecision:
+    """一次模型选择的结果"""
+    model: str
+    estimated_latency: float
+    reason: str
+    duration: float = 0.0
+    # 转录使用的语言 (客户端指定或语言识别的结果)，None 时由模型自行检测
+    language: Optional[str] = None
+    # 语言识别的置信度，客户端指定语言时为 None
+    language_probability: Optional[float] = None
+
+
+class ModelRouter:
+    """
+    按负载和截止时间为每个请求选择模型
+
+    每个模型记录正在处理的音频总时长和实测的实时率 (RTF，指数移动平均)，
+    据此估计新请求的排队等待与处理时间。选择预计能在延迟预算内完成的最大模型；
+    都无法满足时选择预计最快完成的模型。流量高峰时宁可用较小的模型快速返回，
+    也不让请求在大模型的队列中等待。
+
+    同一尺寸可同时加载多语言模型和 .en 模型 (如 small 和 small.en)：
+    已知为英语的音频使用 .en 模型 (同尺寸下更快、更准确)，其他音频只使用多语言模型。
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, int],
+        latency_target: float = 30.0,
+        smoothing: float = 0.2,
+        metrics: Optional[Metrics] = None
+    ):
+        """
+        初始化路由器
+
+        Args:
+            models: 模型名称 -> 副本数
+            latency_target: 客户端未提供 max_latency 时的延迟预算 (秒)
+            smoothing: 实时率移动平均的权重
+            metrics: 记录路由决策的指标实例
+        """
+        if not models:
+            raise ValueError("至少需要一个模型")
+        self.replicas = dict(models)
+        # 按准确度从高到低排列，同一尺寸的多语言模型在前
+        self.models: List[str] = sorted(
+            models, key=lambda name: (size_rank(name), not is_english_only(name)), reverse=True
+        )
+        self.latency_target = latency_target
+        self.smoothing = smoothing
+        self.metrics = metrics or default_metrics
+
+        self.rtf: Dict[str, float] = {name: PRIOR_RTF[model_size(name)] for name in self.models}
+        self.measured: Dict[str, bool] = {name: False for name in self.models}
+        self.outstanding: Dict[str, float] = {name: 0.0 for name in self.models}
+        self.in_flight: Dict[str, int] = {name: 0 for name in self.models}
+        self._lock = threading.Lock()
+
+    @property
+    def default_model(self) -> str:
+        """最准确的模型"""
+        return self.models[0]
+
+    def resolve(self, requested: Optional[str]) -> Optional[str]:
+        """将客户端指定的模型名称 (如 whisper-base) 映射到已加载的模型，未加载时返回 None"""
+        if not requested:
+            return None
+        name = requested[len("whisper-"):] if requested.startswith("whisper-") else requested
+        return name if name in self.replicas else None
+
+    def variant(self, model: str, language: Optional[str]) -> str:
+        """
+        同一尺寸中适合该语言的已加载模型: 英语使用 .en 模型，其他语言使用多语言模型，
+        对应的变体未加载或语言未知时返回原模型
+        """
+        if language == "en" and not is_english_only(model) and f"{model}.en" in self.replicas:
+            return f"{model}.en"
+        if language != "en" and is_english_only(model) and model[:-len(".en")] in self.replicas:
+            return model[:-len(".en")]
+        return model
+
+    def candidates(self, language: Optional[str]) -> List[str]:
+        """
+        可用于该语言的模型 (按准确度从高到低)
+
+        英语音频的各尺寸优先使用 .en 模型；其他或未知语言的音频不使用 .en 模型
+        (只加载了 .en 模型时除外)
+        """
+        if language == "en":
+            return [name for name in self.models if self.variant(name, "en") == name]
+        multilingual = [name for name in self.models if not is_english_only(name)]
+        return multilingual or list(self.models)
+
+    def estimate(self, model: str, duration: float) -> float:
+        """估计新请求在该模型上的完成时间: 排队等待 + 自身处理时间"""
+        rtf = self.rtf[model]
+        wait = 0.0
+        if self.in_flight[model] >= self.replicas[model]:
+            wait = self.outstanding[model] * rtf / self.replicas[model]
+        return wait + duration * rtf
+
+    def choose(
+        self,
+        duration: float,
+        max_latency: Optional[float] = None,
+        requested: Optional[str] = None,
+        language: Optional[str] = None
+    ) -> RoutingDecision:
+        """
+        为一个请求选择模型
+
+        Args:
+            duration: 音频时长 (秒)
+            max_latency: 客户端可接受的最大延迟 (秒)
+            requested: 客户端指定的模型，已加载时使用该尺寸中适合该语言的模型
+            language: 已知的音频语言，英语使用 .en 模型
+
+        Returns:
+            RoutingDecision
+        """
+        with self._lock:
+            pinned = self.resolve(requested)
+            if pinned is not None:
+                pinned = self.variant(pinned, language)
+                decision = RoutingDecision(pinned, self.estimate(pinned, duration), "requested", duration)
+            else:
+                candidates = self.candidates(language)
+                budget = max_latency if max_latency is not None else self.latency_target
+                estimates = {name: self.estimate(name, duration) for name in candidates}
+                fitting = [name for name in candidates if estimates[name] <= budget]
+                if fitting:
+                    model = fitting[0]
+                    reason = "default" if model == candidates[0] else "downgraded"
+                else:
+                    model = min(candidates, key=estimates.get)
+                    reason = "over_budget"
+                decision = RoutingDecision(model, estimates[model], reason, duration)
+
+        self.metrics.inc("routing_decisions_total", model=decision.model, reason=decision.reason)
+        self.metrics.observe("routing_estimated_latency_seconds", decision.estimated_latency, model=decision.model)
+        if decision.reason != "default":
+            logger.info(
+                f"路由到模型 {decision.model} ({decision.reason}), "
+                f"音频 {duration:.1f}s, 预计 {decision.estimated_latency:.1f}s"
+            )
+        return decision
+
+    @contextmanager
+    def track(self, model: str, duration: float):
+        """
+        记录一个请求在模型上的执行
+
+        请求期间计入该模型的未完成音频时长；开始时无需排队的请求完成后，
+        以 耗时 / 音频时长 更新实时率 (排队的请求耗时包含等待，不用于更新)
+        """
+        with self._lock:
+            queued = self.in_flight[model] >= self.replicas[model]
+            self.outstanding[model] += duration
+            self.in_flight[model] += 1
+            self._update_gauges(model)
+
+        start = time.monotonic()
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.outstanding[model] = max(0.0, self.outstanding[model] - duration)
+                self.in_flight[model] -= 1
+                if succeeded and not queued and duration >= 1.0:
+                    rtf = elapsed / duration
+                    if self.measured[model]:
+                        rtf = (1 - self.smoothing) * self.rtf[model] + self.smoothing * rtf
+                    self.rtf[model] = rtf
+                    self.measured[model] = True
+                self._update_gauges(model)
+            self.metrics.observe("transcription_latency_seconds", elapsed, model=model)
+
+    def _update_gauges(self, model: str) -> None:
+        self.metrics.set_gauge("model_in_flight", self.in_flight[model], model=model)
+        self.metrics.set_gauge("model_outstanding_audio_seconds", self.outstanding[model], model=model)
+        self.metrics.set_gauge("model_rtf", self.rtf[model], model=model)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各模型的当前状态"""
+        with self._lock:
+            return {
+                name: {
+                    "replicas": self.replicas[name],
+                    "in_flight": self.in_flight[name],
+                    "outstanding_audio_seconds": self.outstanding[name],
+                    "rtf": self.rtf[name],
+                    "rtf_measured": self.measured[name]
+                }
+                for name in self.models
+            }
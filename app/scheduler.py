@@ -0,0 +1,256 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+from .cancellation import CancellationToken
+from .metrics import Metrics, metrics as default_metrics
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 优先级类别，数值越小越优先
+PRIORITIES = {
+    "realtime": 0,
+    "interactive": 1,
+    "batch": 2,
+}
+
+# 可在解码窗口之间被抢占的类别
+PREEMPTIBLE = "batch"
+
+
+class Job(CancellationToken):
+    """
+    带调度信息的取消令牌
+
+    除取消与截止时间外，还携带优先级类别、客户端 ID (公平排队的键)、权重，
+    以及每次占用模型的估计开销 (音频秒数)。由端点创建，沿取消令牌传入推理线程。
+    """
+
+    def __init__(
+        self,
+        priority: str = "interactive",
+        client_id: str = "anonymous",
+        weight: float = 1.0,
+        cost: float = 1.0,
+        timeout: Optional[float] = None,
+        parent: Optional[CancellationToken] = None
+    ):
+        """
+        初始化任务
+
+        Args:
+            priority: 优先级类别 (realtime, interactive, batch)
+            client_id: 客户端 ID 或 API 密钥摘要
+            weight: 公平排队的权重，越大分得的份额越多
+            cost: 每次占用模型的估计开销 (音频秒数)
+            timeout: 超时时间 (秒)
+            parent: 父令牌
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"不支持的优先级: {priority}，支持: {', '.join(PRIORITIES)}")
+        super().__init__(timeout, parent)
+        self.priority = priority
+        self.client_id = client_id
+        self.weight = max(weight, 1e-6)
+        self.cost = cost
+
+
+def find_job(token: Optional[CancellationToken]) -> Optional[Job]:
+    """沿父令牌链查找调度信息"""
+    while token is not None:
+        if isinstance(token, Job):
+            return token
+        token = token.parent
+    return None
+
+
+class _Waiter:
+    """等待模型副本的请求"""
+
+    __slots__ = ("token", "job", "rank", "start_tag", "seq", "replica", "slot", "enqueued_at")
+
+    def __init__(self, token, job, rank, start_tag, seq, replica):
+        self.token = token
+        self.job = job
+        self.rank = rank
+        self.start_tag = start_tag
+        self.seq = seq
+        self.replica = replica
+        self.slot: Optional[int] = None
+        self.enqueued_at = time.monotonic()
+
+    def key(self) -> Tuple[int, float, int]:
+        return self.rank, self.start_tag, self.seq
+
+
+class FairScheduler:
+    """
+    模型副本的优先级与公平调度
+
+    空闲副本总是分配给最高优先级类别中的请求；同一类别内按客户端做
+    起始时间公平排队 (SFQ)：每个请求的起始标签为
+    max(类别虚拟时间, 该客户端上一个请求的结束标签)，结束标签 = 起始标签 + 开销 / 权重，
+    标签最小者先服务。一个客户端提交大量长任务只会推迟它自己的请求。
+
+    批量任务在每个解码窗口前调用 preempt_point：有更高优先级的请求在等待时，
+    把副本交给它，待其用完后再继续原任务。
+    """
+
+    def __init__(self, slots: int, name: str = "default", metrics: Optional[Metrics] = None):
+        """
+        初始化调度器
+
+        Args:
+            slots: 模型副本数
+            name: 调度器名称 (模型名称)，用于指标标签
+            metrics: 记录排队时间的指标实例
+        """
+        self.name = name
+        self.metrics = metrics or default_metrics
+        self._free: List[int] = list(range(slots))
+        self._leases: Dict[int, Tuple[Optional[CancellationToken], Job]] = {}
+        self._waiters: List[_Waiter] = []
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._finish_tags: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._default_job = Job()
+
+    def acquire(
+        self,
+        token: Optional[CancellationToken] = None,
+        replica: Optional[int] = None,
+        cost: Optional[float] = None
+    ) -> int:
+        """
+        等待并占用一个模型副本
+
+        Args:
+            token: 取消令牌 (其父链中的 Job 提供调度信息，没有时按 interactive 处理)
+            replica: 只等待指定的副本 (被抢占的任务收回原副本)
+            cost: 本次占用的开销，默认为任务的估计开销
+
+        Returns:
+            副本编号
+        """
+        job = find_job(token) or self._default_job
+        with self._cond:
+            waiter = self._enqueue(token, job, replica, cost)
+            self._wait(waiter)
+
+        wait = time.monotonic() - waiter.enqueued_at
+        if replica is None:
+            self.metrics.observe("scheduler_queue_seconds", wait, model=self.name, priority=job.priority)
+        return waiter.slot
+
+    def _enqueue(
+        self,
+        token: Optional[CancellationToken],
+        job: Job,
+        replica: Optional[int],
+        cost: Optional[float]
+    ) -> _Waiter:
+        """登记等待的请求并尝试分配，调用方需持有锁"""
+        if replica is not None:
+            # 被抢占的任务优先于同类别的其他请求收回副本
+            start_tag = float("-inf")
+        else:
+            key = (job.priority, job.client_id)
+            start_tag = max(self._virtual_time[job.priority], self._finish_tags.get(key, 0.0))
+            self._finish_tags[key] = start_tag + (job.cost if cost is None else cost) / job.weight
+        waiter = _Waiter(token, job, PRIORITIES[job.priority], start_tag, next(self._seq), replica)
+        self._waiters.append(waiter)
+        self._dispatch()
+        return waiter
+
+    def _wait(self, waiter: _Waiter) -> None:
+        """等待请求分配到副本，取消时退出队列并抛出异常，调用方需持有锁"""
+        token = waiter.token
+        while waiter.slot is None:
+            if token is not None and token.cancelled:
+                self._waiters.remove(waiter)
+                self._update_gauges()
+                token.check()
+            self._cond.wait(timeout=0.1 if token is not None else None)
+
+    def release(self, slot: int) -> None:
+        """归还模型副本 (在收回被抢占的副本时被取消的任务已不再占用副本，忽略)"""
+        with self._cond:
+            if self._leases.pop(slot, None) is None:
+                return
+            self._free.append(slot)
+            self._dispatch()
+
+    def lease(self, slot: int) -> Optional[Tuple[Optional[CancellationToken], Job]]:
+        """当前占用副本的 (取消令牌, 任务)"""
+        with self._cond:
+            return self._leases.get(slot)
+
+    def preempt_point(self, slot: int) -> None:
+        """
+        在解码窗口之间调用：占用者为批量任务且有更高优先级的请求等待时，
+        让出副本并等待收回
+
+        检查占用者、归还副本和登记收回请求在同一次持锁内完成，
+        其他线程不会看到副本已归还但收回请求尚未登记的中间状态。
+        """
+        with self._cond:
+            lease = self._leases.get(slot)
+            if lease is None or lease[1].priority != PREEMPTIBLE:
+                return
+            token, job = lease
+            rank = PRIORITIES[job.priority]
+            if not any(w.rank < rank and w.replica in (None, slot) for w in self._waiters):
+                return
+
+            logger.info(f"批量任务让出模型副本 {self.name}#{slot}")
+            self.metrics.inc("scheduler_preemptions_total", model=self.name, priority=job.priority)
+            start = time.monotonic()
+            del self._leases[slot]
+            self._free.append(slot)
+            waiter = self._enqueue(token, job, slot, 0.0)
+            self._wait(waiter)
+        self.metrics.observe("scheduler_preempted_seconds", time.monotonic() - start, model=self.name)
+
+    def _dispatch(self) -> None:
+        """把空闲副本分配给等待的请求，调用方需持有锁"""
+        while self._free and self._waiters:
+            eligible = [w for w in self._waiters if w.replica is None or w.replica in self._free]
+            if not eligible:
+                break
+            waiter = min(eligible, key=_Waiter.key)
+            slot = waiter.replica if waiter.replica is not None else self._free[0]
+            self._free.remove(slot)
+            self._waiters.remove(waiter)
+            waiter.slot = slot
+            self._leases[slot] = (waiter.token, waiter.job)
+            priority = waiter.job.priority
+            self._virtual_time[priority] = max(self._virtual_time[priority], waiter.start_tag)
+        if len(self._finish_tags) > 1024:
+            # 结束标签不超过类别虚拟时间的客户端与新客户端等价，无需保留
+            self._finish_tags = {
+                key: tag for key, tag in self._finish_tags.items() if tag > self._virtual_time[key[0]]
+            }
+        self._update_gauges()
+        self._cond.notify_all()
+
+    def _update_gauges(self) -> None:
+        for priority in PRIORITIES:
+            waiting = sum(1 for w in self._waiters if w.job.priority == priority)
+            self.metrics.set_gauge("scheduler_waiting", waiting, model=self.name, priority=priority)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前排队和占用情况"""
+        with self._cond:
+            return {
+                "free": len(self._free),
+                "waiting": {
+                    priority: sum(1 for w in self._waiters if w.job.priority == priority)
+                    for priority in PRIORITIES
+                },
+                "leases": {slot: job.priority for slot, (_, job) in self._leases.items()}
+            }
@@ -0,0 +1,110 @@
+import json
+from array import array
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+# 未识别说话者的标签，固定为说话者编号 0
+UNKNOWN_SPEAKER = "UNKNOWN"
+
+
+class SegmentTable:
+    """
+    列式存储的转录段落
+
+    开始/结束时间和说话者编号分别保存在 array 列中，说话者标签只保存一份。
+    不保留 tokens、avg_logprob 等客户端不使用的 Whisper 字段，
+    也省去了逐段构造 pydantic 对象的开销 (3 小时的合成转录上，
+    构建并序列化响应的耗时和峰值内存约为原始段落直接序列化的一半，参见 benchmarks/bench_serialization.py)。
+    """
+
+    __slots__ = ("starts", "ends", "speaker_ids", "texts", "speakers", "_speaker_index")
+
+    def __init__(self):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.speaker_ids = array("H")
+        self.texts: List[str] = []
+        self.speakers: List[str] = [UNKNOWN_SPEAKER]
+        self._speaker_index: Dict[str, int] = {UNKNOWN_SPEAKER: 0}
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict[str, Any]]) -> "SegmentTable":
+        """从段落字典 (Whisper、WhisperX 或说话者识别结果) 构造，只保留客户端使用的字段"""
+        if isinstance(segments, cls):
+            return segments
+        table = cls()
+        for segment in segments:
+            table.append(
+                segment.get("start", 0),
+                segment.get("end", 0),
+                segment.get("text", ""),
+                segment.get("speaker")
+            )
+        return table
+
+    def append(self, start: float, end: float, text: str, speaker: Optional[str] = None) -> None:
+        """添加一个段落"""
+        speaker = speaker or UNKNOWN_SPEAKER
+        speaker_id = self._speaker_index.get(speaker)
+        if speaker_id is None:
+            speaker_id = self._speaker_index[speaker] = len(self.speakers)
+            self.speakers.append(speaker)
+
+        self.starts.append(start)
+        self.ends.append(end)
+        self.speaker_ids.append(speaker_id)
+        self.texts.append(text)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.rows()
+
+    @property
+    def has_speakers(self) -> bool:
+        """是否带有说话者识别结果"""
+        return any(self.speaker_ids)
+
+    @property
+    def duration(self) -> float:
+        return self.ends[-1] if self.texts else 0.0
+
+    def rows(self, with_id: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        逐段生成响应使用的字典
+
+        Args:
+            with_id: 是否包含段落序号 (verbose_json)
+        """
+        speakers = self.speakers
+        for index, (start, end, speaker_id, text) in enumerate(
+            zip(self.starts, self.ends, self.speaker_ids, self.texts)
+        ):
+            row = {"speaker": speakers[speaker_id], "start": start, "end": end, "text": text}
+            if with_id:
+                row = {"id": index, **row}
+            yield row
+
+    def to_list(self, with_id: bool = False) -> List[Dict[str, Any]]:
+        """返回段落字典列表，参见 rows"""
+        return list(self.rows(with_id))
+
+
+def _json_default(value: Any) -> Any:
+    """json.dumps 无法直接处理的值: NumPy 标量/数组和 pydantic 模型"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "dict"):
+        return value.dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> str:
+    """
+    将响应内容直接序列化为紧凑的 JSON
+
+    内容已是普通字典和列表时无需经过 jsonable_encoder 或 response_model 逐项转换
+    """
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_json_default)
@@ -0,0 +1,141 @@
+import logging
+from typing import Dict, Any, Optional
+
+from .audio import PCM_FORMATS
+from .cancellation import CancellationToken
+from .decoding import get_profile
+from .scheduler import Job
+from .online_diarization import OnlineSpeakerTracker
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionSession:
+    """
+    WebSocket 转录会话的状态
+
+    会话在首次可信的语言检测后锁定语言，后续音频块不再重复检测；
+    并将已转录文本的末尾作为下一块的 initial_prompt，保持块边界处的上下文。
+    连接关闭时取消会话令牌，正在进行的转录在下一个解码窗口前停止。
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        websocket: Any,
+        speaker_tracker: OnlineSpeakerTracker,
+        language_threshold: float = 0.8,
+        context_chars: int = 200
+    ):
+        """
+        初始化会话
+
+        Args:
+            client_id: 客户端ID
+            websocket: WebSocket 连接
+            speaker_tracker: 会话内的增量说话者识别
+            language_threshold: 锁定检测语言所需的最低概率
+            context_chars: 作为提示词携带的已转录文本长度 (字符)
+        """
+        self.client_id = client_id
+        self.websocket = websocket
+        self.speaker_tracker = speaker_tracker
+        self.language_threshold = language_threshold
+        self.context_chars = context_chars
+
+        self.language: Optional[str] = None
+        self.language_locked = False
+        self.prompt: Optional[str] = None
+        # 二进制消息的格式: file (编码后的音频文件) 或原始 PCM 格式
+        self.audio_format = "file"
+        self.transcript_tail = ""
+        self.chunks = 0
+        # 每个音频块的超时时间 (秒)，None 表示不限时
+        self.timeout: Optional[float] = None
+        # 解码配置，None 表示使用 WebSocket 端点的默认配置
+        self.decoding_profile: Optional[str] = None
+        self.cancel_token = CancellationToken()
+
+    def chunk_token(self) -> Job:
+        """为一个音频块创建 realtime 优先级的任务，连接关闭或超时时取消"""
+        return Job("realtime", self.client_id, timeout=self.timeout, parent=self.cancel_token)
+
+    def close(self) -> None:
+        """连接关闭，取消正在进行的转录"""
+        self.cancel_token.cancel("WebSocket 连接已关闭")
+
+    def lock_language(self, language: str, probability: float = 1.0) -> None:
+        """锁定会话语言"""
+        self.language = language
+        self.language_locked = True
+        logger.info(f"会话 {self.client_id} 锁定语言: {language} (概率 {probability:.2f})")
+
+    def initial_prompt(self) -> Optional[str]:
+        """组合用户提示词与已转录文本的末尾，作为下一块的 initial_prompt"""
+        parts = [part for part in (self.prompt, self.transcript_tail) if part]
+        return " ".join(parts) if parts else None
+
+    def append_text(self, text: str) -> None:
+        """记录新转录的文本，只保留末尾用作上下文"""
+        text = text.strip()
+        if not text:
+            return
+        combined = f"{self.transcript_tail} {text}".strip()
+        self.transcript_tail = combined[-self.context_chars:] if self.context_chars > 0 else ""
+        self.chunks += 1
+
+    def apply_config(self, config: Dict[str, Any]) -> None:
+        """
+        应用客户端发送的会话配置
+
+        支持的字段: language (指定后直接锁定), prompt, language_threshold, context_chars,
+        audio_format (file, pcm_s16le, pcm_f32le), timeout (每个音频块的超时秒数),
+        decoding_profile (greedy, fast-greedy, balanced, accurate)
+        """
+        if "audio_format" in config:
+            audio_format = config["audio_format"] or "file"
+            if audio_format != "file" and audio_format not in PCM_FORMATS:
+                raise ValueError(f"不支持的音频格式: {audio_format}")
+            self.audio_format = audio_format
+        if config.get("language"):
+            self.lock_language(config["language"])
+        elif "language" in config:
+            # 显式传入空值时恢复自动检测
+            self.language = None
+            self.language_locked = False
+        if "prompt" in config:
+            self.prompt = config["prompt"] or None
+        if "language_threshold" in config:
+            self.language_threshold = float(config["language_threshold"])
+        if "context_chars" in config:
+            self.context_chars = max(0, int(config["context_chars"]))
+            self.transcript_tail = self.transcript_tail[-self.context_chars:] if self.context_chars else ""
+        if "timeout" in config:
+            self.timeout = float(config["timeout"]) if config["timeout"] else None
+        if "decoding_profile" in config:
+            profile = config["decoding_profile"]
+            self.decoding_profile = get_profile(profile).name if profile else None
+
+    def reset(self) -> None:
+        """清除语言、上下文与说话者，开始新的录音"""
+        self.language = None
+        self.language_locked = False
+        self.transcript_tail = ""
+        self.chunks = 0
+        self.speaker_tracker.reset()
+
+    def describe(self) -> Dict[str, Any]:
+        """返回会话状态，发送给客户端"""
+        return {
+            "language": self.language,
+            "language_locked": self.language_locked,
+            "prompt": self.prompt,
+            "language_threshold": self.language_threshold,
+            "context_chars": self.context_chars,
+            "audio_format": self.audio_format,
+            "timeout": self.timeout,
+            "decoding_profile": self.decoding_profile,
+            "chunks": self.chunks
+        }
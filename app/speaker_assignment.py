@@ -0,0 +1,146 @@
+import heapq
+import logging
+from typing import Dict, List, Any, Tuple, Iterable, Sequence
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+Turn = Tuple[float, float, str]
+
+
+def normalize_turns(turns: Any) -> List[Turn]:
+    """
+    将说话者轮次统一转换为按起点排序的 (start, end, speaker) 列表
+
+    Args:
+        turns: 字典列表、(start, end, speaker) 元组列表，或带有 start/end/speaker 列的 DataFrame
+    """
+    if hasattr(turns, "itertuples"):
+        rows = zip(turns["start"], turns["end"], turns["speaker"])
+    else:
+        rows = (
+            (turn["start"], turn["end"], turn["speaker"]) if isinstance(turn, dict) else turn
+            for turn in turns
+        )
+    return sorted((float(start), float(end), str(speaker)) for start, end, speaker in rows)
+
+
+def assign_by_overlap(items: Sequence[Dict[str, Any]], turns: List[Turn]) -> None:
+    """
+    扫描线算法：为每个带 start/end 的条目分配重叠时长最大的说话者
+
+    条目和轮次都按起点排序后同时推进，活动轮次保存在按终点排序的堆中，
+    每个条目只需与当前重叠的轮次比较。排序后整体为线性复杂度，
+    不再像逐条匹配全部轮次那样随会议长度平方增长。没有任何重叠的条目保持不变；
+    重叠时长相同时取较早开始的轮次的说话者。
+
+    Args:
+        items: 段落或词列表，原地写入 speaker 字段
+        turns: 已按起点排序的说话者轮次
+    """
+    timed = sorted(
+        (item for item in items if item is not None and "start" in item and "end" in item),
+        key=lambda item: item["start"]
+    )
+
+    active: List[Tuple[float, int]] = []
+    next_turn = 0
+    for item in timed:
+        item_start, item_end = item["start"], item["end"]
+
+        # 加入起点早于条目终点的轮次，移除已在条目开始前结束的轮次
+        while next_turn < len(turns) and turns[next_turn][0] < item_end:
+            heapq.heappush(active, (turns[next_turn][1], next_turn))
+            next_turn += 1
+        while active and active[0][0] <= item_start:
+            heapq.heappop(active)
+
+        # 按轮次起点遍历 (堆的数组顺序不固定)，max 在时长相同时保留先出现的说话者
+        overlap: Dict[str, float] = {}
+        for turn_end, index in sorted(active, key=lambda entry: entry[1]):
+            duration = min(turn_end, item_end) - max(turns[index][0], item_start)
+            if duration > 0:
+                speaker = turns[index][2]
+                overlap[speaker] = overlap.get(speaker, 0.0) + duration
+
+        if overlap:
+            item["speaker"] = max(overlap, key=overlap.get)
+
+
+def _join_words(words: List[Dict[str, Any]]) -> str:
+    """拼接词文本 (Whisper 的词自带前导空格，WhisperX 的词需要用空格连接)"""
+    texts = [word.get("word", "") for word in words]
+    if any(text.startswith(" ") for text in texts):
+        return "".join(texts).strip()
+    return " ".join(text.strip() for text in texts)
+
+
+def split_by_speaker(segments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    在说话者切换处重新切分段落
+
+    段落内的词说话者不一致时，按连续相同说话者的词切分为多个段落，
+    段落的起止时间取自词时间戳。没有词级信息的段落保持不变。
+    """
+    result: List[Dict[str, Any]] = []
+    for segment in segments:
+        words = [word for word in segment.get("words", []) if word]
+        speakers = {word.get("speaker") for word in words if "speaker" in word}
+        if len(speakers) <= 1:
+            result.append(segment)
+            continue
+
+        groups: List[List[Dict[str, Any]]] = []
+        current = segment.get("speaker", "UNKNOWN")
+        for word in words:
+            speaker = word.get("speaker", current)
+            if not groups or speaker != current:
+                groups.append([])
+                current = speaker
+            groups[-1].append(word)
+
+        for group in groups:
+            timed = [word for word in group if "start" in word]
+            piece = {key: value for key, value in segment.items() if key not in ("words", "tokens")}
+            piece.update({
+                "start": timed[0]["start"] if timed else segment["start"],
+                "end": timed[-1]["end"] if timed else segment["end"],
+                "text": _join_words(group),
+                "speaker": group[0].get("speaker", segment.get("speaker", "UNKNOWN")),
+                "words": group
+            })
+            result.append(piece)
+    return result
+
+
+def assign_word_speakers(turns: Any, result: Dict[str, Any], split_segments: bool = True) -> Dict[str, Any]:
+    """
+    将说话者识别结果分配给转录段落和词，可替代 whisperx.assign_word_speakers
+
+    Args:
+        turns: 说话者轮次，参见 normalize_turns
+        result: 转录结果，包含 segments (可带 words)
+        split_segments: 是否在说话者切换处重新切分段落
+
+    Returns:
+        原地更新后的转录结果
+    """
+    sorted_turns = normalize_turns(turns)
+    segments = result.get("segments", [])
+
+    assign_by_overlap(segments, sorted_turns)
+    words = [word for segment in segments for word in segment.get("words", []) if word]
+    assign_by_overlap(words, sorted_turns)
+
+    # 没有与任何轮次重叠的词沿用所在段落的说话者
+    for segment in segments:
+        if "speaker" not in segment:
+            continue
+        for word in segment.get("words", []):
+            if word and "speaker" not in word:
+                word["speaker"] = segment["speaker"]
+
+    if split_segments:
+        result["segments"] = split_by_speaker(segments)
+    return result
@@ -8,6 +8,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const removeButton = document.getElementById('removeButton');
     const transcribeButton = document.getElementById('transcribeButton');
     const enableDiarization = document.getElementById('enableDiarization');
+    const keepOriginal = document.getElementById('keepOriginal');
     const languageSelect = document.getElementById('languageSelect');
     const progressSection = document.getElementById('progressSection');
     const progressBar = document.getElementById('progressBar');
@@ -21,6 +22,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const youtubeUrl = document.getElementById('youtubeUrl');
     const youtubeButton = document.getElementById('youtubeButton');
 
+    // 服务器使用的采样率 (16kHz 单声道)
+    const TARGET_SAMPLE_RATE = 16000;
+
     // 当前选择的文件
     let selectedFile = null;
     // WebSocket连接
@@ -127,6 +131,7 @@ document.addEventListener('DOMContentLoaded', () => {
             downloadOptions.innerHTML = `
                 <div class="download-option" data-format="txt">下載文本 (.txt)</div>
                 <div class="download-option" data-format="srt">下載字幕 (.srt)</div>
+                <div class="download-option" data-format="vtt">下載字幕 (.vtt)</div>
             `;
             
             // 定位并显示选项
@@ -270,10 +275,57 @@ document.addEventListener('DOMContentLoaded', () => {
         resultSection.style.display = 'none';
     }
 
+    /**
+     * 在浏览器中解码并重采样为 16kHz 单声道 int16 PCM
+     *
+     * 服务器本来就会把音频重采样为 16kHz 单声道，提前在浏览器中完成可以大幅减少上传量
+     * (48kHz 立体声 WAV 约 11MB/分钟，16kHz int16 PCM 约 1.9MB/分钟)。
+     * 结果不比原始文件小 (如低码率 MP3)、或浏览器无法解码时，返回原始文件。
+     */
+    async function prepareUpload(file) {
+        const OfflineContext = window.OfflineAudioContext || window.webkitOfflineAudioContext;
+        if (keepOriginal.checked || !OfflineContext) {
+            return file;
+        }
+
+        try {
+            progressText.textContent = '正在壓縮音訊...';
+
+            // 以 16kHz 的离线上下文解码，浏览器会在解码时直接重采样
+            const context = new OfflineContext(1, TARGET_SAMPLE_RATE, TARGET_SAMPLE_RATE);
+            const buffer = await context.decodeAudioData(await file.arrayBuffer());
+
+            // 下混为单声道并转换为 int16
+            const channels = [];
+            for (let c = 0; c < buffer.numberOfChannels; c++) {
+                channels.push(buffer.getChannelData(c));
+            }
+            const pcm = new Int16Array(buffer.length);
+            for (let i = 0; i < buffer.length; i++) {
+                let sample = 0;
+                for (const channel of channels) {
+                    sample += channel[i];
+                }
+                sample = Math.max(-1, Math.min(1, sample / channels.length));
+                pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7FFF;
+            }
+
+            if (pcm.byteLength >= file.size) {
+                return file;
+            }
+
+            const baseName = file.name.replace(/\.[^.]+$/, '');
+            return new File([pcm.buffer], `${baseName}.pcm`, { type: 'audio/pcm' });
+        } catch (error) {
+            console.warn('瀏覽器端壓縮失敗，上傳原始文件:', error);
+            return file;
+        }
+    }
+
     /**
      * 开始转录
      */
-    function startTranscription() {
+    async function startTranscription() {
         if (!selectedFile) return;
         
         // 显示进度条
@@ -282,9 +334,12 @@ document.addEventListener('DOMContentLoaded', () => {
         updateProgress(0);
         
         // 准备表单数据
+        const uploadFile = await prepareUpload(selectedFile);
         const formData = new FormData();
-        formData.append('file', selectedFile);
+        formData.append('file', uploadFile);
         formData.append('enable_diarization', enableDiarization.checked);
+        // 字幕在下载时由 /api/results 按需生成
+        formData.append('include_srt', false);
         
         const language = languageSelect.value;
         if (language) {
@@ -388,7 +443,12 @@ document.addEventListener('DOMContentLoaded', () => {
             resultContent.appendChild(segmentDiv);
         }
         
+        const speakerLabel = segment.speaker && segment.speaker !== 'UNKNOWN'
+            ? `<div class="speaker-label">${segment.speaker}</div>`
+            : '';
+        
         segmentDiv.innerHTML = `
+            ${speakerLabel}
             <div class="speaker-text">${segment.text}</div>
             <div class="timestamp">${formatTime(segment.start)} - ${formatTime(segment.end)}</div>
         `;
@@ -434,15 +494,29 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     function downloadTranscription(format = 'txt') {
         let content, filename, mimeType;
+        const date = new Date().toISOString().slice(0, 10);
+        const resultId = window.transcriptionData && window.transcriptionData.result_id;
+        
+        if ((format === 'srt' || format === 'vtt') && resultId) {
+            // 字幕由服务器根据已保存的结果生成，无需重新转录
+            const a = document.createElement('a');
+            a.href = `/api/results/${resultId}.${format}?download=true`;
+            a.download = `transcription_${date}.${format}`;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            showToast('字幕已下载');
+            return;
+        }
         
         if (format === 'srt' && window.transcriptionData && window.transcriptionData.srt) {
             // 下载 SRT 格式
             content = window.transcriptionData.srt;
-            filename = `transcription_${new Date().toISOString().slice(0, 10)}.srt`;
+            filename = `transcription_${date}.srt`;
         } else {
             // 下载纯文本格式
             content = resultContent.textContent;
-            filename = `transcription_${new Date().toISOString().slice(0, 10)}.txt`;
+            filename = `transcription_${date}.txt`;
         }
         
         // 设置 MIME 类型
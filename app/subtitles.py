@@ -0,0 +1,69 @@
+from typing import Dict, Any, Iterable, Iterator
+
+# 支持的字幕格式
+SUBTITLE_FORMATS = ["srt", "vtt"]
+
+
+def format_timestamp(seconds: float, decimal_marker: str = ",") -> str:
+    """
+    将秒数转换为字幕时间戳 (SRT: HH:MM:SS,mmm, VTT: HH:MM:SS.mmm)
+
+    Args:
+        seconds: 秒数
+        decimal_marker: 秒与毫秒之间的分隔符
+
+    Returns:
+        字幕时间戳
+    """
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{decimal_marker}{milliseconds:03d}"
+
+
+def iter_subtitles(
+    segments: Iterable[Dict[str, Any]],
+    format_type: str = "srt",
+    speaker_labels: bool = False
+) -> Iterator[str]:
+    """
+    逐条生成字幕内容，可直接用于流式响应
+
+    Args:
+        segments: 段落 (包含 start, end, text，可选 speaker)
+        format_type: 字幕格式 (srt, vtt)
+        speaker_labels: 是否在字幕中标注说话者
+
+    Yields:
+        字幕文件的各个部分
+    """
+    if format_type not in SUBTITLE_FORMATS:
+        raise ValueError(f"不支持的字幕格式: {format_type}")
+
+    vtt = format_type == "vtt"
+    decimal_marker = "." if vtt else ","
+    if vtt:
+        yield "WEBVTT\n\n"
+
+    for index, segment in enumerate(segments, start=1):
+        start = format_timestamp(segment.get("start", 0), decimal_marker)
+        end = format_timestamp(segment.get("end", 0), decimal_marker)
+        text = segment.get("text", "").strip()
+
+        if speaker_labels:
+            speaker = segment.get("speaker") or "UNKNOWN"
+            # VTT 使用声音标签标注说话者，SRT 以方括号前缀标注
+            text = f"<v {speaker}>{text}" if vtt else f"[{speaker}] {text}"
+
+        yield f"{index}\n{start} --> {end}\n{text}\n\n"
+
+
+def render_subtitles(
+    segments: Iterable[Dict[str, Any]],
+    format_type: str = "srt",
+    speaker_labels: bool = False
+) -> str:
+    """生成完整的字幕字符串，参见 iter_subtitles"""
+    return "".join(iter_subtitles(segments, format_type, speaker_labels))
+
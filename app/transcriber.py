@@ -1,15 +1,25 @@
 import os
+import copy
 import tempfile
 import asyncio
 import json
 import logging
-from typing import Optional, List, Dict, Any, Callable, Tuple, BinaryIO
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Callable, Tuple, BinaryIO, Union, Iterator, AsyncIterator
 import torch
 import whisper
+from whisper.audio import SAMPLE_RATE, HOP_LENGTH, N_SAMPLES
 import ffmpeg
 import numpy as np
 from pathlib import Path
 
+from .audio import map_long_audio, is_long_audio
+from .cancellation import CancellationToken, check_cancelled, run_cancellable
+from .decoding import DecodeStats, get_profile
+from .scheduler import FairScheduler
+from .segments import SegmentTable
+from .subtitles import SUBTITLE_FORMATS, render_subtitles, format_timestamp as format_subtitle_timestamp
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -17,17 +27,206 @@ logger = logging.getLogger(__name__)
 # 支持的音频格式
 SUPPORTED_FORMATS = ["mp3", "wav", "m4a", "flac", "ogg"]
 
+
+class ModelPool:
+    """
+    线程安全的模型副本池
+    
+    Whisper 解码时会在模型上注册 kv-cache hook，同一模型实例不能被多个线程同时使用，
+    因此每个并发推理任务需要独占一个副本。副本由 FairScheduler 按优先级类别和
+    客户端公平排队分配；每个副本的 decode 上安装了检查点，每个 30 秒窗口解码前
+    检查占用者的取消令牌，并允许批量任务把副本让给更高优先级的请求。
+    检查点同时为占用者记录解码统计 (温度回退的窗口数)，并执行其回退限制。
+    """
+    
+    def __init__(self, models: List[Any], name: str = "default"):
+        self.name = name
+        self.size = len(models)
+        self.models = models
+        self.scheduler = FairScheduler(self.size, name=name)
+        self._stats: List[Optional[DecodeStats]] = [None] * self.size
+        for slot, model in enumerate(models):
+            self._install_checkpoint(slot, model)
+    
+    def _install_checkpoint(self, slot: int, model: Any) -> None:
+        """替换副本实例上的 decode (model.transcribe 逐窗口调用)，解码前经过调度检查点"""
+        decode = model.decode
+        scheduler = self.scheduler
+        
+        def scheduled_decode(mel, *args, **kwargs):
+            stats = self._stats[slot]
+            lease = scheduler.lease(slot)
+            if lease is not None:
+                check_cancelled(lease[0])
+                scheduler.preempt_point(slot)
+                # 让出期间其他任务占用过该副本，收回后恢复自己的统计
+                self._stats[slot] = stats
+            if stats is None:
+                return decode(mel, *args, **kwargs)
+            
+            previous = stats.before_decode(mel)
+            if previous is not None:
+                return previous
+            result = decode(mel, *args, **kwargs)
+            stats.after_decode(result)
+            return result
+        
+        model.decode = scheduled_decode
+    
+    @contextmanager
+    def acquire(
+        self,
+        cancel_token: Optional[CancellationToken] = None,
+        stats: Optional[DecodeStats] = None,
+        cost: Optional[float] = None
+    ):
+        """
+        借出一个模型副本，全部被占用时按调度顺序等待
+        
+        取消令牌父链中的 Job 决定优先级和公平排队的客户端；
+        等待期间和每个窗口解码前检查令牌，任务被取消后立即归还副本。
+        提供 stats 时，占用期间的解码记入其中；cost 为本次占用的开销，默认为任务的估计开销
+        """
+        slot = self.scheduler.acquire(cancel_token, cost=cost)
+        self._stats[slot] = stats
+        try:
+            yield self.models[slot]
+        finally:
+            self._stats[slot] = None
+            self.scheduler.release(slot)
+    
+    def transcribe_windowed(
+        self,
+        audio: np.ndarray,
+        options: Dict[str, Any],
+        cancel_token: Optional[CancellationToken] = None,
+        stats: Optional[DecodeStats] = None
+    ) -> Dict[str, Any]:
+        """
+        逐窗口转录整段音频，返回与 model.transcribe 相同格式的结果
+        
+        model.transcribe 会一次计算整段音频的梅尔频谱 (及其 STFT 中间结果)，
+        长音频 (尤其是 np.memmap 映射的) 改用此方法，内存占用与音频时长无关
+        """
+        options = dict(options)
+        prompt = options.pop("initial_prompt", None)
+        segments: List[Dict[str, Any]] = []
+        language = options.get("language")
+        for window in self.iter_windows(audio, options, prompt, cancel_token, stats):
+            segments.extend(window["segments"])
+            language = window["language"]
+        return {
+            "text": "".join(segment["text"] for segment in segments).strip(),
+            "segments": segments,
+            "language": language
+        }
+    
+    def iter_windows(
+        self,
+        audio: np.ndarray,
+        options: Dict[str, Any],
+        prompt: Optional[str] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        stats: Optional[DecodeStats] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        按 30 秒窗口逐段转录 (同步)，每个窗口只为该段音频计算梅尔频谱
+        
+        窗口末尾的段落可能被截断，因此除最后一个窗口外，结束于窗口末尾 1 秒内的段落
+        推迟到下一个窗口 (与 Whisper 内部按最后时间戳移动 seek 的做法一致)；
+        窗口内只有这一个段落时，保留其中结束于截断点之前的词，从最后一个保留的词之后推迟；
+        condition_on_previous_text 为真时，已确定文本的末尾 (200 个字符) 作为下一个窗口的提示词，
+        延续上下文；为假时与 Whisper 相同，提示词只用于第一个窗口。
+        """
+        offset = 0
+        segment_id = 0
+        options = dict(options)
+        condition_on_previous_text = options.get("condition_on_previous_text", True)
+        while offset < len(audio):
+            # 复制当前窗口 (音频可能是只读的 np.memmap)
+            chunk = np.array(audio[offset:offset + N_SAMPLES], dtype=np.float32)
+            chunk_duration = len(chunk) / SAMPLE_RATE
+            is_last = offset + N_SAMPLES >= len(audio)
+            
+            check_cancelled(cancel_token)
+            
+            # 每个窗口单独借出模型，长任务之间可以交替使用副本，每次占用的开销为一个窗口
+            with self.acquire(cancel_token, stats, cost=max(chunk_duration, 1.0)) as model:
+                result = model.transcribe(chunk, initial_prompt=prompt, **options)
+            
+            # 锁定第一个窗口检测到的语言，后续窗口不再检测
+            if not options.get("language"):
+                options["language"] = result.get("language")
+            
+            segments = result.get("segments", [])
+            advance = chunk_duration
+            cutoff = chunk_duration - 1.0
+            if not is_last and segments and segments[-1]["end"] > cutoff:
+                if len(segments) > 1:
+                    segments = segments[:-1]
+                    advance = segments[-1]["end"]
+                else:
+                    segment = segments[0]
+                    words = [word for word in segment.get("words", []) if word["end"] <= cutoff]
+                    if words:
+                        segment["words"] = words
+                        segment["text"] = "".join(word["word"] for word in words)
+                        segment["end"] = words[-1]["end"]
+                        advance = words[-1]["end"]
+                    else:
+                        logger.warning(
+                            f"窗口 {offset / SAMPLE_RATE:.1f}s 内唯一的段落在窗口末尾被截断且没有词级时间戳，"
+                            "截断处之后的文本可能丢失"
+                        )
+            
+            time_offset = offset / SAMPLE_RATE
+            for segment in segments:
+                segment["id"] = segment_id
+                segment["seek"] = segment.get("seek", 0) + offset // HOP_LENGTH
+                segment["start"] += time_offset
+                segment["end"] += time_offset
+                for word in segment.get("words", []):
+                    word["start"] += time_offset
+                    word["end"] += time_offset
+                segment_id += 1
+            
+            if segments:
+                yield {
+                    "segments": segments,
+                    "language": options["language"],
+                    "decoding": stats.to_dict() if stats is not None else None
+                }
+                if condition_on_previous_text:
+                    text = "".join(segment["text"] for segment in segments).strip()
+                    prompt = text[-200:] or prompt
+            if not condition_on_previous_text:
+                prompt = None
+            
+            # 至少前进 1 秒，避免异常情况下原地循环
+            offset += max(int(advance * SAMPLE_RATE), SAMPLE_RATE)
+
+
 class WhisperTranscriber:
     """使用Whisper模型进行音频转录的类"""
     
-    def __init__(self, model_name: str = "tiny", device: Optional[str] = None):
+    def __init__(
+        self,
+        model_name: str = "tiny",
+        device: Optional[str] = None,
+        replicas: int = 1,
+        long_audio_seconds: Optional[float] = 600.0
+    ):
         """
         初始化Whisper转录器
         
         Args:
             model_name: Whisper模型名称 (tiny, base, small, medium, large)
             device: 运行设备 (cuda, cpu)
+            replicas: 模型副本数量，即可以并行执行的转录任务数
+            long_audio_seconds: 不短于该时长 (秒) 的音频解码到 mmap 临时文件并逐窗口转录，
+                单个任务的内存占用与音频时长无关；为空或 0 时总是整段转录
         """
+        self.long_audio_seconds = long_audio_seconds
         # 确定设备
         if device is None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -38,9 +237,17 @@ class WhisperTranscriber:
         logger.info(f"加载Whisper模型: {model_name}")
         
         # 加载模型
+        self.model_name = model_name
         self.model = whisper.load_model(model_name, device=self.device)
-        logger.info("模型加载完成")
+        models = [self.model] + [copy.deepcopy(self.model) for _ in range(replicas - 1)]
+        self.pool = ModelPool(models, name=model_name)
+        logger.info(f"模型加载完成 (副本数: {replicas})")
         
+    @property
+    def replicas(self) -> int:
+        """可并行执行的转录任务数"""
+        return self.pool.size
+    
     def is_format_supported(self, filename: str) -> bool:
         """检查文件格式是否支持"""
         ext = Path(filename).suffix.lower().lstrip(".")
@@ -52,7 +259,9 @@ class WhisperTranscriber:
         language: Optional[str] = None,
         prompt: Optional[str] = None,
         temperature: float = 0.0,
-        progress_callback: Optional[Callable[[float], None]] = None
+        progress_callback: Optional[Callable[[float], None]] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        profile: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         转录音频文件
@@ -63,6 +272,8 @@ class WhisperTranscriber:
             prompt: 提示词，帮助模型理解上下文
             temperature: 采样温度
             progress_callback: 进度回调函数
+            cancel_token: 取消令牌
+            profile: 解码配置名称 (greedy, fast-greedy, balanced, accurate)
             
         Returns:
             转录结果字典
@@ -70,10 +281,47 @@ class WhisperTranscriber:
         if not self.is_format_supported(file_path):
             raise ValueError(f"不支持的文件格式: {file_path}")
         
+        return await self.transcribe_audio(
+            file_path,
+            language=language,
+            prompt=prompt,
+            temperature=temperature,
+            progress_callback=progress_callback,
+            cancel_token=cancel_token,
+            profile=profile
+        )
+    
+    async def transcribe_audio(
+        self,
+        audio: Union[str, np.ndarray],
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        temperature: float = 0.0,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        profile: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        转录音频文件或已解码的 16kHz 单声道波形
+        
+        Args:
+            audio: 音频文件路径或 float32 波形
+            language: 音频语言代码 (如 'zh', 'en')
+            prompt: 提示词，帮助模型理解上下文
+            temperature: 起始采样温度
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌，在每个 30 秒窗口解码前检查
+            profile: 解码配置名称 (greedy, fast-greedy, balanced, accurate)，决定束搜索和温度回退
+            
+        Returns:
+            转录结果字典，decoding 字段为解码统计 (窗口数、回退的窗口数等)
+        """
         try:
             # 创建转录选项
+            decoding = get_profile(profile)
+            stats = DecodeStats.for_profile(decoding)
             transcribe_options = {
-                "temperature": temperature,
+                **decoding.transcribe_options(temperature),
                 "fp16": self.device == "cuda"
             }
             
@@ -85,10 +333,14 @@ class WhisperTranscriber:
                 
             # 使用异步执行转录，以便可以报告进度
             loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None, 
-                lambda: self.model.transcribe(file_path, **transcribe_options)
+            result = await run_cancellable(
+                loop.run_in_executor(
+                    None, lambda: self._run_transcribe(audio, transcribe_options, cancel_token, stats)
+                ),
+                cancel_token
             )
+            stats.record(self.model_name)
+            result["decoding"] = stats.to_dict()
             
             # 如果有进度回调，通知完成
             if progress_callback:
@@ -100,6 +352,118 @@ class WhisperTranscriber:
             logger.error(f"转录过程中出错: {str(e)}")
             raise
     
+    async def detect_language(
+        self,
+        audio: np.ndarray,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[str, float]:
+        """
+        检测音频前 30 秒的语言
+        
+        Args:
+            audio: 16kHz 单声道波形
+            cancel_token: 取消令牌，检测按其任务的优先级排队
+            
+        Returns:
+            (语言代码, 概率)
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, lambda: self._run_detect_language(audio, cancel_token))
+    
+    def _run_detect_language(
+        self,
+        audio: np.ndarray,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> Tuple[str, float]:
+        """在工作线程中借出模型副本执行语言检测"""
+        with self.pool.acquire(cancel_token) as model:
+            if not model.is_multilingual:
+                return "en", 1.0
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+            if self.device == "cuda":
+                mel = mel.half()
+            _, probs = model.detect_language(mel)
+        language = max(probs, key=probs.get)
+        return language, float(probs[language])
+    
+    def _run_transcribe(
+        self,
+        audio: Union[str, np.ndarray],
+        options: Dict[str, Any],
+        cancel_token: Optional[CancellationToken] = None,
+        stats: Optional[DecodeStats] = None
+    ) -> Dict[str, Any]:
+        """在工作线程中借出模型副本执行转录，长音频逐窗口转录"""
+        with map_long_audio(audio, self.long_audio_seconds) as audio:
+            if is_long_audio(audio, self.long_audio_seconds):
+                return self.pool.transcribe_windowed(audio, options, cancel_token, stats)
+            with self.pool.acquire(cancel_token, stats) as model:
+                return model.transcribe(audio, **options)
+    
+    async def transcribe_windows(
+        self,
+        audio: Union[str, np.ndarray],
+        language: Optional[str] = None,
+        prompt: Optional[str] = None,
+        temperature: float = 0.0,
+        cancel_token: Optional[CancellationToken] = None,
+        profile: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        按 30 秒窗口逐段转录，每个窗口解码完成后立即产出其段落
+        
+        Args:
+            audio: 音频文件路径或 16kHz 单声道波形
+            language: 音频语言代码，未提供时使用第一个窗口检测到的语言
+            prompt: 提示词
+            temperature: 起始采样温度
+            cancel_token: 取消令牌，在窗口之间检查；调用方停止迭代时自动取消
+            profile: 解码配置名称
+            
+        Yields:
+            每个窗口的结果 {"segments": 新确定的段落 (时间戳相对于整段音频), "language": 语言,
+            "decoding": 到目前为止的解码统计}
+        """
+        loop = asyncio.get_event_loop()
+        decoding = get_profile(profile)
+        stats = DecodeStats.for_profile(decoding)
+        options = {**decoding.transcribe_options(temperature), "fp16": self.device == "cuda"}
+        if language:
+            options["language"] = language
+        
+        # 工作线程逐窗口转录，通过队列把结果交回事件循环
+        results: "asyncio.Queue[Any]" = asyncio.Queue()
+        finished = object()
+        cancel_token = CancellationToken(parent=cancel_token)
+        
+        def worker():
+            try:
+                # 长音频文件解码到 mmap 临时文件，在转录结束前保留
+                with map_long_audio(audio, self.long_audio_seconds) as samples:
+                    if isinstance(samples, str):
+                        samples = whisper.load_audio(samples)
+                    for window in self.pool.iter_windows(samples, options, prompt, cancel_token, stats):
+                        loop.call_soon_threadsafe(results.put_nowait, window)
+            except Exception as e:
+                loop.call_soon_threadsafe(results.put_nowait, e)
+            finally:
+                stats.record(self.model_name)
+                loop.call_soon_threadsafe(results.put_nowait, finished)
+        
+        loop.run_in_executor(None, worker)
+        try:
+            while True:
+                item = await results.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"转录过程中出错: {str(item)}")
+                    raise item
+                yield item
+        finally:
+            # 调用方提前结束 (如客户端断开) 时，工作线程在下一个窗口前停止
+            cancel_token.cancel("调用方已停止接收结果")
+    
     async def transcribe_stream(
         self,
         audio_file: BinaryIO,
@@ -172,13 +536,7 @@ class WhisperTranscriber:
         Returns:
             SRT 格式的时间戳
         """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        milliseconds = int((seconds % 1) * 1000)
-        seconds = int(seconds)
-        
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+        return format_subtitle_timestamp(seconds)
 
     @staticmethod
     def format_result(result: Dict[str, Any], format_type: str = "json") -> Any:
@@ -195,77 +553,24 @@ class WhisperTranscriber:
         if format_type == "text":
             return result["text"]
         elif format_type == "json":
+            # 只保留客户端使用的字段，不返回 tokens 等解码细节
             return {
                 "text": result["text"],
-                "segments": result.get("segments", [])
+                "segments": SegmentTable.from_segments(result.get("segments", [])).to_list(with_id=True)
             }
-        elif format_type == "srt":
-            # 自定义 SRT 格式转换
-            segments = result.get("segments", [])
-            srt_content = []
-            for i, segment in enumerate(segments, start=1):
-                # 转换时间戳为 SRT 格式 (HH:MM:SS,mmm)
-                start_time = WhisperTranscriber.format_timestamp(segment["start"])
-                end_time = WhisperTranscriber.format_timestamp(segment["end"])
-                
-                # 添加字幕段落
-                srt_content.extend([
-                    str(i),  # 字幕序号
-                    f"{start_time} --> {end_time}",  # 时间戳
-                    segment["text"].strip(),  # 字幕文本
-                    ""  # 空行分隔符
-                ])
-            
-            return "\n".join(srt_content)
-        elif format_type == "vtt":
-            # 暂不支持 VTT 格式
-            raise NotImplementedError("VTT format is not supported yet")
+        elif format_type in SUBTITLE_FORMATS:
+            return render_subtitles(result.get("segments", []), format_type)
         else:
             return result 
 
     def format_segments_to_srt(self, segments: List[Dict]) -> str:
         """
-        将 WhisperX 段落格式化为 SRT 字幕格式
+        将带说话者标签的段落格式化为 SRT 字幕格式
         
         Args:
-            segments: WhisperX 段落列表
+            segments: 段落列表
             
         Returns:
             SRT 格式的字符串
         """
-        srt_content = ""
-        
-        for i, segment in enumerate(segments, start=1):
-            start = segment.get("start", 0)
-            end = segment.get("end", 0)
-            text = segment.get("text", "")
-            speaker = segment.get("speaker", "UNKNOWN")
-            
-            # 格式化时间
-            start_time = self._format_timestamp(start)
-            end_time = self._format_timestamp(end)
-            
-            # 添加说话者标签
-            labeled_text = f"[{speaker}] {text}"
-            
-            # 添加 SRT 条目
-            srt_content += f"{i}\n{start_time} --> {end_time}\n{labeled_text}\n\n"
-        
-        return srt_content
-
-    def _format_timestamp(self, seconds: float) -> str:
-        """
-        将秒数格式化为 SRT 时间戳格式 (HH:MM:SS,mmm)
-        
-        Args:
-            seconds: 秒数
-            
-        Returns:
-            格式化的时间戳
-        """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = seconds % 60
-        milliseconds = int((seconds - int(seconds)) * 1000)
-        
-        return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}" 
+        return render_subtitles(segments, "srt", speaker_labels=True)
@@ -0,0 +1,366 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+from .segments import SegmentTable, UNKNOWN_SPEAKER
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    language TEXT,
+    duration REAL,
+    model TEXT,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    rowid INTEGER PRIMARY KEY,
+    transcript_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    speaker TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_transcript ON segments (transcript_id, idx);
+CREATE INDEX IF NOT EXISTS transcripts_created ON transcripts (created_at);
+"""
+
+# 设置保留时间时，写入线程清理过期转录的最短间隔 (秒)
+PRUNE_INTERVAL = 3600.0
+
+
+def _fts_tokenizer() -> str:
+    """
+    三元组分词可匹配中文等不以空格分词的文字中的任意子串 (SQLite 3.34+)，
+    不支持时使用 unicode61 按词匹配
+    """
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(text, tokenize='trigram')")
+        return "trigram"
+    except sqlite3.OperationalError:
+        return "unicode61 remove_diacritics 2"
+
+
+def _match_query(query: str) -> str:
+    """把用户输入的每个词作为 FTS5 短语 (转义引号)，全部出现才匹配，避免 FTS5 语法错误"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class TranscriptIndex:
+    """
+    转录结果的 SQLite 存储与全文索引
+
+    每个结果的段落 (说话者、起止时间、文本) 保存在 segments 表，
+    FTS5 外部内容索引 segments_fts 对段落文本建立全文索引，搜索结果带时间码和高亮片段。
+    写入由单独的线程按顺序执行，不阻塞请求；读取在调用线程上使用各自的连接 (WAL 模式下读写互不阻塞)。
+    设置保留时间时，写入线程在启动时及之后每次写入 (至多每 PRUNE_INTERVAL 秒一次) 删除过期的转录。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        highlight: Tuple[str, str] = ("<mark>", "</mark>"),
+        retention: Optional[float] = None
+    ):
+        """
+        初始化索引
+
+        Args:
+            path: 数据库文件路径
+            highlight: 高亮片段中匹配文字前后的标记
+            retention: 转录的保留时间 (秒)，None 时永久保存
+        """
+        self.path = path
+        self.highlight = highlight
+        self.retention = retention
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        row = connection.execute("SELECT sql FROM sqlite_master WHERE name = 'segments_fts'").fetchone()
+        if row is None:
+            self.tokenizer = _fts_tokenizer()
+            connection.execute(
+                "CREATE VIRTUAL TABLE segments_fts USING fts5("
+                f"text, content='segments', content_rowid='rowid', tokenize='{self.tokenizer}')"
+            )
+        else:
+            self.tokenizer = "trigram" if "trigram" in row[0] else "unicode61"
+        connection.commit()
+        connection.close()
+
+        self._local = threading.local()
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="transcript-index", daemon=True)
+        self._writer.start()
+        logger.info(
+            f"转录索引: {path} (分词: {self.tokenizer}, "
+            f"保留: {'永久' if retention is None else f'{retention / 86400:g} 天'})"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def add(self, result: Dict[str, Any], model: Optional[str] = None) -> None:
+        """
+        将 ResultStore 中的结果加入写入队列
+
+        Args:
+            result: 结果 (id, created_at, text, language, duration, segments)
+            model: 使用的模型
+        """
+        self._queue.put((result, model))
+
+    def _write_loop(self) -> None:
+        connection = self._connect()
+        last_prune = None
+        while True:
+            if self.retention is not None and (
+                last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL
+            ):
+                last_prune = time.monotonic()
+                try:
+                    self._prune(connection)
+                except Exception as e:
+                    logger.error(f"清理转录索引时出错: {str(e)}")
+            item = self._queue.get()
+            if item is None:
+                connection.close()
+                self._queue.task_done()
+                return
+            try:
+                self._write(connection, *item)
+            except Exception as e:
+                logger.error(f"写入转录索引时出错: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, connection: sqlite3.Connection, result: Dict[str, Any], model: Optional[str]) -> None:
+        segments: SegmentTable = result["segments"]
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO transcripts (id, created_at, language, duration, model, text) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (result["id"], result["created_at"], result["language"], result["duration"], model, result["text"])
+            )
+            first = connection.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM segments").fetchone()[0]
+            connection.executemany(
+                "INSERT INTO segments (rowid, transcript_id, idx, speaker, start, end, text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (first + i, result["id"], i, row["speaker"], row["start"], row["end"], row["text"])
+                    for i, row in enumerate(segments.rows())
+                )
+            )
+            connection.execute(
+                "INSERT INTO segments_fts (rowid, text) SELECT rowid, text FROM segments WHERE rowid >= ?",
+                (first,)
+            )
+
+    def _prune(self, connection: sqlite3.Connection) -> None:
+        """删除早于保留时间的转录及其段落，外部内容索引须先按原文删除对应的词元"""
+        cutoff = time.time() - self.retention
+        expired = "SELECT id FROM transcripts WHERE created_at < ?"
+        with connection:
+            connection.execute(
+                "INSERT INTO segments_fts (segments_fts, rowid, text) "
+                f"SELECT 'delete', rowid, text FROM segments WHERE transcript_id IN ({expired})",
+                (cutoff,)
+            )
+            connection.execute(f"DELETE FROM segments WHERE transcript_id IN ({expired})", (cutoff,))
+            removed = connection.execute("DELETE FROM transcripts WHERE created_at < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"已从转录索引删除 {removed} 个过期转录")
+
+    def flush(self) -> None:
+        """等待写入队列中的结果全部写入"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """写完队列中的结果后停止写入线程"""
+        self._queue.put(None)
+        self._writer.join()
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """读取已保存的结果，格式与 ResultStore 相同，不存在时返回 None"""
+        connection = self._reader()
+        row = connection.execute(
+            "SELECT id, created_at, text, language, duration FROM transcripts WHERE id = ?", (result_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        table = SegmentTable()
+        for speaker, start, end, text in connection.execute(
+            "SELECT speaker, start, end, text FROM segments WHERE transcript_id = ? ORDER BY idx", (result_id,)
+        ):
+            table.append(start, end, text, speaker)
+        return {
+            "id": row[0],
+            "created_at": row[1],
+            "text": row[2],
+            "language": row[3],
+            "duration": row[4],
+            "segments": table
+        }
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        speaker: Optional[str] = None,
+        language: Optional[str] = None,
+        transcript_id: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        order: str = "recent",
+        context: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        全文搜索段落
+
+        Args:
+            query: 搜索词，以空格分隔的多个词须全部出现
+            limit: 返回的段落数
+            offset: 跳过的段落数 (分页)
+            speaker: 只搜索该说话者的段落
+            language: 只搜索该语言的转录
+            transcript_id: 只搜索该转录
+            start: 只返回结束于该时间 (秒) 之后的段落
+            end: 只返回开始于该时间 (秒) 之前的段落
+            order: recent (最新的转录优先，找到 limit 个匹配即停止) 或 relevance (按 BM25 相关度，
+                需要为全部匹配打分，常见词较慢)
+            context: 高亮片段包含的词元数，默认按分词方式约为 60 个字符
+
+        Returns:
+            {"results": [...], "has_more": bool}
+        """
+        terms = query.split()
+        if not terms:
+            raise ValueError("搜索词不能为空")
+        if order not in ("recent", "relevance"):
+            raise ValueError(f"不支持的排序: {order}，支持: recent, relevance")
+
+        filters = []
+        params: List[Any] = []
+        if speaker:
+            filters.append("s.speaker = ?")
+            params.append(speaker)
+        if language:
+            filters.append("t.language = ?")
+            params.append(language)
+        if transcript_id:
+            filters.append("s.transcript_id = ?")
+            params.append(transcript_id)
+        if start is not None:
+            filters.append("s.end >= ?")
+            params.append(start)
+        if end is not None:
+            filters.append("s.start <= ?")
+            params.append(end)
+        where = "".join(f" AND {condition}" for condition in filters)
+        columns = "s.transcript_id, s.idx, s.speaker, s.start, s.end, s.text, t.created_at, t.language"
+
+        if self.tokenizer == "trigram" and min(len(term) for term in terms) < 3:
+            # 三元组索引无法匹配少于 3 个字符的词，从最新的段落开始按子串扫描
+            sql = (
+                f"SELECT {columns} FROM segments s JOIN transcripts t ON t.id = s.transcript_id "
+                "WHERE " + " AND ".join("s.text LIKE ? ESCAPE '\\'" for _ in terms) + where +
+                " ORDER BY s.rowid DESC LIMIT ? OFFSET ?"
+            )
+            patterns = [
+                "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for term in terms
+            ]
+            rows = self._reader().execute(sql, patterns + params + [limit + 1, offset]).fetchall()
+            snippets = [self._highlight(row[5], terms) for row in rows]
+        else:
+            open_tag, close_tag = self.highlight
+            if context is None:
+                # 三元组分词的词元约为一个字符
+                context = 64 if self.tokenizer == "trigram" else 12
+            sql = (
+                f"SELECT {columns}, snippet(segments_fts, 0, ?, ?, '…', ?) "
+                "FROM segments_fts JOIN segments s ON s.rowid = segments_fts.rowid "
+                "JOIN transcripts t ON t.id = s.transcript_id "
+                "WHERE segments_fts MATCH ?" + where +
+                (" ORDER BY segments_fts.rank" if order == "relevance" else " ORDER BY segments_fts.rowid DESC") +
+                " LIMIT ? OFFSET ?"
+            )
+            rows = self._reader().execute(
+                sql, [open_tag, close_tag, context, _match_query(query)] + params + [limit + 1, offset]
+            ).fetchall()
+            snippets = [row[8] for row in rows]
+
+        results = [
+            {
+                "result_id": row[0],
+                "segment": row[1],
+                "speaker": row[2] or UNKNOWN_SPEAKER,
+                "start": row[3],
+                "end": row[4],
+                "text": row[5],
+                "snippet": snippet,
+                "created_at": row[6],
+                "language": row[7]
+            }
+            for row, snippet in zip(rows[:limit], snippets)
+        ]
+        return {"results": results, "has_more": len(rows) > limit}
+
+    def _highlight(self, text: str, terms: List[str]) -> str:
+        """在文本中标记搜索词 (不区分大小写)"""
+        open_tag, close_tag = self.highlight
+        lower = text.lower()
+        marks = []
+        for term in terms:
+            term = term.lower()
+            position = lower.find(term)
+            while position >= 0:
+                marks.append((position, position + len(term)))
+                position = lower.find(term, position + len(term))
+        if not marks:
+            return text
+        marks.sort()
+        merged = [list(marks[0])]
+        for begin, finish in marks[1:]:
+            if begin <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], finish)
+            else:
+                merged.append([begin, finish])
+        parts = []
+        cursor = 0
+        for begin, finish in merged:
+            parts.append(text[cursor:begin] + open_tag + text[begin:finish] + close_tag)
+            cursor = finish
+        parts.append(text[cursor:])
+        return "".join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        """已索引的转录数和段落数"""
+        connection = self._reader()
+        return {
+            "transcripts": connection.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0],
+            "segments": connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0],
+            "pending": self._queue.qsize(),
+            "tokenizer": self.tokenizer
+        }
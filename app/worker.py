@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Any, Optional
+
+from .broker import FileBroker
+from .cancellation import TranscriptionCancelled
+from .diarization import SpeakerDiarization
+from .scheduler import Job
+from .transcriber import WhisperTranscriber
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class InferenceWorker:
+    """
+    推理节点
+
+    从任务队列领取已加载模型的任务，用 WhisperTranscriber / SpeakerDiarization 执行，
+    并把进度、窗口段落和结果写回队列。同时处理的任务数等于模型副本总数，
+    已领取的任务之间仍由模型池按优先级和客户端公平调度。
+    """
+
+    def __init__(
+        self,
+        broker: FileBroker,
+        model_names: List[str],
+        replicas: int = 1,
+        worker_id: Optional[str] = None,
+        poll_interval: float = 0.1,
+        heartbeat_interval: float = 5.0,
+        lease_timeout: float = 60.0,
+        long_audio_seconds: Optional[float] = 600.0
+    ):
+        """
+        初始化推理节点并加载模型
+
+        Args:
+            broker: 任务队列
+            model_names: 加载的 Whisper 模型
+            replicas: 每个模型的副本数
+            worker_id: 节点 ID，默认为主机名加随机后缀
+            poll_interval: 空闲时检查新任务的间隔 (秒)
+            heartbeat_interval: 心跳和取消标记的检查间隔 (秒)
+            lease_timeout: 任务心跳超时 (秒)，超时的任务视为节点已失联
+            long_audio_seconds: 不短于此时长 (秒) 的音频解码到 mmap 临时文件并逐窗口转录
+        """
+        self.broker = broker
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_timeout = lease_timeout
+
+        self.transcribers: Dict[str, WhisperTranscriber] = {
+            name: WhisperTranscriber(model_name=name, replicas=replicas, long_audio_seconds=long_audio_seconds)
+            for name in model_names
+        }
+        self.diarizations: Dict[str, SpeakerDiarization] = {
+            name: SpeakerDiarization(
+                align_method="whisper", model_pool=model.pool, long_audio_seconds=long_audio_seconds
+            )
+            for name, model in self.transcribers.items()
+        }
+        self.slots = sum(model.replicas for model in self.transcribers.values())
+        self.active: Dict[str, asyncio.Task] = {}
+        self.running = False
+
+    async def run(self) -> None:
+        """领取并处理任务，直到 stop() 被调用"""
+        self.running = True
+        models = list(self.transcribers)
+        logger.info(f"推理节点 {self.worker_id} 已启动，模型: {', '.join(models)}，并发数: {self.slots}")
+        last_heartbeat = 0.0
+        loop = asyncio.get_event_loop()
+        try:
+            while self.running:
+                now = time.monotonic()
+                if now - last_heartbeat >= self.heartbeat_interval:
+                    last_heartbeat = now
+                    self._register()
+                    await loop.run_in_executor(None, lambda: self.broker.fail_stale(self.lease_timeout))
+
+                spec = None
+                if len(self.active) < self.slots:
+                    spec = await loop.run_in_executor(None, lambda: self.broker.claim(models))
+                if spec is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+
+                task = asyncio.ensure_future(self._process(spec))
+                self.active[spec["id"]] = task
+                task.add_done_callback(lambda _, task_id=spec["id"]: self.active.pop(task_id, None))
+        finally:
+            for task in list(self.active.values()):
+                task.cancel()
+            self.broker.unregister_worker(self.worker_id)
+
+    def stop(self) -> None:
+        self.running = False
+
+    def _register(self) -> None:
+        self.broker.register_worker(self.worker_id, {
+            "models": {name: model.replicas for name, model in self.transcribers.items()},
+            "slots": self.slots,
+            "active": len(self.active),
+            "pid": os.getpid()
+        })
+
+    async def _process(self, spec: Dict[str, Any]) -> None:
+        """处理一个任务，结果或错误写入任务事件"""
+        task_id = spec["id"]
+        timeout = None
+        if spec.get("deadline") is not None:
+            # 截止时间已过时仍创建令牌，第一次检查即超时
+            timeout = max(spec["deadline"] - time.time(), 1e-3)
+        token = Job(
+            spec.get("priority", "interactive"),
+            spec.get("client_id", "anonymous"),
+            cost=spec.get("cost", 1.0),
+            timeout=timeout
+        )
+        watcher = asyncio.ensure_future(self._watch(spec, token))
+        logger.info(f"处理任务 {task_id} ({spec['kind']}, {spec['model']}, {spec.get('priority')})")
+        try:
+            data = await self._execute(spec, token)
+            self.broker.emit(task_id, {"type": "result", "data": data})
+        except TranscriptionCancelled as e:
+            logger.info(f"任务 {task_id} 已取消: {e.reason}")
+            self.broker.emit(task_id, {"type": "error", "error": e.reason, "cancelled": True, "timed_out": e.timed_out})
+        except Exception as e:
+            logger.error(f"任务 {task_id} 处理失败: {str(e)}")
+            self.broker.emit(task_id, {"type": "error", "error": str(e)})
+        finally:
+            watcher.cancel()
+            self.broker.finish(spec)
+
+    async def _watch(self, spec: Dict[str, Any], token: Job) -> None:
+        """
+        定期更新任务心跳，发现取消标记时取消令牌
+
+        取消后继续更新心跳，直到 _process 结束时停止本协程：正在进行的解码要到下一个窗口
+        才停止，期间停止心跳会让其他节点的 fail_stale 误报推理节点失联
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            if not token.cancelled:
+                reason = await loop.run_in_executor(None, lambda: self.broker.cancel_reason(spec["id"]))
+                if reason is not None:
+                    token.cancel(reason)
+            await loop.run_in_executor(None, lambda: self.broker.heartbeat(spec))
+            await asyncio.sleep(min(self.heartbeat_interval, 0.5))
+
+    async def _execute(self, spec: Dict[str, Any], token: Job) -> Any:
+        """按任务类型调用本地转录器或说话者识别"""
+        task_id = spec["id"]
+        kind = spec["kind"]
+        model = spec["model"]
+        options = spec.get("options", {})
+        loop = asyncio.get_event_loop()
+        audio = await loop.run_in_executor(None, lambda: self.broker.load_audio(spec))
+        transcriber = self.transcribers[model]
+
+        if kind == "transcribe":
+            async def progress_callback(progress: float):
+                self.broker.emit(task_id, {"type": "progress", "progress": progress})
+
+            return await transcriber.transcribe_audio(
+                audio,
+                language=options.get("language"),
+                prompt=options.get("prompt"),
+                temperature=options.get("temperature", 0.0),
+                progress_callback=progress_callback,
+                cancel_token=token,
+                profile=options.get("profile")
+            )
+        if kind == "windows":
+            async for window in transcriber.transcribe_windows(
+                audio,
+                options.get("language"),
+                options.get("prompt"),
+                options.get("temperature", 0.0),
+                token,
+                profile=options.get("profile")
+            ):
+                if not self.broker.emit(task_id, {"type": "window", "data": window}):
+                    token.cancel("前端已停止接收结果")
+            return {}
+        if kind == "detect_language":
+            return list(await transcriber.detect_language(audio, cancel_token=token))
+        if kind == "diarize":
+            return await self.diarizations[model].diarize(
+                audio,
+                transcription=options.get("transcription"),
+                cancel_token=token,
+                language=options.get("language"),
+                profile=options.get("profile")
+            )
+        raise ValueError(f"未知的任务类型: {kind}")
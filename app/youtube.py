@@ -2,6 +2,7 @@ import os
 import tempfile
 import logging
 import asyncio
+import shutil
 from typing import Optional
 import yt_dlp
 
@@ -111,4 +112,27 @@ class YouTubeDownloader:
             
     def is_valid_youtube_url(self, url: str) -> bool:
         """检查URL是否为有效的YouTube链接"""
-        return "youtube.com" in url or "youtu.be" in url
\ No newline at end of file
+        return "youtube.com" in url or "youtu.be" in url
+
+
+class FixtureDownloader(YouTubeDownloader):
+    """
+    负载测试用的下载器：不访问网络，把本地音频文件复制到临时目录作为下载结果
+
+    通过环境变量 WHISPER_STT_YOUTUBE_FIXTURE 启用，WHISPER_STT_YOUTUBE_DELAY 模拟下载耗时 (秒)
+    """
+    
+    def __init__(self, fixture_path: str, delay: float = 0.0):
+        super().__init__()
+        self.fixture_path = fixture_path
+        self.delay = delay
+    
+    async def download_audio(self, url: str) -> Optional[str]:
+        """返回固定音频的副本，调用方会在转录后删除它及其目录"""
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        temp_dir = tempfile.mkdtemp()
+        target = os.path.join(temp_dir, "audio" + os.path.splitext(self.fixture_path)[1])
+        shutil.copyfile(self.fixture_path, target)
+        logger.info(f"使用测试音频代替YouTube下载: {url}")
+        return target
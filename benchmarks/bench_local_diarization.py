@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地说话者识别基准测试
+
+在同一段录音上比较本地引擎 (各嵌入模型) 与 pyannote 管线的耗时，
+提供 RTTM 参考标注时同时计算说话者识别错误率 (DER)：
+python benchmarks/bench_local_diarization.py meeting.wav --reference meeting.rttm
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import whisper
+
+from app.local_diarization import LocalDiarizer, SAMPLE_RATE
+
+
+def load_rttm(path: str):
+    """读取 RTTM 参考标注为 pyannote Annotation"""
+    from pyannote.core import Annotation, Segment
+
+    annotation = Annotation()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 8 and fields[0] == "SPEAKER":
+                start, duration = float(fields[3]), float(fields[4])
+                annotation[Segment(start, start + duration)] = fields[7]
+    return annotation
+
+
+def to_annotation(turns):
+    from pyannote.core import Annotation, Segment
+
+    annotation = Annotation()
+    for turn in turns:
+        annotation[Segment(turn["start"], turn["end"])] = turn["speaker"]
+    return annotation
+
+
+def run_pyannote(audio, device: str):
+    """whisperx 封装的 pyannote 说话者识别管线 (与 SpeakerDiarization 的用法相同)"""
+    import whisperx
+
+    pipeline = whisperx.DiarizationPipeline(use_auth_token=None, device=device)
+    frame = pipeline(audio)
+    return [
+        {"start": float(row["start"]), "end": float(row["end"]), "speaker": row["speaker"]}
+        for _, row in frame.iterrows()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地说话者识别基准测试")
+    parser.add_argument("audio", help="音频文件")
+    parser.add_argument("--models", default="ecapa,mfcc", help="比较的嵌入模型，以逗号分隔 (默认: ecapa,mfcc)")
+    parser.add_argument("--reference", default=None, help="RTTM 参考标注，提供时计算 DER")
+    parser.add_argument("--device", default="cpu", help="运行设备 (默认: cpu)")
+    parser.add_argument("--skip-pyannote", action="store_true", help="跳过 pyannote 管线")
+    args = parser.parse_args()
+
+    audio = whisper.load_audio(args.audio)
+    duration = len(audio) / SAMPLE_RATE
+    print(f"音频时长 {duration:.0f}s")
+
+    metric = None
+    reference = None
+    if args.reference:
+        from pyannote.metrics.diarization import DiarizationErrorRate
+
+        metric = DiarizationErrorRate()
+        reference = load_rttm(args.reference)
+
+    runs = [(f"local/{name}", name) for name in args.models.split(",") if name]
+    if not args.skip_pyannote:
+        runs.append(("pyannote", None))
+
+    for label, model_name in runs:
+        if model_name is None:
+            start = time.perf_counter()
+            turns = run_pyannote(audio, args.device)
+            elapsed = time.perf_counter() - start
+        else:
+            # 模型加载不计入耗时
+            diarizer = LocalDiarizer(embedding_model=model_name, device=args.device)
+            start = time.perf_counter()
+            turns = diarizer(audio)
+            elapsed = time.perf_counter() - start
+
+        speakers = len({turn["speaker"] for turn in turns})
+        line = f"{label}: {elapsed:.1f}s (RTF {elapsed / duration:.3f}), {speakers} 位说话者"
+        if metric is not None:
+            line += f", DER {metric(reference, to_annotation(turns)) * 100:.1f}%"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+响应序列化基准测试
+
+在合成的长转录上比较原先的响应构建方式 (原始 Whisper 段落 / 逐段 pydantic 对象)
+与段落表 + 直接序列化:
+python benchmarks/bench_serialization.py --hours 3
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.segments import SegmentTable, dumps
+
+
+def make_transcription(hours: float, seed: int = 0):
+    """生成与 Whisper 输出结构相同的合成段落 (含 tokens 和解码统计)"""
+    rng = random.Random(seed)
+    duration = hours * 3600
+    segments = []
+    t = 0.0
+    while t < duration:
+        length = rng.uniform(1.0, 6.0)
+        words = rng.randint(4, 25)
+        segments.append({
+            "id": len(segments),
+            "seek": int(t // 30) * 3000,
+            "start": t,
+            "end": t + length,
+            "text": " " + " ".join("word" for _ in range(words)),
+            "tokens": [rng.randrange(50000) for _ in range(int(words * 1.3))],
+            "temperature": 0.0,
+            "avg_logprob": -rng.random(),
+            "compression_ratio": 1.0 + rng.random(),
+            "no_speech_prob": rng.random() / 10,
+            "speaker": f"SPEAKER_{rng.randrange(4):02d}"
+        })
+        t += length + rng.uniform(0.0, 1.0)
+    return segments
+
+
+def measure(name: str, build, repeat: int):
+    """运行构建函数，输出耗时、峰值内存和响应大小"""
+    tracemalloc.start()
+    payload = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:<28} {elapsed * 1000:8.1f} ms  峰值内存 {peak / 1e6:7.1f} MB  响应 {len(payload) / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应序列化基准测试")
+    parser.add_argument("--hours", type=float, default=3.0, help="合成转录时长 (小时)")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+
+    segments = make_transcription(args.hours)
+    print(f"{len(segments)} 个段落")
+
+    measure("原始段落 json.dumps", lambda: json.dumps({"segments": segments}, ensure_ascii=False), args.repeat)
+
+    try:
+        from fastapi.encoders import jsonable_encoder
+        from app.models import DiarizationSegment
+
+        def pydantic_path():
+            models = [
+                DiarizationSegment(speaker=s["speaker"], start=s["start"], end=s["end"], text=s["text"])
+                for s in segments
+            ]
+            return json.dumps(jsonable_encoder({"segments": models}), ensure_ascii=False)
+
+        measure("pydantic + jsonable_encoder", pydantic_path, args.repeat)
+    except ImportError:
+        print("未安装 fastapi/pydantic，跳过 pydantic 路径")
+
+    measure("段落表 + dumps", lambda: dumps({"segments": SegmentTable.from_segments(segments).to_list()}), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
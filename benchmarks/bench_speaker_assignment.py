@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+说话者分配基准测试
+
+在合成的长会议转录上比较扫描线分配与逐条匹配全部轮次的朴素做法：
+python benchmarks/bench_speaker_assignment.py --hours 3
+"""
+
+import argparse
+import copy
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.speaker_assignment import assign_word_speakers, normalize_turns
+
+
+def make_meeting(hours: float, speakers: int, seed: int = 0):
+    """生成合成的说话者轮次和带词级时间戳的转录"""
+    rng = random.Random(seed)
+    duration = hours * 3600
+    turns = []
+    t = 0.0
+    while t < duration:
+        length = rng.uniform(2.0, 20.0)
+        turns.append({"start": t, "end": min(t + length, duration), "speaker": f"SPEAKER_{rng.randrange(speakers):02d}"})
+        # 偶尔出现重叠语音
+        t += length - (rng.uniform(0.0, 1.0) if rng.random() < 0.1 else 0.0)
+
+    segments = []
+    t = 0.0
+    while t < duration:
+        words = []
+        for _ in range(rng.randint(8, 30)):
+            length = rng.uniform(0.15, 0.6)
+            words.append({"word": " w", "start": t, "end": t + length})
+            t += length + rng.uniform(0.0, 0.2)
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "text": "w" * len(words), "words": words})
+        t += rng.uniform(0.0, 1.5)
+    return turns, {"segments": segments}
+
+
+def naive_assign(turns, result):
+    """逐条比较全部轮次的朴素实现 (与 whisperx.assign_word_speakers 的复杂度相同)"""
+    sorted_turns = normalize_turns(turns)
+
+    def best(item):
+        overlap = {}
+        for start, end, speaker in sorted_turns:
+            duration = min(end, item["end"]) - max(start, item["start"])
+            if duration > 0:
+                overlap[speaker] = overlap.get(speaker, 0.0) + duration
+        if overlap:
+            item["speaker"] = max(overlap, key=overlap.get)
+
+    for segment in result["segments"]:
+        best(segment)
+        for word in segment["words"]:
+            best(word)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="说话者分配基准测试")
+    parser.add_argument("--hours", type=float, default=3.0, help="合成会议时长 (默认: 3 小时)")
+    parser.add_argument("--speakers", type=int, default=6, help="说话者数量 (默认: 6)")
+    parser.add_argument("--skip-naive", action="store_true", help="跳过朴素实现")
+    args = parser.parse_args()
+
+    turns, result = make_meeting(args.hours, args.speakers)
+    words = sum(len(segment["words"]) for segment in result["segments"])
+    print(f"时长 {args.hours} 小时: {len(turns)} 个轮次, {len(result['segments'])} 个段落, {words} 个词")
+
+    sweep_input = copy.deepcopy(result)
+    start = time.perf_counter()
+    assign_word_speakers(turns, sweep_input, split_segments=False)
+    sweep_time = time.perf_counter() - start
+    print(f"扫描线: {sweep_time * 1000:.1f} ms")
+
+    if args.skip_naive:
+        return
+
+    naive_input = copy.deepcopy(result)
+    start = time.perf_counter()
+    naive_assign(turns, naive_input)
+    naive_time = time.perf_counter() - start
+    print(f"朴素实现: {naive_time * 1000:.1f} ms ({naive_time / sweep_time:.0f}x)")
+
+    mismatches = sum(
+        a.get("speaker") != b.get("speaker")
+        for seg_a, seg_b in zip(sweep_input["segments"], naive_input["segments"])
+        for a, b in zip([seg_a] + seg_a["words"], [seg_b] + seg_b["words"])
+    )
+    print(f"结果不一致的条目: {mismatches}")
+
+    split_input = copy.deepcopy(result)
+    start = time.perf_counter()
+    split = assign_word_speakers(turns, split_input)
+    print(f"扫描线 + 按说话者切分: {(time.perf_counter() - start) * 1000:.1f} ms, {len(split['segments'])} 个段落")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+转录索引基准测试
+
+写入合成的转录存档后测量全文搜索的延迟:
+python benchmarks/bench_transcript_index.py --segments 300000
+"""
+
+import argparse
+import itertools
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.results import ResultStore
+from app.transcript_index import TranscriptIndex
+
+# 排在词表前面的词出现得更频繁
+TOPIC_WORDS = (
+    "the and we to budget meeting project deadline customer support release schedule review design "
+    "team quarter revenue forecast contract invoice server outage latency deploy rollback "
+    "我们讨论预算问题 客户合同 项目进度 会议纪要 发布计划 服务器延迟"
+).split()
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    """主题词加随机生成的词，按 Zipf 分布抽样"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = TOPIC_WORDS + [
+        "".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size - len(TOPIC_WORDS))
+    ]
+    cumulative = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+    return words, cumulative
+
+
+def make_archive(segments: int, per_transcript: int, seed: int = 0):
+    """生成合成的转录存档，每个转录 per_transcript 个段落"""
+    rng = random.Random(seed)
+    words, cumulative = make_vocabulary(20000, rng)
+    for first in range(0, segments, per_transcript):
+        rows = []
+        t = 0.0
+        for _ in range(min(per_transcript, segments - first)):
+            length = rng.uniform(1.0, 6.0)
+            text = " " + " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(4, 20)))
+            rows.append({"start": t, "end": t + length, "text": text, "speaker": f"SPEAKER_{rng.randrange(4):02d}"})
+            t += length
+        yield rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转录索引基准测试")
+    parser.add_argument("--segments", type=int, default=300000, help="段落总数")
+    parser.add_argument("--per-transcript", type=int, default=1000, help="每个转录的段落数")
+    parser.add_argument("--repeat", type=int, default=20, help="每个查询的重复次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = TranscriptIndex(str(Path(directory) / "transcripts.db"))
+        store = ResultStore(max_results=1, index=index)
+
+        start = time.perf_counter()
+        for rows in make_archive(args.segments, args.per_transcript):
+            store.save(" ".join(row["text"] for row in rows), rows, language="en")
+        index.flush()
+        elapsed = time.perf_counter() - start
+        print(f"写入 {args.segments} 个段落: {elapsed:.1f}s ({args.segments / elapsed:,.0f} 段落/秒)")
+
+        queries = [
+            ("罕见词组", {"query": "outage rollback latency deploy"}),
+            ("常见词", {"query": "budget"}),
+            ("常见词 (相关度)", {"query": "budget", "order": "relevance"}),
+            ("按说话者过滤", {"query": "contract invoice", "speaker": "SPEAKER_01"}),
+            ("时间范围", {"query": "release schedule", "start": 600, "end": 900}),
+            ("中文", {"query": "预算问题"}),
+            ("未出现的词", {"query": "nonexistent"}),
+            ("短词 (子串扫描)", {"query": "预算"}),
+        ]
+        for name, query in queries:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                found = index.search(limit=20, **query)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(
+                f"{name:<16} p50 {timings[len(timings) // 2] * 1000:7.2f} ms  "
+                f"最大 {timings[-1] * 1000:7.2f} ms  结果 {len(found['results'])}"
+            )
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+负载测试
+
+把请求轨迹回放到本地服务器，报告延迟分位数、错误率和吞吐饱和曲线:
+python benchmarks/loadtest.py benchmarks/traces/mixed.jsonl --start-server --qps 0.25,0.5,1,2
+
+轨迹为 JSONL，每行一个请求:
+{"endpoint": "/api/transcribe", "audio": "synthetic:30", "options": {"enable_diarization": false}, "at": 0.0}
+
+- endpoint: /v1/audio/transcriptions, /api/transcribe, /api/transcribe/batch,
+  /api/transcribe/youtube 或 /api/transcribe/ws
+- audio: 相对于轨迹文件的音频路径，或 synthetic:<秒数> (生成合成音频)
+- options: 表单字段；批量请求可用 files 指定文件数，WebSocket 为会话配置，可用 chunks 指定发送的音频块数
+- at: 到达时间 (秒)，未指定 --qps / --concurrency 时按此时间回放
+
+--qps 为开环固定速率，--concurrency 为闭环并发数；给出多个值 (逗号分隔) 时依次运行，
+得到吞吐饱和曲线。--start-server 在本地启动 run.py，YouTube 请求使用测试音频代替下载。
+需要 httpx 和 websockets (pip install -r requirements-dev.txt)。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+try:
+    import httpx
+    import websockets
+except ImportError:
+    sys.exit("负载测试需要 httpx 和 websockets: pip install httpx websockets")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HTTP_ENDPOINTS = [
+    "/v1/audio/transcriptions",
+    "/api/transcribe",
+    "/api/transcribe/batch",
+    "/api/transcribe/youtube",
+]
+WS_ENDPOINT = "/api/transcribe/ws"
+
+
+@dataclass
+class TraceEntry:
+    """轨迹中的一个请求"""
+    endpoint: str
+    audio: Optional[str]
+    options: Dict[str, Any] = field(default_factory=dict)
+    at: float = 0.0
+
+
+@dataclass
+class Sample:
+    """一个请求的测量结果"""
+    endpoint: str
+    ok: bool
+    latency: float
+    first_byte: Optional[float] = None
+    status: Optional[int] = None
+    error: Optional[str] = None
+    finished: Optional[float] = None
+
+
+def make_synthetic(seconds: float, path: str, seed: int = 0) -> None:
+    """生成 16kHz 单声道 WAV：音高变化的谐波加噪声，间以静音，近似语音的能量起伏"""
+    rng = np.random.default_rng(seed)
+    sample_rate = 16000
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = (np.sin(2 * np.pi * 0.5 * t) > -0.3).astype(np.float64)
+    audio = 0.3 * voiced * envelope + 0.02 * rng.standard_normal(len(t))
+    pcm = (np.clip(audio, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def load_trace(path: str, fixture_dir: str) -> List[TraceEntry]:
+    """读取轨迹，解析音频路径并生成需要的合成音频"""
+    base = Path(path).resolve().parent
+    entries = []
+    synthetic: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            endpoint = item["endpoint"]
+            if endpoint not in HTTP_ENDPOINTS and endpoint != WS_ENDPOINT:
+                raise ValueError(f"第 {number} 行: 不支持的端点 {endpoint}")
+
+            audio = item.get("audio")
+            if audio and audio.startswith("synthetic:"):
+                if audio not in synthetic:
+                    synthetic[audio] = os.path.join(fixture_dir, f"synthetic_{audio.split(':', 1)[1]}s.wav")
+                    make_synthetic(float(audio.split(":", 1)[1]), synthetic[audio], seed=len(synthetic))
+                audio = synthetic[audio]
+            elif audio:
+                audio = str((base / audio).resolve())
+            elif endpoint != "/api/transcribe/youtube":
+                raise ValueError(f"第 {number} 行: 缺少 audio")
+
+            entries.append(TraceEntry(endpoint, audio, item.get("options", {}), float(item.get("at", 0.0))))
+    if not entries:
+        raise ValueError("轨迹为空")
+    return entries
+
+
+def form_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+class LoadClient:
+    """向服务器发送轨迹中的请求并测量"""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = "ws" + self.base_url[len("http"):]
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(base_url=self.base_url, timeout=timeout)
+        self._audio: Dict[str, bytes] = {}
+
+    def audio_bytes(self, path: str) -> bytes:
+        if path not in self._audio:
+            with open(path, "rb") as f:
+                self._audio[path] = f.read()
+        return self._audio[path]
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def send(self, entry: TraceEntry) -> Sample:
+        start = time.perf_counter()
+        try:
+            if entry.endpoint == WS_ENDPOINT:
+                return await asyncio.wait_for(self._send_ws(entry, start), self.timeout)
+            return await self._send_http(entry, start)
+        except Exception as e:
+            return Sample(entry.endpoint, False, time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+
+    async def _send_http(self, entry: TraceEntry, start: float) -> Sample:
+        options = dict(entry.options)
+        data = {}
+        files: List[Tuple[str, Tuple[str, bytes]]] = []
+        if entry.endpoint == "/api/transcribe/youtube":
+            data["url"] = options.pop("url", "https://www.youtube.com/watch?v=loadtest")
+        elif entry.endpoint == "/api/transcribe/batch":
+            count = int(options.pop("files", 1))
+            name = os.path.basename(entry.audio)
+            files = [("files", (f"{i}_{name}", self.audio_bytes(entry.audio))) for i in range(count)]
+        else:
+            files = [("file", (os.path.basename(entry.audio), self.audio_bytes(entry.audio)))]
+        data.update({key: form_value(value) for key, value in options.items()})
+
+        first_byte = None
+        chunks = []
+        async with self.client.stream("POST", entry.endpoint, data=data, files=files or None) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                chunks.append(chunk)
+        latency = time.perf_counter() - start
+        body = b"".join(chunks).decode("utf-8", errors="replace")
+
+        error = None
+        if response.status_code >= 400:
+            error = f"HTTP {response.status_code}: {body[:200]}"
+        else:
+            error = self._body_error(entry, body)
+        return Sample(entry.endpoint, error is None, latency, first_byte, response.status_code, error)
+
+    @staticmethod
+    def _body_error(entry: TraceEntry, body: str) -> Optional[str]:
+        """流式响应和批量响应以 200 返回，错误在事件或逐行结果中"""
+        if entry.endpoint == "/api/transcribe/batch":
+            failed = [json.loads(line) for line in body.splitlines() if line.strip()]
+            failed = [line for line in failed if line.get("status") != "ok"]
+            return f"{len(failed)} 个文件失败: {failed[0].get('error')}" if failed else None
+        if str(entry.options.get("stream", "")).lower() == "true" or entry.options.get("stream") is True:
+            for line in body.splitlines():
+                payload = line[len("data: "):] if line.startswith("data: ") else line
+                if payload.startswith("{") and json.loads(payload).get("type") == "error":
+                    return json.loads(payload).get("error")
+        return None
+
+    async def _send_ws(self, entry: TraceEntry, start: float) -> Sample:
+        options = dict(entry.options)
+        chunks = int(options.pop("chunks", 1))
+        data = self.audio_bytes(entry.audio)
+        first_byte = None
+        url = f"{self.ws_url}{WS_ENDPOINT}/loadtest-{uuid.uuid4().hex[:8]}"
+        async with websockets.connect(url, max_size=None) as ws:
+            if options:
+                await ws.send(json.dumps({"type": "config", "data": options}))
+                reply = json.loads(await ws.recv())
+                if reply.get("type") == "error":
+                    return Sample(entry.endpoint, False, time.perf_counter() - start, error=reply["data"]["error"])
+
+            for _ in range(chunks):
+                await ws.send(data)
+                while True:
+                    message = json.loads(await ws.recv())
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+                    if message.get("type") == "error":
+                        return Sample(
+                            entry.endpoint, False, time.perf_counter() - start, first_byte,
+                            error=message["data"].get("error")
+                        )
+                    if message.get("type") == "complete":
+                        break
+        return Sample(entry.endpoint, True, time.perf_counter() - start, first_byte)
+
+
+async def run_replay(client: LoadClient, entries: List[TraceEntry], speed: float) -> List[Sample]:
+    """按轨迹中的到达时间回放"""
+    origin = min(entry.at for entry in entries)
+    start = time.perf_counter()
+
+    async def delayed(entry: TraceEntry) -> Sample:
+        await asyncio.sleep(max(0.0, (entry.at - origin) / speed - (time.perf_counter() - start)))
+        return await client.send(entry)
+
+    return list(await asyncio.gather(*(delayed(entry) for entry in entries)))
+
+
+async def run_rate(
+    client: LoadClient, entries: List[TraceEntry], qps: float, requests: int, duration: Optional[float]
+) -> Tuple[List[Sample], float]:
+    """开环：按固定速率发送，不等待之前的请求完成；同时返回发送窗口的长度"""
+    start = time.perf_counter()
+    tasks = []
+
+    async def timed(entry: TraceEntry) -> Sample:
+        sample = await client.send(entry)
+        sample.finished = time.perf_counter() - start
+        return sample
+
+    for i in range(requests):
+        delay = i / qps - (time.perf_counter() - start)
+        if duration is not None and i / qps >= duration:
+            break
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(timed(entries[i % len(entries)])))
+    window = time.perf_counter() - start
+    return list(await asyncio.gather(*tasks)), window
+
+
+async def run_concurrency(
+    client: LoadClient, entries: List[TraceEntry], concurrency: int, requests: int, duration: Optional[float]
+) -> List[Sample]:
+    """闭环：固定数量的虚拟用户，每个用户收到响应后立即发送下一个请求"""
+    start = time.perf_counter()
+    counter = iter(range(requests))
+    samples: List[Sample] = []
+
+    async def user():
+        for i in counter:
+            if duration is not None and time.perf_counter() - start >= duration:
+                return
+            samples.append(await client.send(entries[i % len(entries)]))
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return samples
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(max(values))}
+
+
+def window_throughput(samples: List[Sample], window: float) -> Optional[float]:
+    """发送窗口内的稳态吞吐：只统计第一个请求完成之后、最后一个请求发出之前完成的请求，
+    排除开头的首个延迟和结尾排空在途请求的时间"""
+    finished = sorted(sample.finished for sample in samples if sample.ok and sample.finished is not None)
+    if len(finished) < 2 or finished[0] >= window:
+        return None
+    first = finished[0]
+    return sum(1 for t in finished[1:] if t <= window) / (window - first)
+
+
+def summarize(samples: List[Sample], wall: float, window: Optional[float] = None) -> Dict[str, Any]:
+    """延迟分位数 (只统计成功的请求)、错误率和吞吐"""
+    ok = [sample for sample in samples if sample.ok]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if not sample.ok:
+            errors[sample.error or "unknown"] = errors.get(sample.error or "unknown", 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "throughput": len(ok) / wall if wall > 0 else 0.0,
+        "window_throughput": window_throughput(samples, window) if window is not None else None,
+        "latency": percentiles([sample.latency for sample in ok]),
+        "first_byte": percentiles([sample.first_byte for sample in ok if sample.first_byte is not None]),
+        "top_errors": dict(sorted(errors.items(), key=lambda item: -item[1])[:5])
+    }
+
+
+def print_summary(
+    title: str, samples: List[Sample], wall: float, window: Optional[float] = None
+) -> Dict[str, Any]:
+    summary = summarize(samples, wall, window)
+    print(f"\n== {title} ({wall:.1f}s)")
+    print(f"{'端点':<28}{'请求':>6}{'错误率':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'首字节p50':>11}")
+    endpoints = sorted({sample.endpoint for sample in samples})
+    for endpoint in endpoints + ["全部"]:
+        subset = samples if endpoint == "全部" else [s for s in samples if s.endpoint == endpoint]
+        part = summarize(subset, wall)
+        latency = part["latency"]
+        print(
+            f"{endpoint:<28}{part['requests']:>6}{part['error_rate']:>8.1%}"
+            f"{latency['p50']:>8.2f}s{latency['p95']:>8.2f}s{latency['p99']:>8.2f}s"
+            f"{part['first_byte']['p50']:>10.2f}s"
+        )
+    summary["endpoints"] = {
+        endpoint: summarize([s for s in samples if s.endpoint == endpoint], wall) for endpoint in endpoints
+    }
+    for error, count in summary["top_errors"].items():
+        print(f"  错误 x{count}: {error}")
+    return summary
+
+
+def start_server(base_url: str, fixture: Optional[str], youtube_delay: float, startup_timeout: float):
+    """在本地启动 run.py，等待其可以响应请求"""
+    parsed = urlparse(base_url)
+    env = dict(os.environ)
+    if fixture:
+        env["WHISPER_STT_YOUTUBE_FIXTURE"] = fixture
+        env["WHISPER_STT_YOUTUBE_DELAY"] = str(youtube_delay)
+    process = subprocess.Popen(
+        [sys.executable, "run.py", "--host", parsed.hostname or "127.0.0.1", "--port", str(parsed.port or 8000)],
+        cwd=ROOT,
+        env=env
+    )
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"服务器启动失败 (退出码 {process.returncode})")
+        try:
+            if httpx.get(f"{base_url}/api/metrics", timeout=2).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    process.terminate()
+    sys.exit("等待服务器启动超时")
+
+
+def parse_levels(value: Optional[str]) -> List[float]:
+    return [float(level) for level in value.split(",") if level.strip()] if value else []
+
+
+async def run(args, entries: List[TraceEntry]) -> Dict[str, Any]:
+    client = LoadClient(args.base_url, args.timeout)
+    report: Dict[str, Any] = {"trace": args.trace, "levels": []}
+    requests = args.requests or len(entries)
+    try:
+        if args.qps or args.concurrency:
+            mode = "qps" if args.qps else "concurrency"
+            for level in parse_levels(args.qps or args.concurrency):
+                start = time.perf_counter()
+                window = None
+                if mode == "qps":
+                    samples, window = await run_rate(client, entries, level, requests, args.duration)
+                else:
+                    samples = await run_concurrency(client, entries, int(level), requests, args.duration)
+                wall = time.perf_counter() - start
+                summary = print_summary(f"{mode}={level:g}", samples, wall, window)
+                report["levels"].append({"mode": mode, "level": level, **summary})
+                if args.samples:
+                    report["levels"][-1]["samples"] = [asdict(sample) for sample in samples]
+        else:
+            start = time.perf_counter()
+            samples = await run_replay(client, entries, args.speed)
+            wall = time.perf_counter() - start
+            summary = print_summary(f"轨迹回放 x{args.speed:g}", samples, wall)
+            report["levels"].append({"mode": "replay", "level": args.speed, **summary})
+            if args.samples:
+                report["levels"][-1]["samples"] = [asdict(sample) for sample in samples]
+
+        try:
+            response = await client.client.get("/api/metrics")
+            report["server_metrics"] = response.json()
+        except httpx.HTTPError:
+            pass
+    finally:
+        await client.close()
+    return report
+
+
+def print_saturation(report: Dict[str, Any]) -> None:
+    """吞吐饱和曲线：开环时发送窗口内的稳态吞吐低于 90% 的发送速率即视为饱和
+
+    总吞吐 (成功数 / 总耗时) 包含排空在途请求的时间，即使服务器跟得上，
+    短时间的测试也会因为最后几个请求的延迟而低于发送速率，因此不用于判断饱和
+    """
+    levels = report["levels"]
+    if len(levels) < 2:
+        return
+    print("\n== 吞吐饱和曲线")
+    print(f"{'负载':>10}{'吞吐(req/s)':>14}{'p50':>9}{'p95':>9}{'p99':>9}{'错误率':>8}")
+    for level in levels:
+        latency = level["latency"]
+        throughput = level["throughput"]
+        if level["mode"] == "qps" and level["window_throughput"] is not None:
+            throughput = level["window_throughput"]
+        saturated = level["mode"] == "qps" and throughput < 0.9 * level["level"]
+        print(
+            f"{level['mode'][0]}={level['level']:<8g}{throughput:>14.3f}"
+            f"{latency['p50']:>8.2f}s{latency['p95']:>8.2f}s{latency['p99']:>8.2f}s"
+            f"{level['error_rate']:>8.1%}{'  饱和' if saturated else ''}"
+        )
+
+    queue = {
+        key: value for key, value in report.get("server_metrics", {}).get("summaries", {}).items()
+        if key.startswith("scheduler_queue_seconds")
+    }
+    if queue:
+        print("\n== 服务器端排队时间 (全部负载)")
+        for key, value in sorted(queue.items()):
+            print(f"{key:<60} p50 {value['p50']:.2f}s  p95 {value['p95']:.2f}s  p99 {value['p99']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按请求轨迹回放的负载测试")
+    parser.add_argument("trace", help="请求轨迹 (JSONL)")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="服务器地址")
+    parser.add_argument("--qps", help="开环发送速率 (请求/秒)，逗号分隔多个值")
+    parser.add_argument("--concurrency", help="闭环并发数，逗号分隔多个值")
+    parser.add_argument("--speed", type=float, default=1.0, help="按轨迹时间回放时的加速倍数")
+    parser.add_argument("--requests", type=int, help="每个负载级别的请求数 (默认: 轨迹长度)")
+    parser.add_argument("--duration", type=float, help="每个负载级别的最长发送时间 (秒)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个请求的超时 (秒)")
+    parser.add_argument("--start-server", action="store_true", help="在本地启动 run.py")
+    parser.add_argument("--startup-timeout", type=float, default=600.0, help="等待服务器启动的时间 (秒)")
+    parser.add_argument("--youtube-fixture", help="启动服务器时代替 YouTube 下载的音频 (默认: 轨迹中的第一个音频)")
+    parser.add_argument("--youtube-delay", type=float, default=0.0, help="模拟的 YouTube 下载耗时 (秒)")
+    parser.add_argument("--output", help="保存 JSON 报告")
+    parser.add_argument("--samples", action="store_true", help="报告中包含每个请求的测量结果")
+    args = parser.parse_args()
+    if args.qps and args.concurrency:
+        parser.error("--qps 和 --concurrency 只能指定一个")
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        entries = load_trace(args.trace, fixture_dir)
+        print(f"{len(entries)} 个请求: " + ", ".join(
+            f"{endpoint} x{sum(1 for e in entries if e.endpoint == endpoint)}"
+            for endpoint in sorted({e.endpoint for e in entries})
+        ))
+
+        server = None
+        if args.start_server:
+            fixture = args.youtube_fixture or next((e.audio for e in entries if e.audio), None)
+            server = start_server(args.base_url, fixture, args.youtube_delay, args.startup_timeout)
+        try:
+            report = asyncio.run(run(args, entries))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print_saturation(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
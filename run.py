@@ -3,16 +3,48 @@
 
 """
 Whisper STT API 启动脚本
+
+python run.py [serve]   启动 API 服务器
+python run.py worker    启动推理节点，从 --broker-dir (WHISPER_STT_BROKER_DIR) 领取转录任务
 """
 
 import os
+import asyncio
 import argparse
 import uvicorn
 
+def run_worker(args):
+    """启动推理节点"""
+    if not args.broker_dir:
+        raise SystemExit("推理节点需要 --broker-dir 或环境变量 WHISPER_STT_BROKER_DIR")
+    
+    from app.broker import FileBroker
+    from app.worker import InferenceWorker
+    
+    worker = InferenceWorker(
+        FileBroker(args.broker_dir),
+        [name.strip() for name in args.models.split(",") if name.strip()],
+        replicas=args.replicas,
+        worker_id=args.worker_id,
+        long_audio_seconds=args.long_audio_seconds
+    )
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
 def main():
-    """主函数，解析命令行参数并启动服务器"""
+    """主函数，解析命令行参数并启动服务器或推理节点"""
     parser = argparse.ArgumentParser(description="Whisper STT API 服务器")
     
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["serve", "worker"],
+        default="serve",
+        help="serve: API 服务器 (默认)，worker: 推理节点"
+    )
+    
     parser.add_argument(
         "--host", 
         type=str, 
@@ -33,8 +65,47 @@ def main():
         help="启用自动重载 (开发模式)"
     )
     
+    parser.add_argument(
+        "--broker-dir",
+        type=str,
+        default=os.getenv("WHISPER_STT_BROKER_DIR"),
+        help="推理节点: 与 API 服务器共享的任务队列目录 (默认: WHISPER_STT_BROKER_DIR)"
+    )
+    
+    parser.add_argument(
+        "--models",
+        type=str,
+        default=os.getenv("WHISPER_MODELS", "small"),
+        help="推理节点: 加载的模型，以逗号分隔 (默认: WHISPER_MODELS 或 small)"
+    )
+    
+    parser.add_argument(
+        "--replicas",
+        type=int,
+        default=int(os.getenv("WHISPER_WORKER_REPLICAS", "1")),
+        help="推理节点: 每个模型的副本数 (默认: WHISPER_WORKER_REPLICAS 或 1)"
+    )
+    
+    parser.add_argument(
+        "--long-audio-seconds",
+        type=float,
+        default=float(os.getenv("LONG_AUDIO_SECONDS", "600")),
+        help="推理节点: 不短于此时长 (秒) 的音频解码到 mmap 临时文件并逐窗口转录，0 表示不启用 (默认: LONG_AUDIO_SECONDS 或 600)"
+    )
+    
+    parser.add_argument(
+        "--worker-id",
+        type=str,
+        default=None,
+        help="推理节点: 节点 ID (默认: 主机名加随机后缀)"
+    )
+    
     args = parser.parse_args()
     
+    if args.command == "worker":
+        run_worker(args)
+        return
+    
     # 启动服务器
     uvicorn.run(
         "app.main:app", 
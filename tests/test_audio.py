@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ffmpeg")
+
+from app.audio import pcm_to_array, resolve_pcm_format
+
+
+@pytest.mark.parametrize("content_type, expected", [
+    ("audio/pcm", "pcm_s16le"),
+    ("audio/x-pcm-s16le", "pcm_s16le"),
+    ("audio/x-pcm-f32le", "pcm_f32le"),
+    ("Audio/PCM; rate=16000; channels=1", "pcm_s16le"),
+    ("audio/wav", None),
+    ("application/octet-stream", None),
+    (None, None),
+])
+def test_content_type_mapping(content_type, expected):
+    assert resolve_pcm_format(content_type) == expected
+
+
+def test_audio_format_overrides_content_type():
+    assert resolve_pcm_format("audio/wav", "pcm_f32le") == "pcm_f32le"
+    assert resolve_pcm_format(None, "pcm_s16le") == "pcm_s16le"
+
+
+@pytest.mark.parametrize("content_type", ["audio/pcm; rate=8000", "audio/x-pcm-f32le; channels=2"])
+def test_rejects_other_rates_and_channels(content_type):
+    with pytest.raises(ValueError):
+        resolve_pcm_format(content_type)
+
+
+@pytest.mark.parametrize("audio_format", ["pcm_s24le", "wav"])
+def test_rejects_unknown_audio_format(audio_format):
+    with pytest.raises(ValueError):
+        resolve_pcm_format("audio/pcm", audio_format)
+
+
+def test_int16_scaled_to_float32():
+    data = np.array([-32768, 0, 16384, 32767], dtype="<i2").tobytes()
+    audio = pcm_to_array(data, "pcm_s16le")
+    assert audio.dtype == np.float32
+    assert audio.tolist() == [-1.0, 0.0, 0.5, pytest.approx(32767 / 32768)]
+
+
+def test_float32_wrapped_without_conversion():
+    samples = np.array([0.25, -0.5, 1.0], dtype="<f4")
+    audio = pcm_to_array(samples.tobytes(), "pcm_f32le")
+    assert audio.dtype == np.float32
+    assert audio.tolist() == [0.25, -0.5, 1.0]
+
+
+@pytest.mark.parametrize("pcm_format, length", [("pcm_s16le", 3), ("pcm_f32le", 6), ("pcm_f32le", 1)])
+def test_rejects_partial_samples(pcm_format, length):
+    with pytest.raises(ValueError):
+        pcm_to_array(b"\x00" * length, pcm_format)
+
+
+def test_empty_input():
+    assert len(pcm_to_array(b"", "pcm_s16le")) == 0
@@ -0,0 +1,103 @@
+import pytest
+
+from app.decoding import DecodeStats, PROFILES, get_profile, merge_stats, record_stats
+from app.metrics import Metrics
+
+
+def run_window(stats, decodes):
+    """模拟 Whisper 对一个窗口的解码: decodes 次调用 decode (第一次之后为温度回退)"""
+    mel = object()
+    results = []
+    for attempt in range(decodes):
+        previous = stats.before_decode(mel)
+        if previous is not None:
+            results.append(previous)
+            continue
+        result = f"decode-{attempt}"
+        stats.after_decode(result)
+        results.append(result)
+    return results
+
+
+def test_windows_without_fallback():
+    stats = DecodeStats("balanced", 0.25)
+    for _ in range(4):
+        run_window(stats, 1)
+    assert stats.to_dict() == {
+        "profile": "balanced",
+        "windows": 4,
+        "fallback_windows": 0,
+        "fallback_decodes": 0,
+        "capped_windows": 0
+    }
+
+
+def test_fallback_capped_by_ratio():
+    stats = DecodeStats("balanced", 0.25)
+    results = [run_window(stats, 3) for _ in range(8)]
+    summary = stats.to_dict()
+
+    assert summary["windows"] == 8
+    assert summary["fallback_windows"] == 8
+    # 每个窗口回退前检查: 已回退的窗口数 < 0.25 * 已解码的窗口数
+    allowed = summary["fallback_windows"] - summary["capped_windows"]
+    assert allowed == 2
+    assert summary["fallback_decodes"] == allowed * 2
+    # 超出限制的窗口沿用第一次解码的结果，不再运行模型
+    capped = [window for window in results if window == ["decode-0"] * 3]
+    assert len(capped) == summary["capped_windows"]
+
+
+def test_full_ratio_never_caps():
+    stats = DecodeStats("accurate", 1.0)
+    for _ in range(5):
+        assert run_window(stats, 2) == ["decode-0", "decode-1"]
+    assert stats.capped_windows == 0
+    assert stats.fallback_decodes == 5
+
+
+def test_zero_ratio_caps_every_fallback():
+    stats = DecodeStats("fast-greedy", 0.0)
+    assert run_window(stats, 2) == ["decode-0", "decode-0"]
+    assert stats.capped_windows == 1
+    assert stats.fallback_decodes == 0
+
+
+def test_get_profile():
+    assert get_profile(None).name == "greedy"
+    assert get_profile(None, default="fast-greedy").name == "fast-greedy"
+    assert get_profile("accurate") is PROFILES["accurate"]
+    with pytest.raises(ValueError):
+        get_profile("unknown")
+
+
+def test_transcribe_options_temperature_override():
+    profile = PROFILES["accurate"]
+    assert profile.transcribe_options()["temperature"] == profile.temperatures
+    assert profile.transcribe_options(0.5)["temperature"] == (0.5, 0.6, 0.8, 1.0)
+    assert "beam_size" not in PROFILES["fast-greedy"].transcribe_options()
+
+
+def test_default_profile_matches_single_temperature():
+    options = get_profile(None).transcribe_options()
+    assert options["temperature"] == (0.0,)
+    assert options["condition_on_previous_text"] is True
+    assert "beam_size" not in options and "best_of" not in options
+    assert get_profile(None).transcribe_options(0.5)["temperature"] == (0.5,)
+
+
+def test_merge_and_record_stats():
+    first = DecodeStats("balanced", 1.0)
+    run_window(first, 2)
+    second = DecodeStats("balanced", 1.0)
+    run_window(second, 1)
+    merged = merge_stats([first.to_dict(), None, second.to_dict()])
+    assert merged["windows"] == 2
+    assert merged["fallback_windows"] == 1
+    assert merge_stats([None]) is None
+
+    metrics = Metrics()
+    record_stats(merged, "small", metrics)
+    record_stats(None, "small", metrics)
+    counters = metrics.snapshot()["counters"]
+    assert counters['decode_windows_total{model="small",profile="balanced"}'] == 2
@@ -0,0 +1,53 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("ffmpeg")
+pytest.importorskip("whisper")
+
+from app.language_id import HASH_PREFIX_BYTES, LanguageIdentifier, audio_hash
+from app.metrics import Metrics
+
+
+class FakeDetector:
+    def __init__(self):
+        self.windows = []
+
+    async def detect_language(self, audio, cancel_token=None):
+        self.windows.append(len(audio))
+        return "en", 0.9
+
+
+def test_file_hash_reads_size_and_prefix(tmp_path):
+    path = tmp_path / "a.mp3"
+    path.write_bytes(b"a" * (HASH_PREFIX_BYTES + 10))
+    key = audio_hash(str(path))
+
+    # 开头之后的内容不影响缓存键，文件大小影响
+    path.write_bytes(b"a" * HASH_PREFIX_BYTES + b"b" * 10)
+    assert audio_hash(str(path)) == key
+    path.write_bytes(b"a" * (HASH_PREFIX_BYTES + 11))
+    assert audio_hash(str(path)) != key
+    path.write_bytes(b"b" + b"a" * (HASH_PREFIX_BYTES + 9))
+    assert audio_hash(str(path)) != key
+
+
+def test_waveform_hash_limited_to_scan_range():
+    audio = np.zeros(1000, dtype=np.float32)
+    key = audio_hash(audio, 500)
+    changed = audio.copy()
+    changed[600] = 1.0
+    assert audio_hash(changed, 500) == key
+    changed[100] = 1.0
+    assert audio_hash(changed, 500) != key
+
+
+def test_detection_cached_per_audio():
+    detector = FakeDetector()
+    identifier = LanguageIdentifier(detector, scan_seconds=2.0, metrics=Metrics())
+    audio = np.zeros(16000 * 5, dtype=np.float32)
+    assert asyncio.run(identifier.identify(audio)) == ("en", 0.9)
+    assert asyncio.run(identifier.identify(audio.copy())) == ("en", 0.9)
+    assert len(detector.windows) == 1
+    assert identifier.metrics.snapshot()["counters"]['language_id_total{result="cached"}'] == 1
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("torchaudio")
+pytest.importorskip("whisper")
+
+from app.local_diarization import SpeakerEmbedder, agglomerative_cluster, cluster_windows
+
+
+def two_blobs(n, dim=16, seed=0):
+    """两个方向相反的高斯簇，前 n 个属于第一簇，后 n 个属于第二簇"""
+    rng = np.random.default_rng(seed)
+    center = rng.normal(size=dim)
+    a = center + 0.1 * rng.normal(size=(n, dim))
+    b = -center + 0.1 * rng.normal(size=(n, dim))
+    return np.concatenate([a, b]).astype(np.float32)
+
+
+def reference_average_linkage(embeddings, threshold):
+    """逐对计算簇间平均距离的朴素平均连接聚类，用于对照"""
+    x = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    dist = 1.0 - x @ x.T
+    clusters = [[i] for i in range(len(x))]
+    while len(clusters) > 1:
+        best = None
+        for a in range(len(clusters)):
+            for b in range(a + 1, len(clusters)):
+                d = dist[np.ix_(clusters[a], clusters[b])].mean()
+                if best is None or d < best[0]:
+                    best = (d, a, b)
+        d, a, b = best
+        if d > threshold:
+            break
+        clusters[a] += clusters.pop(b)
+    labels = np.empty(len(x), dtype=np.int64)
+    for label, members in enumerate(clusters):
+        labels[members] = label
+    return labels
+
+
+def same_partition(a, b):
+    pairs_a = a[:, None] == a[None, :]
+    pairs_b = b[:, None] == b[None, :]
+    return bool((pairs_a == pairs_b).all())
+
+
+def test_average_linkage_matches_reference():
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(40, 8))
+    for threshold in (0.6, 0.9, 1.1):
+        labels = agglomerative_cluster(embeddings, threshold)
+        assert same_partition(labels, reference_average_linkage(embeddings, threshold))
+
+
+def test_two_blobs_give_two_speakers():
+    labels = agglomerative_cluster(two_blobs(20), threshold=0.5)
+    assert labels.tolist() == [0] * 20 + [1] * 20
+
+
+def test_num_speakers_and_max_speakers():
+    embeddings = two_blobs(10)
+    assert agglomerative_cluster(embeddings, threshold=0.5, num_speakers=1).tolist() == [0] * 20
+    # 阈值很小时仍合并到 max_speakers 个簇
+    assert agglomerative_cluster(embeddings, threshold=0.0, max_speakers=2).tolist() == [0] * 10 + [1] * 10
+
+
+def test_labels_numbered_by_first_appearance():
+    embeddings = two_blobs(5)
+    order = [5, 0, 6, 1, 7, 2, 8, 3, 9, 4]
+    assert agglomerative_cluster(embeddings[order], threshold=0.5).tolist() == [0, 1] * 5
+
+
+def test_chunked_clustering_above_chunk_size():
+    embeddings = two_blobs(1250)
+    labels = cluster_windows(embeddings, threshold=0.5)
+    assert len(labels) == 2500
+    assert labels.tolist() == [0] * 1250 + [1] * 1250
+
+
+def test_chunked_clustering_matches_direct_clustering():
+    rng = np.random.default_rng(2)
+    embeddings = two_blobs(60)[rng.permutation(120)]
+    direct = agglomerative_cluster(embeddings, threshold=0.5)
+    chunked = cluster_windows(embeddings, threshold=0.5, chunk_size=25)
+    assert chunked.tolist() == direct.tolist()
+    assert cluster_windows(embeddings, threshold=0.5, num_speakers=1, chunk_size=25).max() == 0
+
+
+def test_falls_back_to_mfcc_when_model_cannot_load(tmp_path):
+    embedder = SpeakerEmbedder(model_name=str(tmp_path / "missing.onnx"))
+    assert embedder.kind == "mfcc"
+    assert embedder.default_threshold == 0.5
+
+    # 两个不同频率的音调，每个 1.5 秒窗口的嵌入按音调分为两簇
+    t = np.arange(24000) / 16000
+    audio = np.concatenate([0.5 * np.sin(2 * np.pi * 220 * t), 0.5 * np.sin(2 * np.pi * 1800 * t)]).astype(np.float32)
+    windows = [(0.0, 0.75), (0.75, 1.5), (1.5, 2.25), (2.25, 3.0)]
+    embeddings = embedder.embed(audio, windows)
+    assert embeddings.shape == (4, 60)
+    assert agglomerative_cluster(embeddings, threshold=0.5).tolist() == [0, 0, 1, 1]
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from app.results import ResultStore, render_result
+
+
+def segments(text):
+    return [{"start": 0.0, "end": 1.0, "text": text, "speaker": "SPEAKER_00"}]
+
+
+def test_evicts_least_recently_used_past_capacity():
+    store = ResultStore(max_results=2)
+    first = store.save("one", segments("one"))
+    second = store.save("two", segments("two"))
+    # 读取 first 后 second 成为最久未访问的结果
+    assert store.get(first)["text"] == "one"
+    third = store.save("three", segments("three"))
+    assert store.get(second) is None
+    assert store.get(first)["text"] == "one"
+    assert store.get(third)["text"] == "three"
+
+
+def test_keeps_only_max_results():
+    store = ResultStore(max_results=3)
+    ids = [store.save(str(i), segments(str(i))) for i in range(10)]
+    assert [store.get(result_id) is not None for result_id in ids] == [False] * 7 + [True] * 3
+
+
+def test_unknown_result():
+    assert ResultStore().get("missing") is None
+
+
+def test_render_formats():
+    store = ResultStore()
+    result = store.get(store.save("hello", segments("hello"), language="en"))
+
+    content, media_type = render_result(result, "srt")
+    assert "".join(content) == "1\n00:00:00,000 --> 00:00:01,000\n[SPEAKER_00] hello\n\n"
+    assert media_type.startswith("application/x-subrip")
+
+    content, media_type = render_result(result, "vtt")
+    assert "".join(content).startswith("WEBVTT\n\n1\n00:00:00.000 --> 00:00:01.000\n")
+    assert media_type.startswith("text/vtt")
+
+    content, _ = render_result(result, "verbose_json")
+    verbose = json.loads("".join(content))
+    assert verbose["language"] == "en"
+    assert verbose["duration"] == 1.0
+    assert verbose["segments"][0]["text"] == "hello"
+
+    assert "".join(render_result(result, "txt")[0]) == "hello"
+    with pytest.raises(ValueError):
+        render_result(result, "docx")
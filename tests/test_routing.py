@@ -0,0 +1,80 @@
+from app.metrics import Metrics
+from app.routing import ModelRouter, model_size
+
+
+def make_router(models, **kwargs):
+    return ModelRouter(models, metrics=Metrics(), **kwargs)
+
+
+def test_model_size():
+    assert model_size("base.en") == "base"
+    assert model_size("large-v3") == "large"
+    assert model_size("custom") == "small"
+
+
+def test_default_is_most_accurate_multilingual():
+    router = make_router({"base": 1, "small": 1, "small.en": 1})
+    assert router.models == ["small", "small.en", "base"]
+    decision = router.choose(60.0)
+    assert decision.model == "small"
+    assert decision.reason == "default"
+    assert decision.duration == 60.0
+
+
+def test_downgrades_when_over_budget():
+    router = make_router({"base": 1, "small": 1}, latency_target=30.0)
+    # small 的先验实时率为 0.3，200 秒音频预计 60 秒
+    decision = router.choose(200.0)
+    assert decision.model == "base"
+    assert decision.reason == "downgraded"
+
+
+def test_over_budget_picks_fastest():
+    router = make_router({"base": 1, "small": 1})
+    decision = router.choose(3600.0, max_latency=1.0)
+    assert decision.model == "base"
+    assert decision.reason == "over_budget"
+
+
+def test_queue_depth_counts_toward_estimate():
+    router = make_router({"base": 1, "small": 1})
+    assert router.choose(60.0).model == "small"
+    with router.track("small", 600.0):
+        # small 的副本被占用，排队等待 600 * 0.3 秒
+        assert router.choose(60.0).model == "base"
+    assert router.choose(60.0).model == "small"
+
+
+def test_requested_model():
+    router = make_router({"base": 1, "small": 1})
+    decision = router.choose(3600.0, requested="whisper-base")
+    assert decision.model == "base"
+    assert decision.reason == "requested"
+    # 未加载的模型按未指定处理
+    assert router.choose(10.0, requested="whisper-large").reason == "default"
+
+
+def test_english_routes_to_en_variant():
+    router = make_router({"small": 1, "small.en": 1, "base": 1})
+    assert router.choose(60.0, language="en").model == "small.en"
+    assert router.choose(60.0, language="de").model == "small"
+    assert router.choose(60.0).model == "small"
+    assert router.choose(60.0, requested="small", language="en").model == "small.en"
+    assert router.choose(60.0, requested="small.en", language="fr").model == "small"
+
+
+def test_only_english_models_loaded():
+    router = make_router({"base.en": 1})
+    assert router.choose(60.0, language="ja").model == "base.en"
+
+
+def test_track_updates_rtf_for_unqueued_requests():
+    router = make_router({"small": 1}, smoothing=0.5)
+    prior = router.rtf["small"]
+    with router.track("small", 10.0):
+        pass
+    # 几乎没有耗时的请求把实时率拉低
+    assert router.rtf["small"] < prior
+    assert router.measured["small"]
+    assert router.outstanding["small"] == 0.0
+    assert router.in_flight["small"] == 0
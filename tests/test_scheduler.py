@@ -0,0 +1,196 @@
+import threading
+import time
+
+import pytest
+
+from app.cancellation import TranscriptionCancelled
+from app.metrics import Metrics
+from app.scheduler import FairScheduler, Job
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.005)
+
+
+def waiting(scheduler):
+    return len(scheduler._waiters)
+
+
+def start_waiter(scheduler, job, order, label):
+    """在线程中等待副本，取得后记录标签并立即归还"""
+    def run():
+        slot = scheduler.acquire(job)
+        order.append(label)
+        scheduler.release(slot)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_higher_priority_served_first():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    slot = scheduler.acquire(Job("interactive", "holder"))
+    order = []
+    threads = []
+    for priority in ("batch", "interactive", "realtime"):
+        threads.append(start_waiter(scheduler, Job(priority, priority), order, priority))
+        wait_until(lambda n=len(threads): waiting(scheduler) == n)
+
+    scheduler.release(slot)
+    for thread in threads:
+        thread.join(2)
+    assert order == ["realtime", "interactive", "batch"]
+
+
+def test_fair_queueing_within_priority():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    slot = scheduler.acquire(Job("batch", "holder"))
+    order = []
+    threads = []
+    # 客户端 a 先提交三个长任务，客户端 b 随后提交一个
+    for label, client in (("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")):
+        threads.append(start_waiter(scheduler, Job("batch", client, cost=60.0), order, label))
+        wait_until(lambda n=len(threads): waiting(scheduler) == n)
+
+    scheduler.release(slot)
+    for thread in threads:
+        thread.join(2)
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_weight_gives_larger_share():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    slot = scheduler.acquire(Job("batch", "holder"))
+    order = []
+    threads = []
+    for label, client, weight in (("a1", "a", 1.0), ("a2", "a", 1.0), ("b1", "b", 4.0), ("b2", "b", 4.0)):
+        threads.append(start_waiter(scheduler, Job("batch", client, weight=weight, cost=10.0), order, label))
+        wait_until(lambda n=len(threads): waiting(scheduler) == n)
+
+    scheduler.release(slot)
+    for thread in threads:
+        thread.join(2)
+    assert order.index("b2") < order.index("a2")
+
+
+def test_preempt_point_yields_to_higher_priority():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    batch = Job("batch", "bulk")
+    slot = scheduler.acquire(batch)
+    order = []
+    realtime = start_waiter(scheduler, Job("realtime", "live"), order, "realtime")
+    wait_until(lambda: waiting(scheduler) == 1)
+
+    scheduler.preempt_point(slot)
+    order.append("batch")
+    realtime.join(2)
+
+    assert order == ["realtime", "batch"]
+    assert scheduler.lease(slot)[1] is batch
+    scheduler.release(slot)
+    assert scheduler.snapshot()["free"] == 1
+
+
+def test_preempt_point_without_higher_priority_waiters_is_noop():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    batch = Job("batch", "bulk")
+    slot = scheduler.acquire(batch)
+    order = []
+    other = start_waiter(scheduler, Job("batch", "other"), order, "other")
+    wait_until(lambda: waiting(scheduler) == 1)
+
+    scheduler.preempt_point(slot)
+    assert order == []
+    assert scheduler.lease(slot)[1] is batch
+
+    scheduler.release(slot)
+    other.join(2)
+    assert order == ["other"]
+
+
+def test_interactive_lease_is_not_preempted():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    slot = scheduler.acquire(Job("interactive", "user"))
+    order = []
+    realtime = start_waiter(scheduler, Job("realtime", "live"), order, "realtime")
+    wait_until(lambda: waiting(scheduler) == 1)
+
+    scheduler.preempt_point(slot)
+    assert order == []
+
+    scheduler.release(slot)
+    realtime.join(2)
+    assert order == ["realtime"]
+
+
+def test_cancel_while_reclaiming_does_not_double_free():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    batch = Job("batch", "bulk")
+    slot = scheduler.acquire(batch)
+
+    # 实时请求占用让出的副本，批量任务在收回时被取消
+    holder = Job("realtime", "live")
+    acquired = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        held = scheduler.acquire(holder)
+        acquired.set()
+        done.wait(2)
+        scheduler.release(held)
+
+    thread = threading.Thread(target=hold, daemon=True)
+    thread.start()
+    wait_until(lambda: waiting(scheduler) == 1)
+
+    errors = []
+
+    def preempt():
+        try:
+            scheduler.preempt_point(slot)
+        except TranscriptionCancelled as e:
+            errors.append(e)
+        finally:
+            # 与 ModelPool.acquire 相同，退出时总是归还
+            scheduler.release(slot)
+
+    preempting = threading.Thread(target=preempt, daemon=True)
+    preempting.start()
+    assert acquired.wait(2)
+    batch.cancel("客户端已断开连接")
+    preempting.join(2)
+    done.set()
+    thread.join(2)
+
+    assert len(errors) == 1
+    snapshot = scheduler.snapshot()
+    assert snapshot["free"] == 1
+    assert snapshot["leases"] == {}
+
+
+def test_cancelled_waiter_leaves_queue():
+    scheduler = FairScheduler(1, metrics=Metrics())
+    slot = scheduler.acquire(Job("interactive", "holder"))
+    job = Job("batch", "bulk")
+    errors = []
+
+    def run():
+        with pytest.raises(TranscriptionCancelled) as info:
+            scheduler.acquire(job)
+        errors.append(info.value)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    wait_until(lambda: waiting(scheduler) == 1)
+    job.cancel()
+    thread.join(2)
+
+    assert len(errors) == 1
+    assert waiting(scheduler) == 0
+    scheduler.release(slot)
+    assert scheduler.snapshot()["free"] == 1
@@ -0,0 +1,91 @@
+from app.speaker_assignment import assign_by_overlap, assign_word_speakers, normalize_turns, split_by_speaker
+
+
+def word(text, start, end):
+    return {"word": text, "start": start, "end": end}
+
+
+def test_normalize_turns_sorts_tuples_and_dicts():
+    turns = normalize_turns([{"start": 5, "end": 6, "speaker": "B"}, (1, 2, "A")])
+    assert turns == [(1.0, 2.0, "A"), (5.0, 6.0, "B")]
+
+
+def test_largest_overlap_wins_with_overlapping_turns():
+    turns = normalize_turns([(0.0, 4.0, "A"), (1.0, 2.0, "B"), (3.0, 10.0, "C")])
+    items = [{"start": 0.5, "end": 2.0}, {"start": 2.5, "end": 6.0}]
+    assign_by_overlap(items, turns)
+    # 与 A、B 同时重叠时 A 覆盖更长；跨越 A 和 C 的条目与 C 重叠更多
+    assert [item["speaker"] for item in items] == ["A", "C"]
+
+
+def test_overlap_summed_per_speaker():
+    turns = normalize_turns([(0.0, 1.0, "A"), (1.0, 2.0, "B"), (2.0, 3.0, "A")])
+    items = [{"start": 0.5, "end": 2.6}]
+    assign_by_overlap(items, turns)
+    assert items[0]["speaker"] == "A"
+
+
+def test_items_between_turns_keep_their_speaker():
+    turns = normalize_turns([(0.0, 1.0, "A"), (3.0, 4.0, "B")])
+    items = [{"start": 1.2, "end": 2.8}, {"start": 1.5, "end": 2.0, "speaker": "X"}]
+    assign_by_overlap(items, turns)
+    assert "speaker" not in items[0]
+    assert items[1]["speaker"] == "X"
+
+
+def test_equal_overlap_goes_to_earlier_turn():
+    # A 与 B 都覆盖整个条目：A 开始较早但结束较晚，在按终点排序的堆中排在 B 之后
+    items = [{"start": 2.0, "end": 3.0}]
+    assign_by_overlap(items, normalize_turns([(1.0, 5.0, "B"), (0.0, 10.0, "A")]))
+    assert items[0]["speaker"] == "A"
+
+    items = [{"start": 1.0, "end": 3.0}]
+    assign_by_overlap(items, normalize_turns([(2.0, 4.0, "B"), (0.0, 2.0, "A")]))
+    assert items[0]["speaker"] == "A"
+
+
+def test_words_between_turns_take_segment_speaker():
+    result = {"segments": [{
+        "start": 0.0,
+        "end": 4.0,
+        "text": "one two three",
+        "words": [word(" one", 0.0, 1.0), word(" two", 1.2, 1.8), word(" three", 2.0, 3.0)]
+    }]}
+    assign_word_speakers([(0.0, 1.1, "A"), (1.9, 4.0, "B")], result, split_segments=False)
+    segment = result["segments"][0]
+    assert segment["speaker"] == "B"
+    assert [w["speaker"] for w in segment["words"]] == ["A", "B", "B"]
+
+
+def test_segment_split_at_speaker_changes():
+    result = {"segments": [{
+        "start": 0.0,
+        "end": 3.0,
+        "text": "hi there hello",
+        "tokens": [1, 2, 3],
+        "words": [word(" hi", 0.0, 0.5), word(" there", 0.5, 1.0), word(" hello", 1.5, 3.0)]
+    }]}
+    assign_word_speakers([(0.0, 1.2, "A"), (1.2, 3.0, "B")], result)
+    segments = result["segments"]
+    assert [(s["start"], s["end"], s["text"], s["speaker"]) for s in segments] == [
+        (0.0, 1.0, "hi there", "A"),
+        (1.5, 3.0, "hello", "B"),
+    ]
+    assert "tokens" not in segments[0]
+    assert [w["word"] for w in segments[1]["words"]] == [" hello"]
+
+
+def test_split_keeps_single_speaker_segments():
+    segment = {"start": 0.0, "end": 1.0, "text": "a b", "speaker": "A",
+               "words": [{"word": "a", "speaker": "A"}, {"word": "b", "speaker": "A"}]}
+    plain = {"start": 1.0, "end": 2.0, "text": "c"}
+    assert split_by_speaker([segment, plain]) == [segment, plain]
+
+
+def test_split_joins_words_without_leading_spaces():
+    segment = {"start": 0.0, "end": 2.0, "text": "a b c", "speaker": "A", "words": [
+        {"word": "a", "start": 0.0, "end": 0.5, "speaker": "A"},
+        {"word": "b", "start": 0.5, "end": 1.0, "speaker": "A"},
+        {"word": "c", "start": 1.0, "end": 2.0, "speaker": "B"},
+    ]}
+    assert [s["text"] for s in split_by_speaker([segment])] == ["a b", "c"]
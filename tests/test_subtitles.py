@@ -0,0 +1,53 @@
+import pytest
+
+from app.subtitles import format_timestamp, render_subtitles
+
+SEGMENTS = [
+    {"start": 0.0, "end": 1.5, "text": " hello", "speaker": "SPEAKER_00"},
+    {"start": 3661.25, "end": 3662.0, "text": "world ", "speaker": "SPEAKER_01"},
+]
+
+
+def test_srt_timestamp_uses_comma():
+    assert format_timestamp(3661.5) == "01:01:01,500"
+    assert format_timestamp(0.0) == "00:00:00,000"
+
+
+def test_vtt_timestamp_uses_dot():
+    assert format_timestamp(3661.5, ".") == "01:01:01.500"
+
+
+def test_timestamp_rounds_and_clamps():
+    # 四舍五入到毫秒时进位到分钟
+    assert format_timestamp(59.9996) == "00:01:00,000"
+    assert format_timestamp(-1.0) == "00:00:00,000"
+    assert format_timestamp(36000.0) == "10:00:00,000"
+
+
+def test_render_srt():
+    assert render_subtitles(SEGMENTS, "srt") == (
+        "1\n00:00:00,000 --> 00:00:01,500\nhello\n\n"
+        "2\n01:01:01,250 --> 01:01:02,000\nworld\n\n"
+    )
+
+
+def test_render_vtt_has_header_and_dot_timestamps():
+    vtt = render_subtitles(SEGMENTS, "vtt")
+    assert vtt.startswith("WEBVTT\n\n1\n")
+    assert "\n00:00:00.000 --> 00:00:01.500\n" in vtt
+    assert "," not in vtt
+
+
+def test_speaker_labels():
+    assert "\n[SPEAKER_00] hello\n" in render_subtitles(SEGMENTS, "srt", speaker_labels=True)
+    assert "\n<v SPEAKER_01>world\n" in render_subtitles(SEGMENTS, "vtt", speaker_labels=True)
+
+
+def test_empty_segments():
+    assert render_subtitles([], "srt") == ""
+    assert render_subtitles([], "vtt") == "WEBVTT\n\n"
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        render_subtitles(SEGMENTS, "ass")
@@ -0,0 +1,48 @@
+import asyncio
+import sqlite3
+import time
+
+from app.results import ResultStore
+from app.transcript_index import TranscriptIndex
+
+
+def segments(text):
+    return [{"start": 0.0, "end": 1.0, "text": text, "speaker": "SPEAKER_00"}]
+
+
+def test_evicted_result_read_back_from_index(tmp_path):
+    index = TranscriptIndex(str(tmp_path / "transcripts.db"))
+    store = ResultStore(max_results=1, index=index)
+    first = store.save("hello world", segments("hello world"))
+    store.save("budget meeting", segments("budget meeting"))
+    index.flush()
+    result = asyncio.run(store.aget(first))
+    assert result["text"] == "hello world"
+    assert result["segments"].to_list()[0]["text"] == "hello world"
+    index.close()
+
+
+def test_retention_prunes_expired_transcripts(tmp_path):
+    path = str(tmp_path / "transcripts.db")
+    index = TranscriptIndex(path)
+    store = ResultStore(index=index)
+    old = store.save("hello world", segments("hello world"))
+    new = store.save("budget meeting", segments("budget meeting"))
+    index.close()
+    connection = sqlite3.connect(path)
+    connection.execute("UPDATE transcripts SET created_at = ? WHERE id = ?", (time.time() - 10 * 86400, old))
+    connection.commit()
+    connection.close()
+
+    # 清理在写入线程启动时执行，flush 等待空队列，因此加入一个结果以确保清理已完成
+    index = TranscriptIndex(path, retention=86400)
+    ResultStore(index=index).save("later", segments("later"))
+    index.flush()
+    assert index.get(old) is None
+    assert index.get(new)["text"] == "budget meeting"
+    assert index.search("hello")["results"] == []
+    assert len(index.search("budget")["results"]) == 1
+    # 删除的段落不再计入 (rowid 不连续)
+    stats = index.stats()
+    assert (stats["transcripts"], stats["segments"]) == (2, 2)
+    index.close()
@@ -0,0 +1,108 @@
+import logging
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+pytest.importorskip("ffmpeg")
+
+from whisper.audio import SAMPLE_RATE
+
+from app.transcriber import ModelPool
+
+
+def word(text, start, end):
+    return {"word": text, "start": start, "end": end, "probability": 0.9}
+
+
+def segment(text, start, end, words=None):
+    result = {"seek": 0, "start": start, "end": end, "text": text}
+    if words is not None:
+        result["words"] = words
+    return result
+
+
+class FakeModel:
+    """按调用顺序返回预设结果的 Whisper 模型，记录每个窗口的时长和提示词"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def decode(self, mel, *args, **kwargs):
+        raise AssertionError("假模型不解码")
+
+    def transcribe(self, audio, initial_prompt=None, **options):
+        self.calls.append((len(audio) / SAMPLE_RATE, initial_prompt))
+        return {"segments": self.results.pop(0), "language": "en"}
+
+
+def run_windows(model, seconds, **options):
+    pool = ModelPool([model], name="test")
+    audio = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    prompt = options.pop("initial_prompt", None)
+    windows = list(pool.iter_windows(audio, {"language": "en", **options}, prompt))
+    return [item for window in windows for item in window["segments"]]
+
+
+def test_single_cut_segment_is_deferred_from_last_word():
+    model = FakeModel([
+        [segment(" one two three", 0.0, 30.0, [word(" one", 0.0, 10.0), word(" two", 10.0, 28.5), word(" three", 28.5, 30.0)])],
+        [segment(" three four", 0.0, 20.0, [word(" three", 0.0, 5.0), word(" four", 5.0, 20.0)])],
+    ])
+    segments = run_windows(model, 50.0)
+
+    # 第二个窗口从最后一个保留的词之后开始
+    assert [duration for duration, _ in model.calls] == [30.0, 21.5]
+    assert [item["text"] for item in segments] == [" one two", " three four"]
+    assert segments[0]["end"] == 28.5
+    assert [item["word"] for item in segments[0]["words"]] == [" one", " two"]
+    assert (segments[1]["start"], segments[1]["end"]) == (28.5, 48.5)
+    assert [item["id"] for item in segments] == [0, 1]
+
+
+def test_last_of_several_segments_is_deferred():
+    model = FakeModel([
+        [segment(" first", 0.0, 20.0), segment(" cut", 20.0, 30.0)],
+        [segment(" cut off", 0.0, 10.0)],
+    ])
+    segments = run_windows(model, 40.0)
+
+    assert [duration for duration, _ in model.calls] == [30.0, 20.0]
+    assert [(item["start"], item["text"]) for item in segments] == [(0.0, " first"), (20.0, " cut off")]
+
+
+def test_single_cut_segment_without_words_logs_warning(caplog):
+    model = FakeModel([
+        [segment(" no words", 0.0, 30.0)],
+        [segment(" rest", 0.0, 5.0)],
+    ])
+    with caplog.at_level(logging.WARNING, logger="app.transcriber"):
+        segments = run_windows(model, 40.0)
+
+    assert [duration for duration, _ in model.calls] == [30.0, 10.0]
+    assert [item["text"] for item in segments] == [" no words", " rest"]
+    assert "没有词级时间戳" in caplog.text
+
+
+def test_prompt_carries_confirmed_text():
+    model = FakeModel([
+        [segment(" one two three", 0.0, 30.0, [word(" one", 0.0, 10.0), word(" two", 10.0, 28.5), word(" three", 28.5, 30.0)])],
+        [segment(" three four", 0.0, 20.0), segment(" five", 20.0, 30.0)],
+        [segment(" five six", 0.0, 10.0)],
+    ])
+    run_windows(model, 70.0, initial_prompt="hello")
+
+    # 推迟的词不进入提示词
+    assert [prompt for _, prompt in model.calls] == ["hello", "one two", "three four"]
+
+
+def test_prompt_only_for_first_window_without_conditioning():
+    model = FakeModel([
+        [segment(" first", 0.0, 30.0)],
+        [segment(" second", 0.0, 10.0)],
+    ])
+    run_windows(model, 40.0, initial_prompt="hello", condition_on_previous_text=False)
+
+    assert [prompt for _, prompt in model.calls] == ["hello", None]